@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AnswersConfig(AppConfig):
     name = 'answers'
+
+    def ready(self):
+        # Registers the signal receivers invalidating the search cache
+        from answers import search_cache  # noqa: F401
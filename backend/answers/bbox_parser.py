@@ -0,0 +1,90 @@
+"""
+Incremental parser for the XHTML written by `pdftotext -bbox-layout`.
+
+The document is read with `iterparse`, so only the page currently being parsed is held
+in memory, no matter how long the document is. This module does not depend on Django
+so it can be used by the benchmark in util/dummyPDF as well.
+"""
+from xml.etree.ElementTree import iterparse
+
+# Characters which are not allowed in XML 1.0 but may end up in the words of broken PDFs.
+# All of them are single bytes in UTF-8 and can't be part of a multibyte sequence.
+INVALID_XML_BYTES = bytes(
+    [c for c in range(0x20) if c not in (0x09, 0x0A, 0x0D)]
+)
+
+
+class Page:
+    """
+    A page of the document. `flows` is a list of flows, a flow a list of blocks, a
+    block a list of lines and a line a list of words. Words are tuples
+    `(content, x_min, y_min, x_max, y_max)` in absolute coordinates.
+    """
+
+    __slots__ = ("width", "height", "flows")
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.flows = []
+
+    def words(self):
+        for flow in self.flows:
+            for block in flow:
+                for line in block:
+                    yield from line
+
+
+class _SanitizedReader:
+    def __init__(self, file):
+        self.file = file
+
+    def read(self, size=-1):
+        return self.file.read(size).translate(None, INVALID_XML_BYTES)
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def iter_pages(file):
+    """
+    Yields the pages of the bbox document in the binary file object `file`.
+    Raises `xml.etree.ElementTree.ParseError` if the document is malformed.
+    """
+    page = None
+    parents = []
+    for event, elem in iterparse(_SanitizedReader(file), events=("start", "end")):
+        tag = _local_name(elem.tag)
+        if event == "start":
+            parents.append(elem)
+            if tag == "page":
+                page = Page(float(elem.get("width")), float(elem.get("height")))
+            elif page is None:
+                continue
+            elif tag == "flow":
+                page.flows.append([])
+            elif tag == "block":
+                page.flows[-1].append([])
+            elif tag == "line":
+                page.flows[-1][-1].append([])
+            continue
+
+        parents.pop()
+        if tag == "word" and page is not None:
+            page.flows[-1][-1][-1].append(
+                (
+                    elem.text or "",
+                    float(elem.get("xMin")),
+                    float(elem.get("yMin")),
+                    float(elem.get("xMax")),
+                    float(elem.get("yMax")),
+                )
+            )
+        elif tag == "page":
+            yield page
+            page = None
+            # Drops the parsed page from the tree
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
@@ -0,0 +1,143 @@
+"""
+Background extraction of the text of uploaded exam PDFs.
+
+Uploads only store the PDF in S3 and enqueue a PdfIngestionJob. The ingest_pdfs
+management command claims jobs with `SELECT ... FOR UPDATE SKIP LOCKED`, so multiple
+workers can run at the same time, downloads the PDF and runs `pdf_utils.analyze_pdf`.
+The progress is reported in `Exam.ingestion_status` and `Exam.ingestion_error`.
+"""
+import logging
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from answers import pdf_utils
+from answers.models import Exam, PdfIngestionJob
+from util import s3_util
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionError(Exception):
+    pass
+
+
+def enqueue(exam):
+    """
+    Schedules the analysis of the PDF of `exam`, replacing any pending job.
+    """
+    with transaction.atomic():
+        Exam.objects.filter(pk=exam.pk).update(
+            ingestion_status="pending", ingestion_error=""
+        )
+        PdfIngestionJob.objects.update_or_create(
+            exam=exam,
+            defaults={"attempts": 0, "run_after": timezone.now(), "claim": None},
+        )
+    exam.ingestion_status = "pending"
+    exam.ingestion_error = ""
+
+
+def claim_job():
+    """
+    Claims the next due job. The job is leased for COMSOL_INGESTION_LEASE seconds, after
+    which another worker may claim it again if it was not finished. Every claim gets a
+    new `claim` token, which `finish_job` checks.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            PdfIngestionJob.objects.select_for_update(skip_locked=True)
+            .select_related("exam")
+            .filter(run_after__lte=now)
+            .order_by("run_after", "id")
+            .first()
+        )
+        if job is None:
+            return None
+        job.attempts += 1
+        job.run_after = now + timedelta(seconds=settings.COMSOL_INGESTION_LEASE)
+        job.claim = uuid.uuid4()
+        job.save(update_fields=["attempts", "run_after", "claim"])
+        Exam.objects.filter(pk=job.exam_id).update(ingestion_status="running")
+    return job
+
+
+def finish_job(job, error=None):
+    """
+    Records the result of a claimed job. If the job was enqueued or claimed by another
+    worker in the meantime, the new job is kept and the result is dropped.
+    """
+    with transaction.atomic():
+        current = PdfIngestionJob.objects.select_for_update().filter(
+            pk=job.pk, claim=job.claim
+        )
+        if not current.exists():
+            return
+        if error is None:
+            status, error = "done", ""
+            current.delete()
+        elif job.attempts >= settings.COMSOL_INGESTION_MAX_ATTEMPTS:
+            status = "failed"
+            current.delete()
+        else:
+            status = "pending"
+            delay = settings.COMSOL_INGESTION_RETRY_DELAY * 2 ** (job.attempts - 1)
+            current.update(run_after=timezone.now() + timedelta(seconds=delay))
+        Exam.objects.filter(pk=job.exam_id).update(
+            ingestion_status=status, ingestion_error=error
+        )
+
+
+def download(exam, directory):
+    """
+    Downloads the PDF of `exam` into `directory` and returns its path.
+    """
+    path = os.path.join(directory, exam.filename)
+    if not s3_util.save_file(settings.COMSOL_EXAM_DIR, exam.filename, path):
+        raise IngestionError("Could not download the PDF")
+    return path
+
+
+def analyze(exam, path):
+    if not pdf_utils.analyze_pdf(exam, path):
+        raise IngestionError("Could not extract the text of the PDF")
+
+
+def ingest(exam):
+    with tempfile.TemporaryDirectory(dir=settings.COMSOL_UPLOAD_FOLDER) as tmpdirname:
+        analyze(exam, download(exam, tmpdirname))
+
+
+def process_job(job):
+    """
+    Runs a claimed job and records its result. Returns whether it succeeded.
+    """
+    try:
+        ingest(job.exam)
+    except Exception as e:
+        logger.exception("Ingestion of exam %s failed", job.exam.filename)
+        finish_job(job, error=str(e) or type(e).__name__)
+        return False
+    finish_job(job)
+    return True
+
+
+def process_jobs(limit=None):
+    """
+    Processes due jobs until there are none left or `limit` jobs were processed.
+    Returns the number of processed jobs.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job()
+        if job is None:
+            break
+        process_job(job)
+        processed += 1
+    return processed
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from answers import ingestion
+
+
+class Command(BaseCommand):
+    help = "Extracts the text of uploaded exam PDFs in the background"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process all due jobs and exit instead of waiting for new ones",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            processed = ingestion.process_jobs()
+            if processed:
+                self.stdout.write("Processed {} jobs".format(processed))
+            if options["once"]:
+                return
+            if not processed:
+                time.sleep(settings.COMSOL_INGESTION_POLL_INTERVAL)
@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from answers import ingestion, reanalysis
+from answers.models import Exam
+
+
+def run_inline(func, *args):
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+class Command(BaseCommand):
+    help = (
+        "Extracts the text and words of the selected exams again, e.g. after the PDF "
+        "analysis was changed. PDFs are downloaded concurrently and analyzed by a pool "
+        "of processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--exam",
+            action="append",
+            default=[],
+            metavar="FILENAME",
+            help="Only analyze this exam, can be given multiple times",
+        )
+        parser.add_argument(
+            "--category",
+            action="append",
+            default=[],
+            metavar="SLUG",
+            help="Only analyze exams of this category, can be given multiple times",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of analysis processes, 0 analyzes in this process",
+        )
+        parser.add_argument(
+            "--downloads",
+            type=int,
+            default=4,
+            help="Maximum number of concurrent downloads",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            metavar="FILE",
+            help=(
+                "File to which the analyzed exams are appended. Exams already listed "
+                "in it are skipped, so an interrupted run can be resumed."
+            ),
+        )
+
+    def get_exams(self, options):
+        exams = Exam.objects.order_by("id")
+        if options["exam"]:
+            exams = exams.filter(filename__in=options["exam"])
+        if options["category"]:
+            exams = exams.filter(category__slug__in=options["category"])
+        return list(exams.only("id", "filename"))
+
+    def read_checkpoint(self, path):
+        if path is None or not os.path.exists(path):
+            return set()
+        with open(path) as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def handle(self, *args, **options):
+        if options["processes"] < 0 or options["downloads"] < 1:
+            raise CommandError("Invalid number of processes or downloads")
+        exams = self.get_exams(options)
+        done = self.read_checkpoint(options["checkpoint"])
+        todo = [exam for exam in exams if exam.filename not in done]
+        self.stdout.write(
+            "Analyzing {} exams, {} already done".format(len(todo), len(exams) - len(todo))
+        )
+        if not todo:
+            return
+
+        checkpoint = open(options["checkpoint"], "a") if options["checkpoint"] else None
+        try:
+            failed = self.run(todo, options, checkpoint)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+        if failed:
+            raise CommandError("{} exams could not be analyzed".format(failed))
+
+    def run(self, exams, options, checkpoint):
+        processes = options["processes"]
+        # Downloaded PDFs wait on disk until a process is free, this bounds their number
+        window = options["downloads"] + processes
+        pool = None
+        if processes:
+            pool = ProcessPoolExecutor(
+                processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=reanalysis.init_worker,
+                initargs=(connection.settings_dict["NAME"],),
+            )
+
+        start = time.monotonic()
+        finished = failed = pages = 0
+        todo = iter(exams)
+        running = {}
+        with tempfile.TemporaryDirectory(
+            dir=settings.COMSOL_UPLOAD_FOLDER
+        ) as tmpdirname, ThreadPoolExecutor(options["downloads"]) as downloader:
+            try:
+                while True:
+                    while len(running) < window:
+                        exam = next(todo, None)
+                        if exam is None:
+                            break
+                        future = downloader.submit(ingestion.download, exam, tmpdirname)
+                        running[future] = (exam, None)
+                    if not running:
+                        break
+                    completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        exam, path = running.pop(future)
+                        error = future.exception()
+                        if path is None and error is None:
+                            # Downloaded, analyze it next
+                            path = future.result()
+                            if pool is None:
+                                future = run_inline(
+                                    reanalysis.analyze_exam, exam.id, path
+                                )
+                            else:
+                                future = pool.submit(
+                                    reanalysis.analyze_exam, exam.id, path
+                                )
+                            running[future] = (exam, path)
+                            continue
+
+                        if path is not None:
+                            os.remove(path)
+                        finished += 1
+                        if error is None:
+                            pages += future.result()
+                            if checkpoint is not None:
+                                checkpoint.write(exam.filename + "\n")
+                                checkpoint.flush()
+                        else:
+                            failed += 1
+                            self.stderr.write(
+                                "Failed {}: {}".format(
+                                    exam.filename, str(error) or type(error).__name__
+                                )
+                            )
+                        elapsed = time.monotonic() - start
+                        self.stdout.write(
+                            "[{}/{}] {} failed, {:.2f} exams/s, {:.1f} pages/s".format(
+                                finished,
+                                len(exams),
+                                failed,
+                                finished / elapsed,
+                                pages / elapsed,
+                            )
+                        )
+            finally:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+
+        self.stdout.write(
+            "Analyzed {} exams with {} pages in {:.1f}s, {} failed".format(
+                finished - failed, pages, time.monotonic() - start, failed
+            )
+        )
+        return failed
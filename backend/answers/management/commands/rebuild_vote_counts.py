@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+# (vote table, counter column on answers_answer)
+VOTE_TABLES = [
+    ("answers_answer_upvotes", "upvote_count"),
+    ("answers_answer_downvotes", "downvote_count"),
+    ("answers_answer_expertvotes", "expertvote_count"),
+    ("answers_answer_flagged", "flag_count"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the vote counters of all answers from the vote tables, "
+        "or only compares them with --check"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report answers whose counters differ from the vote tables",
+        )
+
+    def counts_query(self):
+        return """
+            SELECT aa.id, {counts}
+            FROM answers_answer aa
+            """.format(
+            counts=", ".join(
+                "(SELECT COUNT(*) FROM {table} v WHERE v.answer_id = aa.id) AS {column}".format(
+                    table=table, column=column
+                )
+                for table, column in VOTE_TABLES
+            )
+        )
+
+    def handle(self, *args, **options):
+        columns = [column for _, column in VOTE_TABLES]
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options["check"]:
+                cursor.execute(
+                    """
+                    SELECT aa.id, {table_cols}, {actual_cols}
+                    FROM answers_answer aa
+                    INNER JOIN ({counts}) c ON (c.id = aa.id)
+                    WHERE {differs}
+                    ORDER BY aa.id
+                    """.format(
+                        table_cols=", ".join("aa." + col for col in columns),
+                        actual_cols=", ".join("c." + col for col in columns),
+                        counts=self.counts_query(),
+                        differs=" OR ".join(
+                            "aa.{col} <> c.{col}".format(col=col) for col in columns
+                        ),
+                    )
+                )
+                mismatches = cursor.fetchall()
+                for row in mismatches:
+                    self.stdout.write(
+                        "Answer {}: stored {} != actual {}".format(
+                            row[0],
+                            dict(zip(columns, row[1 : len(columns) + 1])),
+                            dict(zip(columns, row[len(columns) + 1 :])),
+                        )
+                    )
+                if mismatches:
+                    raise CommandError(
+                        "{} answers have wrong vote counts".format(len(mismatches))
+                    )
+                self.stdout.write("Vote counts are consistent")
+                return
+
+            # Blocks new votes while we recompute the counters
+            cursor.execute(
+                "LOCK TABLE {} IN SHARE MODE".format(
+                    ", ".join(table for table, _ in VOTE_TABLES)
+                )
+            )
+            cursor.execute(
+                """
+                UPDATE answers_answer aa SET {assignments}
+                FROM ({counts}) c
+                WHERE c.id = aa.id AND ({differs})
+                """.format(
+                    assignments=", ".join(
+                        "{col} = c.{col}".format(col=col) for col in columns
+                    ),
+                    counts=self.counts_query(),
+                    differs=" OR ".join(
+                        "aa.{col} <> c.{col}".format(col=col) for col in columns
+                    ),
+                )
+            )
+            self.stdout.write("Fixed the vote counts of {} answers".format(cursor.rowcount))
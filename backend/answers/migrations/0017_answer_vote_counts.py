@@ -0,0 +1,83 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Stores the number of up-, down- and expertvotes and flags of every answer. The
+    counts are kept up to date by triggers on the vote tables, the trigger argument
+    is the counter column to update.
+    """
+
+    dependencies = [
+        ('answers', '0016_remove_exam_finished_wiki_transfer_and_more'),
+    ]
+
+    vote_tables = [
+        ("answers_answer_upvotes", "upvote_count"),
+        ("answers_answer_downvotes", "downvote_count"),
+        ("answers_answer_expertvotes", "expertvote_count"),
+        ("answers_answer_flagged", "flag_count"),
+    ]
+
+    populate = "".join(
+        """
+        UPDATE answers_answer aa SET {column} = sub.count
+        FROM (SELECT answer_id, COUNT(*) AS count FROM {table} GROUP BY answer_id) sub
+        WHERE sub.answer_id = aa.id;
+        """.format(table=table, column=column)
+        for table, column in vote_tables
+    )
+
+    triggers = """
+    CREATE FUNCTION answers_vote_count_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            EXECUTE format('UPDATE answers_answer SET %1$I = %1$I + 1 WHERE id = $1', TG_ARGV[0])
+            USING NEW.answer_id;
+        ELSE
+            EXECUTE format('UPDATE answers_answer SET %1$I = %1$I - 1 WHERE id = $1', TG_ARGV[0])
+            USING OLD.answer_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """ + "".join(
+        """
+        CREATE TRIGGER answers_vote_count_trigger
+        AFTER INSERT OR DELETE ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE answers_vote_count_trigger('{column}');
+        """.format(table=table, column=column)
+        for table, column in vote_tables
+    )
+
+    reverse_triggers = "".join(
+        "DROP TRIGGER IF EXISTS answers_vote_count_trigger ON {};".format(table)
+        for table, _ in vote_tables
+    ) + "DROP FUNCTION IF EXISTS answers_vote_count_trigger();"
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='downvote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='expertvote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='flag_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='upvote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(populate, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunSQL(triggers, reverse_sql=reverse_triggers),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('answers', '0017_answer_vote_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='ingestion_error',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='ingestion_status',
+            field=models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='done', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='PdfIngestionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('exam', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_job', to='answers.exam')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pdfingestionjob',
+            index=models.Index(fields=['run_after'], name='answers_pdf_run_aft_e4e6b0_idx'),
+        ),
+    ]
@@ -0,0 +1,169 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:13
+
+import struct
+import sys
+from array import array
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BATCH_SIZE = 100
+
+# A frozen copy of version 1 of answers/page_layout.py, so that this migration keeps
+# writing and reading the format it was written for when the module changes.
+LAYOUT_VERSION = 1
+LAYOUT_HEADER = struct.Struct("<BII")
+WORD_FIELDS = ("content", "x_min", "y_min", "x_max", "y_max")
+
+
+def pack(typecode, values):
+    arr = array(typecode, values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def unpack(typecode, data, offset, count):
+    arr = array(typecode)
+    end = offset + count * arr.itemsize
+    if end > len(data):
+        raise ValueError("Layout is truncated")
+    arr.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr, end
+
+
+def encode_layout(flows):
+    sizes = []
+    boxes = []
+    contents = []
+    for flow in flows:
+        sizes.append(len(flow))
+        for content, x_min, y_min, x_max, y_max in flow:
+            boxes += (x_min, y_min, x_max, y_max)
+            contents.append(content.encode("utf-8"))
+    return b"".join(
+        [
+            LAYOUT_HEADER.pack(LAYOUT_VERSION, len(sizes), len(contents)),
+            pack("I", sizes),
+            pack("f", boxes),
+            pack("I", map(len, contents)),
+            b"".join(contents),
+        ]
+    )
+
+
+def decode_layout(data):
+    """
+    Returns the flows of the layout, each being a list of words as dicts of the
+    ExamWord fields.
+    """
+    if not data:
+        return []
+    data = bytes(data)
+    if len(data) < LAYOUT_HEADER.size:
+        raise ValueError("Layout is truncated")
+    version, flow_count, word_count = LAYOUT_HEADER.unpack_from(data)
+    if version != LAYOUT_VERSION:
+        raise ValueError("Unknown layout version {}".format(version))
+    sizes, offset = unpack("I", data, LAYOUT_HEADER.size, flow_count)
+    boxes, offset = unpack("f", data, offset, 4 * word_count)
+    lengths, offset = unpack("I", data, offset, word_count)
+    if sum(sizes) != word_count or offset + sum(lengths) != len(data):
+        raise ValueError("Layout is inconsistent")
+
+    flows = []
+    word = 0
+    for size in sizes:
+        flow = []
+        for _ in range(size):
+            end = offset + lengths[word]
+            content = data[offset:end].decode("utf-8")
+            flow.append(
+                dict(zip(WORD_FIELDS, (content, *boxes[4 * word : 4 * word + 4])))
+            )
+            offset = end
+            word += 1
+        flows.append(flow)
+    return flows
+
+
+def page_batches(ExamPage):
+    page_ids = list(ExamPage.objects.order_by("id").values_list("id", flat=True))
+    for i in range(0, len(page_ids), BATCH_SIZE):
+        yield page_ids[i : i + BATCH_SIZE]
+
+
+def pack_words(apps, schema_editor):
+    ExamPage = apps.get_model("answers", "ExamPage")
+    ExamPageFlow = apps.get_model("answers", "ExamPageFlow")
+    ExamWord = apps.get_model("answers", "ExamWord")
+    for page_ids in page_batches(ExamPage):
+        words = defaultdict(list)
+        for flow_id, *word in (
+            ExamWord.objects.filter(flow__page_id__in=page_ids)
+            .order_by("flow_id", "order", "id")
+            .values_list("flow_id", "content", "x_min", "y_min", "x_max", "y_max")
+        ):
+            words[flow_id].append(word)
+        flows = defaultdict(list)
+        for flow_id, page_id in (
+            ExamPageFlow.objects.filter(page_id__in=page_ids)
+            .order_by("page_id", "order", "id")
+            .values_list("id", "page_id")
+        ):
+            flows[page_id].append(words[flow_id])
+        ExamPage.objects.bulk_update(
+            [
+                ExamPage(id=page_id, layout=encode_layout(flows[page_id]))
+                for page_id in page_ids
+            ],
+            ["layout"],
+        )
+
+
+def unpack_words(apps, schema_editor):
+    ExamPage = apps.get_model("answers", "ExamPage")
+    ExamPageFlow = apps.get_model("answers", "ExamPageFlow")
+    ExamWord = apps.get_model("answers", "ExamWord")
+    for page_ids in page_batches(ExamPage):
+        page_flows = []
+        flow_words = []
+        for page_id, layout in ExamPage.objects.filter(id__in=page_ids).values_list(
+            "id", "layout"
+        ):
+            for order, flow in enumerate(decode_layout(layout)):
+                page_flows.append(ExamPageFlow(page_id=page_id, order=order))
+                flow_words.append(flow)
+        ExamPageFlow.objects.bulk_create(page_flows)
+        ExamWord.objects.bulk_create(
+            [
+                ExamWord(flow_id=page_flow.id, order=order, **word)
+                for page_flow, flow in zip(page_flows, flow_words)
+                for order, word in enumerate(flow)
+            ],
+            batch_size=5000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('answers', '0018_pdf_ingestion_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exampage',
+            name='layout',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(pack_words, unpack_words),
+        migrations.DeleteModel(
+            name='ExamWord',
+        ),
+        migrations.DeleteModel(
+            name='ExamPageFlow',
+        ),
+    ]
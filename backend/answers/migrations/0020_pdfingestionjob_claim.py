@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('answers', '0019_exampage_layout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfingestionjob',
+            name='claim',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
@@ -5,10 +5,10 @@ from django.db.models import Exists, OuterRef
 from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
 from util.models import CommentMixin
+from answers import page_layout
+from util import ids
 from django_prometheus.models import ExportModelOperationsMixin
 
-import random
-
 
 class Exam(ExportModelOperationsMixin('exam'), models.Model):
     filename = models.CharField(max_length=256, unique=True)
@@ -38,6 +38,14 @@ class Exam(ExportModelOperationsMixin('exam'), models.Model):
         'auth.User', related_name='oral_transcript_set', null=True, on_delete=models.SET_NULL)
     oral_transcript_checked = models.BooleanField(default=False)
 
+    # State of the text extraction of the uploaded PDF, see answers/ingestion.py
+    ingestion_status = models.CharField(
+        max_length=16,
+        choices=[(x, x) for x in ["pending", "running", "done", "failed"]],
+        default="done",
+    )
+    ingestion_error = models.TextField(default="")
+
     search_vector = SearchVectorField()
 
     class Meta:
@@ -49,7 +57,7 @@ class Exam(ExportModelOperationsMixin('exam'), models.Model):
             return True
         if not self.public:
             return False
-        if self.needs_payment and not request.user.has_payed():
+        if self.needs_payment and not auth_check.has_payed(request):
             return False
         if (
             self.oral_transcript_uploader is not None
@@ -75,6 +83,23 @@ class Exam(ExportModelOperationsMixin('exam'), models.Model):
         ).count()
 
 
+class PdfIngestionJob(models.Model):
+    """
+    A pending text extraction of the PDF of an exam, processed by the ingest_pdfs worker.
+    """
+
+    exam = models.OneToOneField(
+        'Exam', on_delete=models.CASCADE, related_name='ingestion_job')
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    time = models.DateTimeField(default=timezone.now)
+    # Set to a new value whenever a worker claims the job, only that worker may finish it
+    claim = models.UUIDField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["run_after"])]
+
+
 class ExamPage(models.Model):
     exam = models.ForeignKey(
         'Exam', on_delete=models.CASCADE, related_name='pages')
@@ -82,28 +107,19 @@ class ExamPage(models.Model):
     width = models.FloatField()
     height = models.FloatField()
     text = models.TextField()
+    # The flows and words of the page, see answers/page_layout.py
+    layout = models.BinaryField(default=b'')
 
     search_vector = SearchVectorField()
 
     class Meta:
         indexes = [GinIndex(fields=["search_vector"])]
 
-
-class ExamPageFlow(models.Model):
-    page = models.ForeignKey(
-        'ExamPage', on_delete=models.CASCADE, related_name='flows')
-    order = models.IntegerField(default=0)
-
-
-class ExamWord(models.Model):
-    flow = models.ForeignKey(
-        'ExamPageFlow', on_delete=models.CASCADE, related_name='words')
-    order = models.IntegerField(default=0)
-    content = models.TextField()
-    x_min = models.FloatField()
-    y_min = models.FloatField()
-    x_max = models.FloatField()
-    y_max = models.FloatField()
+    def get_flows(self):
+        """
+        Returns the flows of the page, each being a list of `page_layout.Word`.
+        """
+        return page_layout.decode(self.layout)
 
 
 class ExamType(models.Model):
@@ -124,13 +140,10 @@ class AnswerSection(models.Model):
 
 
 def generate_long_id():
-    chars = "abcdefghijklmnopqrstuvwxyz0123456789"
-    res = ""
-    while len(res) < 16:
-        res += random.choice(chars)
-    if Answer.objects.filter(long_id=res).exists():
-        return generate_long_id()
-    return res
+    return ids.random_id(16)
+
+
+VOTE_COUNT_FIELDS = ("upvote_count", "downvote_count", "expertvote_count", "flag_count")
 
 
 class Answer(ExportModelOperationsMixin('answer'), models.Model):
@@ -152,12 +165,51 @@ class Answer(ExportModelOperationsMixin('answer'), models.Model):
     long_id = models.CharField(
         max_length=256, default=generate_long_id, unique=True)
 
+    # Number of entries in the vote tables above, kept up to date by database
+    # triggers. See answers/migrations/0017_answer_vote_counts.py.
+    upvote_count = models.IntegerField(default=0)
+    downvote_count = models.IntegerField(default=0)
+    expertvote_count = models.IntegerField(default=0)
+    flag_count = models.IntegerField(default=0)
+
     search_vector = SearchVectorField()
 
     class Meta:
         indexes = [GinIndex(fields=["search_vector"])]
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            # The vote counts of this instance may be outdated, saving them would undo
+            # the updates of the triggers since it was loaded
+            if kwargs.get("update_fields") is None:
+                deferred = self.get_deferred_fields()
+                kwargs["update_fields"] = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.name not in VOTE_COUNT_FIELDS
+                    and field.attname not in deferred
+                ]
+            return super().save(*args, **kwargs)
+        ids.save_with_unique_id(
+            self,
+            "long_id",
+            generate_long_id,
+            lambda: super(Answer, self).save(*args, **kwargs),
+        )
+
+
 class Comment(ExportModelOperationsMixin('comment'), CommentMixin):
     answer = models.ForeignKey('Answer', on_delete=models.CASCADE, related_name="comments")
     long_id = models.CharField(
         max_length=256, default=generate_long_id, unique=True)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        ids.save_with_unique_id(
+            self,
+            "long_id",
+            generate_long_id,
+            lambda: super(Comment, self).save(*args, **kwargs),
+        )
@@ -0,0 +1,106 @@
+"""
+Compact binary representation of the words of an exam page, stored in
+`ExamPage.layout`.
+
+A page consists of flows, which are lists of words in reading order. Words are
+`Word(content, x_min, y_min, x_max, y_max)` with coordinates relative to the page size.
+The layout is encoded as (all integers and floats little endian):
+
+    header      version (uint8), number of flows (uint32), number of words (uint32)
+    flows       number of words of each flow (uint32 each)
+    boxes       x_min, y_min, x_max, y_max of each word (float32 each)
+    lengths     length of the UTF-8 encoded content of each word (uint32 each)
+    strings     UTF-8 encoded contents of all words
+
+This module does not depend on Django so it can be used by the benchmark in
+util/dummyPDF as well.
+"""
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+VERSION = 1
+HEADER = struct.Struct("<BII")
+
+Word = namedtuple("Word", ["content", "x_min", "y_min", "x_max", "y_max"])
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def _pack(typecode, values):
+    arr = array(typecode, values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _unpack(typecode, data, offset, count):
+    arr = array(typecode)
+    end = offset + count * arr.itemsize
+    if end > len(data):
+        raise LayoutError("Layout is truncated")
+    arr.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr, end
+
+
+def encode(flows):
+    """
+    Encodes `flows`, a list of flows each being a list of words
+    `(content, x_min, y_min, x_max, y_max)`.
+    """
+    sizes = []
+    boxes = []
+    contents = []
+    for flow in flows:
+        sizes.append(len(flow))
+        for content, x_min, y_min, x_max, y_max in flow:
+            boxes += (x_min, y_min, x_max, y_max)
+            contents.append(content.encode("utf-8"))
+    return b"".join(
+        [
+            HEADER.pack(VERSION, len(sizes), len(contents)),
+            _pack("I", sizes),
+            _pack("f", boxes),
+            _pack("I", map(len, contents)),
+            b"".join(contents),
+        ]
+    )
+
+
+def decode(data):
+    """
+    Decodes a layout into a list of flows, each being a list of `Word`. An empty
+    layout decodes to a page without flows.
+    """
+    if not data:
+        return []
+    data = bytes(data)
+    if len(data) < HEADER.size:
+        raise LayoutError("Layout is truncated")
+    version, flow_count, word_count = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise LayoutError("Unknown layout version {}".format(version))
+    sizes, offset = _unpack("I", data, HEADER.size, flow_count)
+    boxes, offset = _unpack("f", data, offset, 4 * word_count)
+    lengths, offset = _unpack("I", data, offset, word_count)
+    if sum(sizes) != word_count or offset + sum(lengths) != len(data):
+        raise LayoutError("Layout is inconsistent")
+
+    flows = []
+    word = 0
+    for size in sizes:
+        flow = []
+        for _ in range(size):
+            end = offset + lengths[word]
+            flow.append(
+                Word(data[offset:end].decode("utf-8"), *boxes[4 * word : 4 * word + 4])
+            )
+            offset = end
+            word += 1
+        flows.append(flow)
+    return flows
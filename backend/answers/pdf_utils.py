@@ -1,53 +1,93 @@
 import subprocess
 import os
 import tempfile
-from bs4 import BeautifulSoup
+from xml.etree.ElementTree import ParseError
+from django.db import connection, transaction
 from backend import settings
-from answers.models import (
-    ExamPage as ExamPageModel,
-    ExamPageFlow as ExamPageFlowModel,
-    ExamWord as ExamWordModel,
-)
+from answers import bbox_parser, page_layout, search_cache
+from answers.models import ExamPage as ExamPageModel
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Pages are built and inserted in batches of this size, which bounds the memory used
+INSERT_BATCH_SIZE = 100
 
-def get_page_text(path_to_pdf, page, tmpdirname):
-    text_path = os.path.join(tmpdirname, "temp.txt")
-    DEVNULL = open(os.devnull, "w")
-    return_code = subprocess.call(
+
+def get_page_text(page):
+    """
+    Builds the text of a page from its words. Lines are separated by newlines and
+    blocks by empty lines, like the plain text output of pdftotext.
+    """
+    return "\n\n".join(
+        "\n".join(" ".join(word[0] for word in line) for line in block)
+        for flow in page.flows
+        for block in flow
+    )
+
+
+def delete_pages(exam, ExamPage=ExamPageModel):
+    """
+    Deletes the pages of `exam` in a single statement, without loading them first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {page} WHERE exam_id = %s".format(page=ExamPage._meta.db_table),
+            [exam.pk],
+        )
+
+
+def get_page_layout(page):
+    """
+    Encodes the words of `page`, a `bbox_parser.Page`, with coordinates relative to the
+    page size.
+    """
+    w = page.width
+    h = page.height
+    return page_layout.encode(
         [
-            "pdftotext",
-            "-f",
-            str(page),
-            "-l",
-            str(page),
-            u"{pdf_path}".format(pdf_path=path_to_pdf),
-            u"{text_path}".format(text_path=text_path),
-        ],
-        stdout=DEVNULL,
-        stderr=subprocess.STDOUT,
-        close_fds=True,
+            [
+                (content, x_min / w, y_min / h, x_max / w, y_max / h)
+                for block in flow
+                for line in block
+                for content, x_min, y_min, x_max, y_max in line
+            ]
+            for flow in page.flows
+        ]
     )
-    if return_code:
-        logger.warning(
-            "Failed reading PDF text: {path_to_pdf} page {page}".format(
-                path_to_pdf=path_to_pdf, page=page
+
+
+def save_pages(exam, pages, ExamPage=ExamPageModel):
+    """
+    Replaces the pages of `exam` with `pages`, an iterable of `bbox_parser.Page`.
+    The pages are consumed and inserted in batches of INSERT_BATCH_SIZE within one
+    transaction, so only one batch is in memory at a time. If iterating `pages` fails,
+    the transaction is rolled back and the old pages are kept. As this sends no
+    signals, the search cache is invalidated explicitly.
+    """
+    with transaction.atomic():
+        delete_pages(exam, ExamPage)
+        batch = []
+        for page_number, page in enumerate(pages, start=1):
+            batch.append(
+                ExamPage(
+                    exam=exam,
+                    page_number=page_number,
+                    width=page.width,
+                    height=page.height,
+                    text=get_page_text(page),
+                    layout=get_page_layout(page),
+                )
             )
-        )
-        return ""
-    with open(text_path, "r") as file:
-        return file.read()
+            if len(batch) == INSERT_BATCH_SIZE:
+                ExamPage.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            ExamPage.objects.bulk_create(batch)
+        search_cache.bump()
 
 
-def analyze_pdf(
-    exam,
-    path_to_pdf,
-    ExamPage=ExamPageModel,
-    ExamPageFlow=ExamPageFlowModel,
-    ExamWord=ExamWordModel,
-):
+def analyze_pdf(exam, path_to_pdf, ExamPage=ExamPageModel):
     base_path = settings.COMSOL_UPLOAD_FOLDER
     with tempfile.TemporaryDirectory(dir=base_path) as tmpdirname:
         html_path = os.path.join(tmpdirname, "temp.html")
@@ -66,46 +106,14 @@ def analyze_pdf(
         )
         if return_code:
             return False
-        textdoc = BeautifulSoup(open(html_path), "html.parser")
-        pages = []
-        page_number = 1
-        ExamPage.objects.filter(exam=exam).delete()
-        exam_word_objects = []
-        for page in textdoc.find_all("page"):
-            w = float(page["width"])
-            h = float(page["height"])
-            page_text = get_page_text(path_to_pdf, page_number, tmpdirname)
-            exam_page = ExamPage(
-                exam=exam, page_number=page_number, width=w, height=h, text=page_text
-            )
-            exam_page.save()
-            flow_order = 0
-            for flow in page.find_all("flow"):
-                page_flow = ExamPageFlow(page=exam_page, order=flow_order)
-                page_flow.save()
-                flow_order += 1
-
-                word_order = 0
-                for block in flow.find_all("block"):
-                    for line in block.find_all("line"):
-                        for word in line.find_all("word"):
-                            # Convert to relative coordinates
-                            x_min = float(word["xmin"]) / w
-                            y_min = float(word["ymin"]) / h
-                            x_max = float(word["xmax"]) / w
-                            y_max = float(word["ymax"]) / h
-                            exam_word = ExamWord(
-                                flow=page_flow,
-                                order=word_order,
-                                content=word.string,
-                                x_min=x_min,
-                                y_min=y_min,
-                                x_max=x_max,
-                                y_max=y_max,
-                            )
-                            exam_word_objects.append(exam_word)
-                            word_order += 1
-            pages.append((page_number, page_text))
-            page_number += 1
-        ExamWord.objects.bulk_create(exam_word_objects)
+        with open(html_path, "rb") as html_file:
+            try:
+                save_pages(exam, bbox_parser.iter_pages(html_file), ExamPage)
+            except ParseError:
+                logger.warning(
+                    "Failed parsing the bbox layout of {path_to_pdf}".format(
+                        path_to_pdf=path_to_pdf
+                    )
+                )
+                return False
         return True
@@ -0,0 +1,42 @@
+"""
+Worker functions of the reanalyze_exams management command.
+
+The workers are started with the spawn method, so that they don't inherit the database
+connections and the download threads of the command. This module is imported by them
+before Django is set up, which is why the Django modules are only imported once the
+worker is initialized.
+"""
+import django
+
+
+def init_worker(database_name):
+    django.setup()
+    from django.conf import settings
+
+    # Use the same database as the command, e.g. the test database
+    settings.DATABASES["default"]["NAME"] = database_name
+
+
+def analyze_exam(exam_id, path):
+    """
+    Analyzes the downloaded PDF of an exam and returns the number of pages found. The
+    ingestion status of the exam is updated in the same transaction as its pages.
+    """
+    from django.db import transaction
+
+    from answers import ingestion
+    from answers.models import Exam, ExamPage
+
+    exam = Exam.objects.get(pk=exam_id)
+    try:
+        with transaction.atomic():
+            ingestion.analyze(exam, path)
+            Exam.objects.filter(pk=exam_id).update(
+                ingestion_status="done", ingestion_error=""
+            )
+    except Exception as e:
+        Exam.objects.filter(pk=exam_id).update(
+            ingestion_status="failed", ingestion_error=str(e) or type(e).__name__
+        )
+        raise
+    return ExamPage.objects.filter(exam=exam).count()
@@ -0,0 +1,90 @@
+"""
+Caches the results of `views_search.search`. Popular terms are searched over and over
+again, so the merged results are kept in a size bounded LRU cache for
+COMSOL_SEARCH_CACHE_VALIDITY seconds.
+
+The results a user gets only depend on the term, the search options and on what the user
+is allowed to view: whether they have payed, whether they are an admin and the categories
+they are an admin of. These make up the cache key, together with a generation counter
+kept in the shared cache `COMSOL_FUNC_CACHE_BACKEND`. Whenever an exam, exam page, answer
+or comment is saved or deleted the generation is bumped once the transaction commits, as
+its search vector may have changed. This invalidates the cached results of all workers,
+including those stored before the commit. Pages are replaced with raw SQL and
+`bulk_create`, which send no signals, so `pdf_utils.save_pages` bumps the generation
+explicitly. This also covers the ingest_pdfs and reanalyze_exams processes.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from prometheus_client import Counter
+
+from answers.models import Answer, Comment, Exam, ExamPage
+from util.func_cache import LRUCache, bump_generation, get_generation
+
+GENERATION_KEY = "search_cache_generation"
+search_cache = LRUCache(
+    settings.COMSOL_SEARCH_CACHE_SIZE, settings.COMSOL_SEARCH_CACHE_VALIDITY
+)
+search_cache_hits = Counter(
+    "comsol_search_cache_hits", "Number of searches answered from the search cache"
+)
+search_cache_misses = Counter(
+    "comsol_search_cache_misses", "Number of searches not found in the search cache"
+)
+
+
+def normalize_term(term):
+    """
+    Full text search queries are case insensitive and ignore whitespace, so terms
+    which only differ in those share a cache entry.
+    """
+    return " ".join(term.lower().split())
+
+
+def bump():
+    """
+    Invalidates the cached results of all processes once the current transaction
+    commits, or immediately if there is none.
+    """
+    transaction.on_commit(lambda: bump_generation(GENERATION_KEY))
+
+
+def get_key(term, options, has_payed, is_admin, user_admin_categories):
+    return (
+        get_generation(GENERATION_KEY),
+        normalize_term(term),
+        options,
+        has_payed,
+        is_admin,
+        frozenset(user_admin_categories),
+    )
+
+
+def get(key):
+    if settings.TESTING:
+        return None
+    res = search_cache.get(key)
+    if res is None:
+        search_cache_misses.inc()
+    else:
+        search_cache_hits.inc()
+    return res
+
+
+def put(key, res):
+    if settings.TESTING:
+        return
+    search_cache.set(key, res)
+
+
+@receiver(post_save, sender=Exam)
+@receiver(post_save, sender=ExamPage)
+@receiver(post_save, sender=Answer)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Exam)
+@receiver(post_delete, sender=ExamPage)
+@receiver(post_delete, sender=Answer)
+@receiver(post_delete, sender=Comment)
+def invalidate(**kwargs):
+    bump()
@@ -1,23 +1,25 @@
 from myauth.models import get_my_user
 from myauth import auth_check
-from answers.models import Comment, Answer
-from django.db.models import Count, F, Exists, OuterRef, Manager, Prefetch
+from answers.models import AnswerSection, Comment, Answer
+from django.db.models import F, IntegerField, Manager, Prefetch, Value
+
+# The vote tables of an answer and the attribute telling whether the current user is in it
+USER_VOTE_FIELDS = [
+    (Answer.upvotes, "is_upvoted"),
+    (Answer.downvotes, "is_downvoted"),
+    (Answer.expertvotes, "is_expertvoted"),
+    (Answer.flagged, "is_flagged"),
+]
+
 
 def prepare_answer_objects(objects: Manager[Answer], request) -> Manager[Answer]:
     # Important optimization. Prevents amount of queries from
     # increasing quadratically ((N+1 problem)^2) and instead
     # results in a constant amount of queries.
+    # The vote counts are stored on the answer, so no joins on the vote tables are needed.
     comments_query = Comment.objects.select_related("author").order_by("time", "id")
     return objects.annotate(
-        expert_count=Count("expertvotes", distinct=True),
-        downvotes_count=Count("downvotes", distinct=True),
-        upvotes_count=Count("upvotes", distinct=True),
-        flagged_count=Count("flagged", distinct=True),
-        is_upvoted=Exists(Answer.objects.filter(id=OuterRef("id"), upvotes=request.user)),
-        is_downvoted=Exists(Answer.objects.filter(id=OuterRef("id"), downvotes=request.user)),
-        is_expertvoted=Exists(Answer.objects.filter(id=OuterRef("id"), expertvotes=request.user)),
-        is_flagged=Exists(Answer.objects.filter(id=OuterRef("id"), flagged=request.user)),
-        delta_votes=F("upvotes_count") - F("downvotes_count"),
+        delta_votes=F("upvote_count") - F("downvote_count"),
     ).prefetch_related(
         Prefetch(
             "comments",
@@ -26,14 +28,38 @@ def prepare_answer_objects(objects: Manager[Answer], request) -> Manager[Answer]
         )
     ).select_related("author")
 
-def get_answer_response(request, answer: Answer, ignore_exam_admin=False):
+
+def add_user_votes(request, answers):
+    """
+    Sets `is_upvoted`, `is_downvoted`, `is_expertvoted` and `is_flagged` for the current
+    user on all given answers using a single query.
+    """
+    answers = list(answers)
+    queries = [
+        field.through.objects.filter(
+            user=request.user, answer_id__in=[answer.id for answer in answers]
+        )
+        .annotate(kind=Value(i, output_field=IntegerField()))
+        .values_list("answer_id", "kind")
+        for i, (field, _) in enumerate(USER_VOTE_FIELDS)
+    ]
+    votes = set(queries[0].union(*queries[1:], all=True)) if answers else set()
+    for answer in answers:
+        for i, (_, attr) in enumerate(USER_VOTE_FIELDS):
+            setattr(answer, attr, (answer.id, i) in votes)
+    return answers
+
+
+def get_answer_response(request, answer: Answer, ignore_exam_admin=False, exam_admin=None):
     """
-    Call `prepare_answer_objects` on the answer objects beforehand to annotate
-    them with the required aggregations. This function will fail otherwise.
+    Call `prepare_answer_objects` on the answer objects and `add_user_votes` on the
+    answers beforehand to annotate them with the required values. This function will
+    fail otherwise.
+    `exam_admin` can be passed if the admin rights for the exam are already known.
     """
     if ignore_exam_admin:
         exam_admin = False
-    else:
+    elif exam_admin is None:
         exam_admin = auth_check.has_admin_rights_for_exam(request, answer.answer_section.exam)
     
     try:
@@ -54,7 +80,7 @@ def get_answer_response(request, answer: Answer, ignore_exam_admin=False):
             'oid': answer.id,
             'longId': answer.long_id,
             'upvotes': answer.delta_votes,
-            'expertvotes': answer.expert_count,
+            'expertvotes': answer.expertvote_count,
             'authorId': '' if answer.is_legacy_answer else answer.author.username,
             'authorDisplayName': 'Old VISki Solution' if answer.is_legacy_answer else get_my_user(answer.author).displayname(),
             'canEdit': answer.author == request.user or (answer.is_legacy_answer and exam_admin),
@@ -62,7 +88,7 @@ def get_answer_response(request, answer: Answer, ignore_exam_admin=False):
             'isDownvoted': answer.is_downvoted,
             'isExpertVoted': answer.is_expertvoted,
             'isFlagged': answer.is_flagged,
-            'flagged': answer.flagged_count,
+            'flagged': answer.flag_count,
             'comments': comments,
             'text': answer.text,
             'time': answer.time,
@@ -72,7 +98,7 @@ def get_answer_response(request, answer: Answer, ignore_exam_admin=False):
             'isLegacyAnswer': answer.is_legacy_answer,
         }
     except AttributeError:
-        raise ValueError("The given answer has not been prepared with 'prepare_answer_objects'")
+        raise ValueError("The given answer has not been prepared with 'prepare_answer_objects' and 'add_user_votes'")
 
 
 def get_comment_response(request, comment: Comment):
@@ -92,26 +118,103 @@ def get_comment_response(request, comment: Comment):
     }
 
 
-def get_answersection_response(request, section):
-    prepared_query = prepare_answer_objects(section.answer_set, request)
-
+def build_answersection_response(request, section, prepared_answers, exam_admin):
     answers = [
-        get_answer_response(request, answer)
+        get_answer_response(request, answer, exam_admin=exam_admin)
         for answer in sorted(
-            prepared_query,
-            key=lambda x: (-x.expert_count, -x.delta_votes, x.time)
+            prepared_answers,
+            key=lambda x: (-x.expertvote_count, -x.delta_votes, x.time)
         )
     ]
     return {
         'oid': section.id,
         'answers': answers,
-        'allow_new_answer': not prepared_query.filter(author=request.user, is_legacy_answer=False).exists(),
-        'allow_new_legacy_answer': not prepared_query.filter(is_legacy_answer=True).exists(),
+        'allow_new_answer': not any(
+            answer.author_id == request.user.id and not answer.is_legacy_answer
+            for answer in prepared_answers
+        ),
+        'allow_new_legacy_answer': not any(answer.is_legacy_answer for answer in prepared_answers),
         'cutVersion': section.cut_version,
         'has_answers': section.has_answers,
     }
 
 
+def get_answersection_response(request, section):
+    prepared_answers = add_user_votes(
+        request, prepare_answer_objects(section.answer_set, request)
+    )
+    exam_admin = auth_check.has_admin_rights_for_exam(request, section.exam)
+    return build_answersection_response(request, section, prepared_answers, exam_admin)
+
+
+def get_answersections_response(request, exam, sections):
+    """
+    Returns the responses of `get_answersection_response` for all given sections of
+    `exam`. The number of queries does not depend on the number of sections.
+    """
+    sections = list(sections)
+    answers_by_section = {section.id: [] for section in sections}
+    if sections:
+        answers = add_user_votes(
+            request,
+            prepare_answer_objects(
+                Answer.objects.filter(answer_section__in=sections), request
+            ),
+        )
+        for answer in answers:
+            answers_by_section[answer.answer_section_id].append(answer)
+    exam_admin = auth_check.has_admin_rights_for_exam(request, exam)
+    res = []
+    for section in sections:
+        section.exam = exam
+        for answer in answers_by_section[section.id]:
+            answer.answer_section = section
+        res.append(
+            build_answersection_response(
+                request, section, answers_by_section[section.id], exam_admin
+            )
+        )
+    return res
+
+
+def use_delta_response(request):
+    """
+    Mutations of answers and comments return the whole answer section by default.
+    Clients can pass `response=delta` to only get the changed answer instead.
+    """
+    return request.POST.get('response') == 'delta'
+
+
+def get_answer_delta_response(request, section, answer_id):
+    """
+    Returns the new cut version of the section and the response of the answer with
+    `answer_id`. `answer` is None if the answer no longer exists.
+    """
+    answer = None
+    if answer_id is not None:
+        answers = add_user_votes(
+            request,
+            prepare_answer_objects(
+                Answer.objects.filter(pk=answer_id).select_related('answer_section__exam'),
+                request,
+            ),
+        )
+        if answers:
+            answer = get_answer_response(request, answers[0])
+    return {
+        'oid': section.id,
+        'cutVersion': section.cut_version,
+        'answerId': answer_id,
+        'answer': answer,
+    }
+
+
+def get_mutation_response(request, section, answer_id):
+    if use_delta_response(request):
+        return get_answer_delta_response(request, section, answer_id)
+    return get_answersection_response(request, section)
+
+
 def get_answer_fields_to_preselect():
     return [
         'author',
@@ -147,5 +250,6 @@ def get_comment_fields_to_prefetch():
 
 
 def increase_section_version(section):
-    section.cut_version += 1
-    section.save()
+    # Updated in the database so that concurrent changes do not get lost
+    AnswerSection.objects.filter(pk=section.pk).update(cut_version=F('cut_version') + 1)
+    section.refresh_from_db(fields=['cut_version'])
@@ -1,5 +1,12 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from testing.tests import ComsolTestExamData
 from answers.models import Answer, AnswerSection
+from myauth.models import MyUser
 
 
 class TestExistingAnswer(ComsolTestExamData):
@@ -48,6 +55,56 @@ class TestExistingAnswer(ComsolTestExamData):
         self.assertEqual(answer.upvotes.count(), 0)
         self.assertEqual(answer.downvotes.count(), 0)
 
+    def test_vote_counts(self):
+        answer = self.answers[1]
+        res = self.post("/api/exam/setlike/{}/".format(answer.id), {"like": -1})["value"]
+        res = next(a for a in res["answers"] if a["oid"] == answer.id)
+        self.assertEqual(res["upvotes"], -1)
+        self.assertTrue(res["isDownvoted"])
+        self.assertFalse(res["isUpvoted"])
+        answer.refresh_from_db()
+        self.assertEqual((answer.upvote_count, answer.downvote_count), (0, 1))
+
+        self.post("/api/exam/setflagged/{}/".format(answer.id), {"flagged": True})
+        answer.refresh_from_db()
+        self.assertEqual(answer.flag_count, 1)
+        self.post("/api/exam/resetflagged/{}/".format(answer.id), {})
+        answer.refresh_from_db()
+        self.assertEqual(answer.flag_count, 0)
+
+        Answer.objects.filter(pk=answer.pk).update(upvote_count=5)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_vote_counts", "--check", stdout=StringIO())
+        call_command("rebuild_vote_counts", stdout=StringIO())
+        call_command("rebuild_vote_counts", "--check", stdout=StringIO())
+        answer.refresh_from_db()
+        self.assertEqual((answer.upvote_count, answer.downvote_count), (0, 1))
+
+    def test_save_keeps_vote_counts(self):
+        answer = Answer.objects.get(pk=self.answers[1].pk)
+        self.post("/api/exam/setlike/{}/".format(answer.id), {"like": 1})
+        answer.text = "Edited"
+        answer.save()
+        answer.refresh_from_db()
+        self.assertEqual(answer.text, "Edited")
+        self.assertEqual(answer.upvote_count, 1)
+
+    def test_section_queries(self):
+        section = self.sections[0]
+        url = "/api/exam/answersection/{}/".format(section.id)
+        with CaptureQueriesContext(connection) as before:
+            self.get(url)
+        for i in range(10):
+            user = MyUser.objects.create(username="voter{}".format(i))
+            for answer in section.answer_set.all():
+                answer.upvotes.add(user)
+                answer.flagged.add(user)
+        with CaptureQueriesContext(connection) as after:
+            res = self.get(url)["value"]
+        self.assertEqual(len(before), len(after))
+        self.assertTrue(all(answer["upvotes"] >= 10 for answer in res["answers"]))
+        self.assertTrue(all(answer["flagged"] == 10 for answer in res["answers"]))
+
     def test_flag(self):
         answer = self.answers[1]
         self.assertEqual(answer.flagged.count(), 0)
@@ -139,3 +196,57 @@ class TestNonexisting(ComsolTestExamData):
                 answer_section=self.mysection, author=self.get_my_user()
             ).exists()
         )
+
+
+class TestDeltaResponse(ComsolTestExamData):
+
+    add_comments = False
+
+    def test_like(self):
+        answer = self.answers[1]
+        section = answer.answer_section
+        res = self.post("/api/exam/setlike/{}/".format(answer.id), {"like": 1, "response": "delta"})["value"]
+        section.refresh_from_db()
+        self.assertEqual(res["oid"], section.id)
+        self.assertEqual(res["cutVersion"], section.cut_version)
+        self.assertEqual(res["answer"]["oid"], answer.id)
+        self.assertEqual(res["answer"]["upvotes"], 1)
+        self.assertTrue(res["answer"]["isUpvoted"])
+        res = self.post("/api/exam/setlike/{}/".format(answer.id), {"like": -1, "response": "delta"})["value"]
+        self.assertEqual(res["answer"]["upvotes"], -1)
+        self.assertTrue(res["answer"]["isDownvoted"])
+        self.assertFalse(res["answer"]["isUpvoted"])
+
+    def test_vote_queries(self):
+        answer = self.answers[1]
+        with CaptureQueriesContext(connection) as before:
+            self.post("/api/exam/setlike/{}/".format(answer.id), {"like": 1, "response": "delta"})
+        for i in range(5):
+            Answer(answer_section=answer.answer_section, author=MyUser.objects.create(username="other{}".format(i)), text="Other").save()
+        with CaptureQueriesContext(connection) as after:
+            self.post("/api/exam/setlike/{}/".format(answer.id), {"like": -1, "response": "delta"})
+        self.assertEqual(len(before), len(after))
+
+    def test_remove(self):
+        answer = self.answers[0]
+        res = self.post("/api/exam/removeanswer/{}/".format(answer.id), {"response": "delta"})["value"]
+        self.assertEqual(res["answerId"], answer.id)
+        self.assertIsNone(res["answer"])
+
+    def test_remove_by_empty_text(self):
+        answer = self.answers[0]
+        res = self.post(
+            "/api/exam/setanswer/{}/".format(answer.answer_section.id),
+            {"text": "", "legacy_answer": False, "response": "delta"},
+        )["value"]
+        self.assertEqual(res["answerId"], answer.id)
+        self.assertIsNone(res["answer"])
+        self.assertFalse(Answer.objects.filter(id=answer.id).exists())
+
+    def test_comment(self):
+        answer = self.answers[0]
+        res = self.post(
+            "/api/exam/addcomment/{}/".format(answer.id),
+            {"text": "New comment", "response": "delta"},
+        )["value"]
+        self.assertEqual(res["answer"]["comments"][-1]["text"], "New comment")
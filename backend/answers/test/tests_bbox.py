@@ -0,0 +1,150 @@
+from io import BytesIO
+from xml.etree.ElementTree import ParseError
+
+from django.test import SimpleTestCase
+
+from answers import bbox_parser, page_layout, pdf_utils
+from answers.models import Exam, ExamPage
+from answers.pdf_utils import get_page_text
+from testing.tests import ComsolTestExamData
+
+BBOX_DOCUMENT = b"""<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+<title>Test</title>
+<meta name="Producer" content="pdfTeX"/>
+</head>
+<body>
+<doc>
+  <page width="600.000000" height="800.000000">
+    <flow>
+      <block xMin="60.0" yMin="80.0" xMax="300.0" yMax="200.0">
+        <line xMin="60.0" yMin="80.0" xMax="300.0" yMax="100.0">
+          <word xMin="60.000000" yMin="80.000000" xMax="120.000000" yMax="100.000000">Question</word>
+          <word xMin="130.000000" yMin="80.000000" xMax="150.000000" yMax="100.000000">1&amp;2</word>
+        </line>
+        <line xMin="60.0" yMin="110.0" xMax="300.0" yMax="130.0">
+          <word xMin="60.000000" yMin="110.000000" xMax="120.000000" yMax="130.000000">bro\x0bken</word>
+        </line>
+      </block>
+      <block xMin="60.0" yMin="300.0" xMax="300.0" yMax="320.0">
+        <line xMin="60.0" yMin="300.0" xMax="300.0" yMax="320.0">
+          <word xMin="60.000000" yMin="300.000000" xMax="120.000000" yMax="320.000000">a)</word>
+        </line>
+      </block>
+    </flow>
+    <flow>
+      <block xMin="400.0" yMin="700.0" xMax="420.0" yMax="720.0">
+        <line xMin="400.0" yMin="700.0" xMax="420.0" yMax="720.0">
+          <word xMin="400.000000" yMin="700.000000" xMax="420.000000" yMax="720.000000">1</word>
+        </line>
+      </block>
+    </flow>
+  </page>
+  <page width="300.000000" height="400.000000">
+  </page>
+</doc>
+</body>
+</html>
+"""
+
+
+class TestBBoxParser(SimpleTestCase):
+
+    def test_pages(self):
+        pages = list(bbox_parser.iter_pages(BytesIO(BBOX_DOCUMENT)))
+        self.assertEqual(len(pages), 2)
+        page = pages[0]
+        self.assertEqual((page.width, page.height), (600, 800))
+        self.assertEqual(len(page.flows), 2)
+        self.assertEqual(len(page.flows[0]), 2)
+        self.assertEqual(
+            list(page.words())[1], ("1&2", 130, 80, 150, 100)
+        )
+        self.assertEqual(
+            get_page_text(page), "Question 1&2\nbroken\n\na)\n\n1"
+        )
+        self.assertEqual((pages[1].width, pages[1].height, pages[1].flows), (300, 400, []))
+
+    def test_malformed(self):
+        with self.assertRaises(ParseError):
+            list(bbox_parser.iter_pages(BytesIO(BBOX_DOCUMENT[:-100])))
+
+
+class TestPageLayout(SimpleTestCase):
+
+    def test_roundtrip(self):
+        flows = [
+            [("Grüße", 0.25, 0.5, 0.75, 1.0), ("", 0, 0, 0, 0)],
+            [],
+            [("∫x dx", 0.125, 0.0625, 0.5, 0.5)],
+        ]
+        data = page_layout.encode(flows)
+        self.assertEqual(page_layout.decode(data), flows)
+        self.assertEqual(page_layout.decode(memoryview(data)), flows)
+        self.assertEqual(page_layout.decode(b""), [])
+        self.assertEqual(page_layout.decode(page_layout.encode([])), [])
+
+    def test_invalid(self):
+        data = page_layout.encode([[("word", 0.25, 0.5, 0.75, 1.0)]])
+        for invalid in [data[:5], data[:-1], data + b"x", b"\x07" + data[1:]]:
+            with self.assertRaises(page_layout.LayoutError):
+                page_layout.decode(invalid)
+
+
+class TestSavePages(ComsolTestExamData):
+
+    def get_pages(self):
+        return list(bbox_parser.iter_pages(BytesIO(BBOX_DOCUMENT)))
+
+    def test_batches(self):
+        pages = self.get_pages()[1:] * (pdf_utils.INSERT_BATCH_SIZE + 1)
+        pdf_utils.save_pages(self.exam, iter(pages))
+        self.assertEqual(
+            list(
+                ExamPage.objects.filter(exam=self.exam)
+                .order_by("page_number")
+                .values_list("page_number", flat=True)
+            ),
+            list(range(1, len(pages) + 1)),
+        )
+
+    def test_parse_error_keeps_pages(self):
+        pdf_utils.save_pages(self.exam, self.get_pages())
+        # Fails after the first page was parsed
+        truncated = BBOX_DOCUMENT[: BBOX_DOCUMENT.index(b'<page width="300') + 20]
+        with self.assertRaises(ParseError):
+            pdf_utils.save_pages(self.exam, bbox_parser.iter_pages(BytesIO(truncated)))
+        self.assertEqual(ExamPage.objects.filter(exam=self.exam).count(), 2)
+
+    def test_save_pages(self):
+        # Delete, insert and the savepoint of the transaction
+        with self.assertNumQueries(4):
+            pdf_utils.save_pages(self.exam, self.get_pages())
+        pages = ExamPage.objects.filter(exam=self.exam).order_by("page_number")
+        self.assertEqual([page.page_number for page in pages], [1, 2])
+        self.assertEqual(pages[0].text, "Question 1&2\nbroken\n\na)\n\n1")
+        flows = pages[0].get_flows()
+        self.assertEqual(len(flows), 2)
+        self.assertEqual(
+            [word.content for word in flows[0]], ["Question", "1&2", "broken", "a)"]
+        )
+        word = flows[0][1]
+        self.assertEqual(word.content, "1&2")
+        # Coordinates are stored as float32
+        for actual, expected in zip(word[1:], [130 / 600, 80 / 800, 150 / 600, 100 / 800]):
+            self.assertAlmostEqual(actual, expected, places=6)
+        self.assertEqual(pages[1].get_flows(), [])
+
+    def test_replace_pages(self):
+        other_exam = Exam.objects.create(
+            filename="other.pdf",
+            displayname="Other",
+            category=self.category,
+            exam_type=self.exam.exam_type,
+        )
+        pdf_utils.save_pages(other_exam, self.get_pages())
+        pdf_utils.save_pages(self.exam, self.get_pages())
+        pdf_utils.save_pages(self.exam, self.get_pages()[1:])
+        self.assertEqual(ExamPage.objects.filter(exam=self.exam).count(), 1)
+        self.assertEqual(ExamPage.objects.filter(exam=other_exam).count(), 2)
@@ -1,3 +1,6 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from testing.tests import ComsolTestExamData
 from answers.models import AnswerSection
 
@@ -124,3 +127,44 @@ class TestAnswerSection(ComsolTestExamData):
 
             # TODO test whether the content makes any sense
             # TODO test whether upvoting adjusts the score correctly
+
+
+class TestExamSections(ComsolTestExamData):
+
+    def get_sections(self, versions=None):
+        url = '/api/exam/examsections/{}/'.format(self.exam.filename)
+        if versions is not None:
+            url += '?cutVersions=' + ','.join(
+                '{}:{}'.format(oid, version) for oid, version in versions.items())
+        return self.get(url)['value']
+
+    def test_get_sections(self):
+        res = self.get_sections()
+        self.assertEqual(len(res['sections']), 4)
+        for section, expected in zip(res['sections'], self.sections):
+            single = self.get('/api/exam/answersection/{}/'.format(expected.id))['value']
+            self.assertEqual(section, single)
+            self.assertEqual(res['cutVersions'][str(expected.id)], expected.cut_version)
+
+    def test_query_count(self):
+        with CaptureQueriesContext(connection) as before:
+            self.get_sections()
+        for i in range(5):
+            AnswerSection(
+                exam=self.exam,
+                author=self.get_my_user(),
+                page_num=2,
+                rel_height=0.1 * i,
+            ).save()
+        with CaptureQueriesContext(connection) as after:
+            res = self.get_sections()
+        self.assertEqual(len(res['sections']), 9)
+        self.assertEqual(len(before), len(after))
+
+    def test_conditional(self):
+        versions = {int(oid): version for oid, version in self.get_sections()['cutVersions'].items()}
+        self.assertEqual(self.get_sections(versions)['sections'], [])
+        self.post('/api/exam/setlike/{}/'.format(self.answers[0].id), {'like': 1})
+        res = self.get_sections(versions)
+        self.assertEqual([section['oid'] for section in res['sections']], [self.sections[0].id])
+        self.get('/api/exam/examsections/{}/?cutVersions=abc'.format(self.exam.filename), status_code=400)
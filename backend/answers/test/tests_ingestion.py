@@ -0,0 +1,115 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from answers import ingestion, reanalysis
+from answers.models import Exam, PdfIngestionJob
+from testing.tests import ComsolTestExamData
+
+
+@override_settings(COMSOL_INGESTION_MAX_ATTEMPTS=2)
+class TestIngestion(ComsolTestExamData):
+
+    add_sections = False
+
+    def mySetUp(self):
+        # The exam does not exist in S3, so downloading it fails
+        self.exam.filename = "missing.pdf"
+        self.exam.save()
+
+    def get_status(self):
+        exam = Exam.objects.get(pk=self.exam.pk)
+        return exam.ingestion_status, exam.ingestion_error
+
+    def test_enqueue(self):
+        self.assertEqual(self.get_status(), ('done', ''))
+        ingestion.enqueue(self.exam)
+        self.assertEqual(self.get_status(), ('pending', ''))
+        ingestion.enqueue(self.exam)
+        self.assertEqual(PdfIngestionJob.objects.count(), 1)
+
+    def test_retry(self):
+        ingestion.enqueue(self.exam)
+        self.assertEqual(ingestion.process_jobs(), 1)
+        job = PdfIngestionJob.objects.get(exam=self.exam)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        status, error = self.get_status()
+        self.assertEqual(status, 'pending')
+        self.assertNotEqual(error, '')
+
+        # The job is not due yet
+        self.assertEqual(ingestion.process_jobs(), 0)
+        job.run_after = timezone.now() - timedelta(seconds=1)
+        job.save()
+        self.assertEqual(ingestion.process_jobs(), 1)
+        self.assertFalse(PdfIngestionJob.objects.exists())
+        status, error = self.get_status()
+        self.assertEqual(status, 'failed')
+        self.assertNotEqual(error, '')
+
+    def test_enqueued_while_running(self):
+        ingestion.enqueue(self.exam)
+        job = ingestion.claim_job()
+        self.assertEqual(Exam.objects.get(pk=self.exam.pk).ingestion_status, 'running')
+        self.assertIsNone(ingestion.claim_job())
+        ingestion.enqueue(self.exam)
+        ingestion.finish_job(job, error='Failed')
+        self.assertEqual(self.get_status(), ('pending', ''))
+        self.assertEqual(PdfIngestionJob.objects.get(exam=self.exam).attempts, 0)
+
+    def test_enqueued_and_claimed_again_while_running(self):
+        ingestion.enqueue(self.exam)
+        job = ingestion.claim_job()
+        ingestion.enqueue(self.exam)
+        # Claimed by a second worker with the same number of attempts
+        second_job = ingestion.claim_job()
+        self.assertEqual(second_job.attempts, job.attempts)
+        ingestion.finish_job(job, error='Failed')
+        self.assertEqual(self.get_status(), ('running', ''))
+        ingestion.finish_job(second_job)
+        self.assertEqual(self.get_status(), ('done', ''))
+        self.assertFalse(PdfIngestionJob.objects.exists())
+
+
+class TestReanalyze(ComsolTestExamData):
+
+    add_sections = False
+
+    def reanalyze(self, *args):
+        stdout = StringIO()
+        call_command(
+            "reanalyze_exams", "--processes", "0", *args, stdout=stdout, stderr=StringIO()
+        )
+        return stdout.getvalue()
+
+    def test_failure(self):
+        # The exam does not exist in S3
+        with self.assertRaises(CommandError):
+            self.reanalyze("--exam", self.exam.filename)
+
+    def test_analysis_failure_status(self):
+        with self.assertRaises(Exception):
+            reanalysis.analyze_exam(self.exam.pk, "missing.pdf")
+        exam = Exam.objects.get(pk=self.exam.pk)
+        self.assertEqual(exam.ingestion_status, 'failed')
+        self.assertNotEqual(exam.ingestion_error, '')
+
+    def test_selection(self):
+        self.assertIn("Analyzing 0 exams", self.reanalyze("--category", "other"))
+        self.assertIn("Analyzing 0 exams", self.reanalyze("--exam", "other.pdf"))
+
+    def test_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            checkpoint = os.path.join(tmpdirname, "checkpoint")
+            with open(checkpoint, "w") as f:
+                f.write(self.exam.filename + "\n")
+            self.assertIn(
+                "Analyzing 0 exams, 1 already done",
+                self.reanalyze("--checkpoint", checkpoint),
+            )
@@ -1,8 +1,12 @@
-from answers.models import Exam, ExamPage, ExamType
-from testing.tests import ComsolTestExamsData
+from answers import ingestion, pdf_utils, search_cache
+from answers.models import Answer, Exam, ExamPage, ExamType
+from answers.views_search import run_sub_search, run_sub_searches, search_executor
+from util import func_cache
+from testing.tests import ComsolTestExamData, ComsolTestExamsData
 from categories.models import Category
 import logging
-from time import sleep
+from time import monotonic, sleep
+from django.db import connection, OperationalError
 from django.contrib.postgres.search import SearchVector
 from django.core.files.uploadedfile import SimpleUploadedFile
 from os.path import dirname, join
@@ -19,6 +23,7 @@ class TestSearch(ComsolTestExamsData):
                 "/api/exam/upload/exam/",
                 {"category": "default", "displayname": "Test", "file": infile},
             )["filename"]
+            ingestion.process_jobs()
             ExamPage.objects.update(search_vector=SearchVector("text"))
             res = self.post("/api/exam/search/", {"term": "uniqueidthatwecansearch"})[
                 "value"
@@ -30,3 +35,99 @@ class TestSearch(ComsolTestExamsData):
             self.assertEqual(match["category_displayname"], "default")
             self.assertEqual(match["category_slug"], "default")
             self.assertEqual(len(match["pages"]), 1)
+
+
+class TestConcurrentSearch(ComsolTestExamsData):
+    def test_sub_search_deadline(self):
+        def fast_search(term):
+            return [{"term": term}]
+
+        def slow_search(term):
+            sleep(1)
+            return [{"term": term}]
+
+        with self.settings(COMSOL_SEARCH_CONCURRENT=True, COMSOL_SEARCH_TIMEOUT=0.2):
+            res, complete = run_sub_searches(
+                [("fast", fast_search), ("slow", slow_search)], ("abc",)
+            )
+        self.assertFalse(complete)
+        self.assertEqual(res["fast"][0], [{"term": "abc"}])
+        self.assertEqual(res["slow"][0], [])
+
+    def test_sub_search_statement_timeout(self):
+        def sleeping_search():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_sleep(5)")
+            return []
+
+        future = search_executor.submit(
+            run_sub_search, "sleep", sleeping_search, (), True, monotonic() + 0.2
+        )
+        start = monotonic()
+        with self.assertRaises(OperationalError):
+            future.result(timeout=4)
+        self.assertLess(monotonic() - start, 2)
+
+    def test_sequential_search(self):
+        with self.settings(COMSOL_SEARCH_CONCURRENT=False):
+            res, complete = run_sub_searches(
+                [("a", lambda x: [x]), ("b", lambda x: [x, x])], (1,)
+            )
+        self.assertTrue(complete)
+        self.assertEqual(res["a"][0], [1])
+        self.assertEqual(res["b"][0], [1, 1])
+
+
+class TestTwoPhaseSearch(ComsolTestExamsData):
+    def test_pages_per_exam(self):
+        exam = self.exams[0]
+        for i in range(1, 9):
+            ExamPage.objects.create(
+                exam=exam, page_number=i, width=1, height=1, text="twophase " * i
+            )
+        ExamPage.objects.update(search_vector=SearchVector("text"))
+        with self.settings(COMSOL_SEARCH_MAX_PAGES_PER_EXAM=3):
+            res = self.post("/api/exam/search/", {"term": "twophase"})["value"]
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]["filename"], exam.filename)
+        pages = res[0]["pages"]
+        self.assertEqual([page[0] for page in pages], [6, 7, 8])
+        self.assertEqual(res[0]["rank"], max(page[1] for page in pages))
+
+
+class TestSearchCache(ComsolTestExamData):
+    def test_cache(self):
+        with self.settings(TESTING=False):
+            hits = search_cache.search_cache_hits._value.get()
+            res = self.post("/api/exam/search/", {"term": "Legacy"})["value"]
+            self.assertEqual(len(res), 4)
+            res = self.post("/api/exam/search/", {"term": "  legacy "})["value"]
+            self.assertEqual(len(res), 4)
+            self.assertEqual(search_cache.search_cache_hits._value.get(), hits + 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Answer(
+                    answer_section=self.sections[0],
+                    author=self.get_my_user(),
+                    text="Another legacy answer",
+                ).save()
+            res = self.post("/api/exam/search/", {"term": "legacy"})["value"]
+            self.assertEqual(len(res), 5)
+
+    def test_save_pages_invalidates(self):
+        generation = func_cache.get_generation(search_cache.GENERATION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            pdf_utils.save_pages(self.exam, [])
+        self.assertNotEqual(
+            func_cache.get_generation(search_cache.GENERATION_KEY), generation
+        )
+
+    def test_key(self):
+        self.assertEqual(
+            search_cache.get_key("Exercise  3", (), True, False, [2, 1]),
+            search_cache.get_key(" exercise 3", (), True, False, [1, 2]),
+        )
+        self.assertNotEqual(
+            search_cache.get_key("exercise 3", (), True, False, [1]),
+            search_cache.get_key("exercise 3", (), False, False, [1]),
+        )
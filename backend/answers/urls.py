@@ -33,6 +33,8 @@ urlpatterns = [
          views_cuts.get_cut_versions, name='cutversions'),
     path('answersection/<int:oid>/',
          views_cuts.get_answersection, name='answersection'),
+    path('examsections/<str:filename>/',
+         views_cuts.get_exam_sections, name='examsections'),
     path('metadata/<str:filename>/', views.exam_metadata, name='metadata'),
     path('setmetadata/<str:filename>/',
          views.exam_set_metadata, name='setmetadata'),
@@ -31,6 +31,8 @@ def exam_metadata(request, filename):
         'solution_printonly': exam.solution_printonly,
         'is_oral_transcript': exam.is_oral_transcript,
         'oral_transcript_checked': exam.oral_transcript_checked,
+        'ingestion_status': exam.ingestion_status,
+        'ingestion_error': exam.ingestion_error,
         'attachments': [
             {
                 'displayname': att.displayname,
@@ -40,7 +42,7 @@ def exam_metadata(request, filename):
         'canEdit': admin_rights,
         'isExpert': auth_check.is_expert_for_exam(request, exam),
         'canView': can_view,
-        'hasPayed': request.user.has_payed(),
+        'hasPayed': auth_check.has_payed(request),
     }
 
     if can_view:
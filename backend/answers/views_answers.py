@@ -12,6 +12,7 @@ from django.utils import timezone
 def get_answer(request, long_id):
     try:
         answer = section_util.prepare_answer_objects(Answer.objects, request).get(long_id=long_id)
+        section_util.add_user_votes(request, [answer])
         return response.success(value=section_util.get_answer_response(request, answer))
     except Answer.DoesNotExist as e:
         raise Http404()
@@ -23,14 +24,7 @@ def get_answer(request, long_id):
 @auth_check.require_login
 def set_answer(request, oid):
     section = get_object_or_404(
-        AnswerSection.objects.select_related("exam").prefetch_related(
-            "answer_set",
-            "answer_set__comments",
-            "answer_set__upvotes",
-            "answer_set__downvotes",
-            "answer_set__expertvotes",
-            "answer_set__flagged",
-        ),
+        AnswerSection.objects.select_related("exam"),
         pk=oid,
     )
 
@@ -51,7 +45,8 @@ def set_answer(request, oid):
 
     answer, created = None, False
     if not text:
-        Answer.objects.filter(*where).delete()
+        answer_id = Answer.objects.filter(**where).values_list("id", flat=True).first()
+        Answer.objects.filter(**where).delete()
     else:
         defaults = {
             "author": request.user,
@@ -59,13 +54,14 @@ def set_answer(request, oid):
             "edittime": timezone.now(),
         }
         answer, created = Answer.objects.update_or_create(**where, defaults=defaults)
+        answer_id = answer.id
     if created and not legacy_answer:
         answer.upvotes.add(request.user)
         notification_util.new_answer_to_answer(answer)
 
     section_util.increase_section_version(section)
     return response.success(
-        value=section_util.get_answersection_response(request, section)
+        value=section_util.get_mutation_response(request, section, answer_id)
     )
 
 
@@ -79,13 +75,27 @@ def remove_answer(request, oid):
     if not (answer.author == request.user or auth_check.has_admin_rights(request)):
         return response.not_allowed()
     section = answer.answer_section
+    answer_id = answer.id
     answer.delete()
     section_util.increase_section_version(section)
     return response.success(
-        value=section_util.get_answersection_response(request, section)
+        value=section_util.get_mutation_response(request, section, answer_id)
     )
 
 
+def set_user_vote(field, answer, user, value):
+    """
+    Adds or removes `user` to the votes `field` of `answer` using a single query.
+    """
+    through = field.through
+    if value:
+        through.objects.bulk_create(
+            [through(answer_id=answer.id, user_id=user.id)], ignore_conflicts=True
+        )
+    else:
+        through.objects.filter(answer_id=answer.id, user_id=user.id).delete()
+
+
 @response.request_post("like")
 @auth_check.require_login
 def set_like(request, oid):
@@ -94,24 +104,11 @@ def set_like(request, oid):
         pk=oid
     )
     like = int(request.POST["like"])
-    old_like = 0
-    if answer.upvotes.filter(pk=request.user.pk).exists():
-        old_like = 1
-    elif answer.downvotes.filter(pk=request.user.pk).exists():
-        old_like = -1
-    if like != old_like:
-        if old_like == 1:
-            answer.upvotes.remove(request.user)
-        elif old_like == -1:
-            answer.downvotes.remove(request.user)
-        if like == 1:
-            answer.upvotes.add(request.user)
-        elif like == -1:
-            answer.downvotes.add(request.user)
-        answer.save()
+    set_user_vote(Answer.upvotes, answer, request.user, like == 1)
+    set_user_vote(Answer.downvotes, answer, request.user, like == -1)
     section_util.increase_section_version(answer.answer_section)
     return response.success(
-        value=section_util.get_answersection_response(request, answer.answer_section)
+        value=section_util.get_mutation_response(request, answer.answer_section, answer.id)
     )
 
 
@@ -119,22 +116,16 @@ def set_like(request, oid):
 @auth_check.require_login
 def set_expertvote(request, oid):
     answer = get_object_or_404(
-        Answer.objects.select_related("answer_section").all(),
+        Answer.objects.select_related("answer_section__exam").all(),
         pk=oid
     )
     if not auth_check.is_expert_for_exam(request, answer.answer_section.exam):
         return response.not_allowed()
     vote = request.POST["vote"] != "false"
-    old_vote = answer.expertvotes.filter(pk=request.user.pk).exists()
-    if vote != old_vote:
-        if old_vote:
-            answer.expertvotes.remove(request.user)
-        else:
-            answer.expertvotes.add(request.user)
-        answer.save()
+    set_user_vote(Answer.expertvotes, answer, request.user, vote)
     section_util.increase_section_version(answer.answer_section)
     return response.success(
-        value=section_util.get_answersection_response(request, answer.answer_section)
+        value=section_util.get_mutation_response(request, answer.answer_section, answer.id)
     )
 
 
@@ -146,16 +137,10 @@ def set_flagged(request, oid):
         pk=oid
     )
     flagged = request.POST["flagged"] != "false"
-    old_flagged = answer.flagged.filter(pk=request.user.pk).exists()
-    if flagged != old_flagged:
-        if old_flagged:
-            answer.flagged.remove(request.user)
-        else:
-            answer.flagged.add(request.user)
-        answer.save()
+    set_user_vote(Answer.flagged, answer, request.user, flagged)
     section_util.increase_section_version(answer.answer_section)
     return response.success(
-        value=section_util.get_answersection_response(request, answer.answer_section)
+        value=section_util.get_mutation_response(request, answer.answer_section, answer.id)
     )
 
 
@@ -166,9 +151,8 @@ def reset_flagged(request, oid):
         Answer.objects.select_related("answer_section").all(),
         pk=oid
     )
-    answer.flagged.clear()
-    answer.save()
+    Answer.flagged.through.objects.filter(answer_id=answer.id).delete()
     section_util.increase_section_version(answer.answer_section)
     return response.success(
-        value=section_util.get_answersection_response(request, answer.answer_section)
+        value=section_util.get_mutation_response(request, answer.answer_section, answer.id)
     )
@@ -16,7 +16,7 @@ def add_comment(request, oid):
     notification_util.new_comment_to_answer(answer, new_comment)
     notification_util.new_comment_to_comment(answer, new_comment)
     section_util.increase_section_version(answer.answer_section)
-    return response.success(value=section_util.get_answersection_response(request, answer.answer_section))
+    return response.success(value=section_util.get_mutation_response(request, answer.answer_section, answer.id))
 
 
 @response.request_post('text')
@@ -29,7 +29,7 @@ def set_comment(request, oid):
     comment.edittime = timezone.now()
     comment.save()
     section_util.increase_section_version(comment.answer.answer_section)
-    return response.success(value=section_util.get_answersection_response(request, comment.answer.answer_section))
+    return response.success(value=section_util.get_mutation_response(request, comment.answer.answer_section, comment.answer_id))
 
 
 @response.request_post()
@@ -40,5 +40,5 @@ def remove_comment(request, oid):
         return response.not_allowed()
     section = comment.answer.answer_section
     comment.delete()
-    section_util.increase_section_version(comment.answer.answer_section)
-    return response.success(value=section_util.get_answersection_response(request, section))
+    section_util.increase_section_version(section)
+    return response.success(value=section_util.get_mutation_response(request, section, comment.answer_id))
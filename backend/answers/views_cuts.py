@@ -94,7 +94,37 @@ def get_cut_versions(request, filename):
 @auth_check.require_login
 def get_answersection(request, oid):
     section = get_object_or_404(
-        AnswerSection.objects.select_related('exam').prefetch_related(
-            'answer_set', 'answer_set__comments', 'answer_set__upvotes', 'answer_set__downvotes', 'answer_set__expertvotes', 'answer_set__flagged'),
+        AnswerSection.objects.select_related('exam'),
         pk=oid)
     return response.success(value=section_util.get_answersection_response(request, section))
+
+
+@response.request_get()
+@auth_check.require_login
+def get_exam_sections(request, filename):
+    """
+    Returns all answer sections of an exam including their answers and comments.
+    The optional parameter `cutVersions` has the form `oid:version,oid:version` and
+    lists the sections known to the client. These are only returned if their
+    version changed. `cutVersions` of the response always lists all sections.
+    """
+    exam = get_object_or_404(Exam, filename=filename)
+    known_versions = {}
+    try:
+        for entry in request.GET.get('cutVersions', '').split(','):
+            if entry:
+                oid, version = entry.split(':')
+                known_versions[int(oid)] = int(version)
+    except ValueError:
+        return response.not_possible('Invalid cut versions')
+    sections = exam.answersection_set.order_by('page_num', 'rel_height', 'id')
+    cut_versions = {}
+    changed = []
+    for section in sections:
+        cut_versions[section.id] = section.cut_version
+        if known_versions.get(section.id) != section.cut_version:
+            changed.append(section)
+    return response.success(value={
+        'cutVersions': cut_versions,
+        'sections': section_util.get_answersections_response(request, exam, changed),
+    })
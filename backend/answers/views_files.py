@@ -1,11 +1,12 @@
-from util import response, s3_util, ethprint
+from util import response, s3_util, ethprint, ids
 from myauth import auth_check
 from django.conf import settings
 from answers.models import Exam, ExamType
 from categories.models import Category
 from django.shortcuts import get_object_or_404
 import os
-from answers import pdf_utils
+import tempfile
+from answers import ingestion
 
 
 def prepare_exam_pdf_file(request):
@@ -19,29 +20,33 @@ def prepare_exam_pdf_file(request):
     return None, file
 
 
+def generate_exam_filename():
+    # Exam filenames are part of URLs, so they are kept short
+    return s3_util.generate_filename(8, ".pdf")
+
+
 @response.request_post("category", "displayname")
 @auth_check.require_login
 def upload_exam_pdf(request):
     err, file = prepare_exam_pdf_file(request)
     if err is not None:
         return err
-    filename = s3_util.generate_filename(8, settings.COMSOL_EXAM_DIR, ".pdf")
     category = get_object_or_404(Category, slug=request.POST.get("category", "default"))
     if not auth_check.has_admin_rights_for_category(request, category):
         return response.not_allowed()
     exam = Exam(
-        filename=filename,
+        filename=generate_exam_filename(),
         displayname=request.POST["displayname"],
         exam_type=ExamType.objects.get(displayname="Exams"),
         category=category,
         resolve_alias=file.name,
     )
-    exam.save()
+    ids.save_with_unique_id(exam, "filename", generate_exam_filename)
     s3_util.save_uploaded_file_to_s3(
-        settings.COMSOL_EXAM_DIR, filename, file, "application/pdf"
+        settings.COMSOL_EXAM_DIR, exam.filename, file, "application/pdf"
     )
-    pdf_utils.analyze_pdf(exam, os.path.join(settings.COMSOL_UPLOAD_FOLDER, filename))
-    return response.success(filename=filename)
+    ingestion.enqueue(exam)
+    return response.success(filename=exam.filename)
 
 
 @response.request_post("category")
@@ -51,12 +56,11 @@ def upload_transcript(request):
     err, file = prepare_exam_pdf_file(request)
     if err is not None:
         return err
-    filename = s3_util.generate_filename(8, settings.COMSOL_EXAM_DIR, ".pdf")
     category = get_object_or_404(Category, slug=request.POST.get("category", "default"))
     if not category.has_payments:
         return response.not_possible("Category is not valid")
     exam = Exam(
-        filename=filename,
+        filename=generate_exam_filename(),
         displayname=request.POST.get("displayname", file.name),
         category=category,
         exam_type=ExamType.objects.get(displayname="Transcripts"),
@@ -65,12 +69,12 @@ def upload_transcript(request):
         is_oral_transcript=True,
         oral_transcript_uploader=request.user,
     )
-    exam.save()
+    ids.save_with_unique_id(exam, "filename", generate_exam_filename)
     s3_util.save_uploaded_file_to_s3(
-        settings.COMSOL_EXAM_DIR, filename, file, "application/pdf"
+        settings.COMSOL_EXAM_DIR, exam.filename, file, "application/pdf"
     )
-    pdf_utils.analyze_pdf(exam, os.path.join(settings.COMSOL_UPLOAD_FOLDER, filename))
-    return response.success(filename=filename)
+    ingestion.enqueue(exam)
+    return response.success(filename=exam.filename)
 
 
 def get_existing_exam(request):
@@ -94,6 +98,8 @@ def upload_printonly(request):
     s3_util.save_uploaded_file_to_s3(
         settings.COMSOL_PRINTONLY_DIR, request.POST["filename"], file, "application/pdf"
     )
+    # Browsers may have cached the previous file under the current URL
+    get_presigned_url_printonly(exam, renew=True)
     return response.success()
 
 
@@ -108,6 +114,8 @@ def upload_solution(request):
     s3_util.save_uploaded_file_to_s3(
         settings.COMSOL_SOLUTION_DIR, request.POST["filename"], file, "application/pdf"
     )
+    # Browsers may have cached the previous file under the current URL
+    get_presigned_url_solution(exam, renew=True)
     return response.success()
 
 
@@ -155,7 +163,7 @@ def get_exam_pdf(request, filename):
     return response.success(value=get_presigned_url_exam(exam))
 
 
-def get_presigned_url_solution(exam: Exam):
+def get_presigned_url_solution(exam: Exam, renew=False):
     return s3_util.presigned_get_object(
         settings.COMSOL_SOLUTION_DIR,
         exam.filename,
@@ -164,6 +172,7 @@ def get_presigned_url_solution(exam: Exam):
         + " "
         + exam.displayname
         + " (Solution).pdf",
+        renew=renew,
     )
 
 
@@ -178,12 +187,13 @@ def get_solution_pdf(request, filename):
     return response.success(value=get_presigned_url_solution(exam))
 
 
-def get_presigned_url_printonly(exam: Exam):
+def get_presigned_url_printonly(exam: Exam, renew=False):
     return s3_util.presigned_get_object(
         settings.COMSOL_PRINTONLY_DIR,
         exam.filename,
         content_type="application/pdf",
         display_name=exam.category.displayname + " " + exam.displayname + ".pdf",
+        renew=renew,
     )
 
 @response.request_get()
@@ -202,8 +212,10 @@ def get_printonly_pdf(request, filename):
 def print_pdf(exam, request, filename, s3_dir):
     if not exam.current_user_can_view(request):
         return response.not_allowed()
+    fd, pdfpath = tempfile.mkstemp(suffix=".pdf", dir=settings.COMSOL_UPLOAD_FOLDER)
+    os.close(fd)
+    started = False
     try:
-        pdfpath = os.path.join(settings.COMSOL_UPLOAD_FOLDER, filename)
         if not s3_util.save_file(s3_dir, filename, pdfpath):
             return response.internal_error()
         return_code = ethprint.start_job(
@@ -213,8 +225,13 @@ def print_pdf(exam, request, filename, s3_dir):
             return response.not_possible(
                 "Could not connect to the printer. Please check your password and try again."
             )
+        # The print job deletes the PDF once it is converted
+        started = True
     except Exception:
         pass
+    finally:
+        if not started:
+            os.remove(pdfpath)
     return response.success()
 
 
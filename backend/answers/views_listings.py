@@ -100,11 +100,12 @@ def get_by_user(request, username, page=-1):
         .select_related(*section_util.get_answer_fields_to_preselect()) \
 
     sorted_answers = section_util.prepare_answer_objects(sorted_answers, request) \
-        .order_by("-expert_count", "-delta_votes", "time")
+        .order_by("-expertvote_count", "-delta_votes", "time")
 
     if page >= 0:
         PAGE_SIZE = 20
         sorted_answers = sorted_answers[page*PAGE_SIZE: (page+1)*PAGE_SIZE]
+    sorted_answers = section_util.add_user_votes(request, sorted_answers)
 
     res = [
         section_util.get_answer_response(
@@ -1,10 +1,23 @@
 import re
 import random
-from django.db.models.functions import Concat
-from django.db.models import Q, F, When, Case, Value as V, Func, TextField
+from django.db.models.functions import Concat, Coalesce, Greatest
+from django.db.models import (
+    Q,
+    F,
+    When,
+    Case,
+    Value as V,
+    Func,
+    TextField,
+    FloatField,
+    Max,
+    OuterRef,
+    Subquery,
+)
 from myauth import auth_check
 from myauth.models import get_my_user
 from util import response
+from answers import search_cache
 from answers.models import Answer, Comment, Exam, ExamPage, ExamType
 from myauth.auth_check import has_admin_rights
 from django.contrib.postgres.search import (
@@ -15,7 +28,9 @@ from django.contrib.postgres.search import (
 )
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from django.conf import settings
+from django.db import connection, OperationalError
 
 """
 Search function that uses the full text search capabilities to search for a given query in
@@ -37,6 +52,12 @@ render to HTML on the client we parse the result of ts_headline again and instea
 <b> we insert random strings so that it becomes highly unlikely that the user can accidentally
 (there might also be security implications) highlight some text.
 
+Because ts_headline has to parse the whole text again it is by far the most expensive part of
+a search. Every search therefore runs in two phases: first the matches are ranked using only
+the search vectors and the ids of the best `amount` matches are selected. Only for those the
+headlines are computed in the second phase. For exams at most COMSOL_SEARCH_MAX_PAGES_PER_EXAM
+pages get a headline.
+
 The results of the different document types are merged and sorted again on the server (It's
 find in this case because only very few documents will be left)
 """
@@ -185,56 +206,82 @@ def search_exams(term, has_payed, is_admin, user_admin_categories, amount):
     if not has_payed:
         can_view = can_view & Q(needs_payment=False)
 
+    # Phase one: rank the matching exams using only the search vectors. The rank of
+    # an exam is the best rank of its displayname or any of its pages.
+    page_rank = (
+        ExamPage.objects.filter(exam=OuterRef("pk"), search_vector=term)
+        .values("exam")
+        .annotate(rank=Max(SearchRank(F("search_vector"), query)))
+        .values("rank")
+    )
     exams = (
         Exam.objects.filter(
             id__in=ExamPage.objects.filter(search_vector=term).values("exam_id")
         )
         | Exam.objects.filter(search_vector=term)
     ).annotate(
-        rank=SearchRank(F("search_vector"), query),
-        headline=headline(
-            F("displayname"), query, start_boundary, end_boundary, fragment_delimeter,
-        ),
-        category_displayname=F("category__displayname"),
-        category_slug=F("category__slug"),
+        rank=Greatest(
+            Coalesce(SearchRank(F("search_vector"), query), V(0.0)),
+            Coalesce(Subquery(page_rank, output_field=FloatField()), V(0.0)),
+        )
     )
     if not is_admin:
         exams = exams.filter(can_view)
-    exams = exams.only("filename")[:amount]
+    ranks = dict(exams.order_by("-rank", "id").values_list("id", "rank")[:amount])
 
+    page_ranks = (
+        ExamPage.objects.filter(exam__in=list(ranks), search_vector=term)
+        .annotate(rank=SearchRank(F("search_vector"), query))
+        .order_by("-rank", "page_number")
+        .values_list("id", "exam_id", "rank")
+    )
+    pages_per_exam = dict()
+    for page_id, exam_id, rank in page_ranks:
+        exam_pages = pages_per_exam.setdefault(exam_id, dict())
+        if len(exam_pages) < settings.COMSOL_SEARCH_MAX_PAGES_PER_EXAM:
+            exam_pages[page_id] = rank
+
+    # Phase two: compute the headlines only for what will be returned.
+    exam_page_ids = [
+        page_id for exam_pages in pages_per_exam.values() for page_id in exam_pages
+    ]
     exam_pages_query = (
-        ExamPage.objects.filter(
-            exam__in=list(exams.values_list("id", flat=True)), search_vector=term
-        )
+        ExamPage.objects.filter(id__in=exam_page_ids)
         .annotate(
-            rank=SearchRank(F("search_vector"), query),
             headline=headline(
                 F("text"), query, start_boundary, end_boundary, fragment_delimeter,
             ),
         )
         .order_by("page_number")
-        .only("page_number", "exam_id")
+        .values_list("id", "exam_id", "page_number", "headline")
     )
-
-    examDict = dict()
-    examScore = dict()
-    examPages = dict()
-    for exam in exams:
-        examScore[exam.id] = exam.rank
-        examPages[exam.id] = []
-    for examPage in exam_pages_query:
-        if examPage.exam_id not in examScore:
-            continue
-        examScore[examPage.exam_id] = max(examPage.rank, examScore[examPage.exam_id])
-        examPages[examPage.exam_id].append(
+    examPages = {exam_id: [] for exam_id in ranks}
+    for page_id, exam_id, page_number, page_headline in exam_pages_query:
+        examPages[exam_id].append(
             (
-                examPage.page_number,
-                examPage.rank,
+                page_number,
+                pages_per_exam[exam_id][page_id],
                 parse_headline(
-                    examPage.headline, start_boundary, end_boundary, fragment_delimeter
+                    page_headline, start_boundary, end_boundary, fragment_delimeter
                 ),
             )
         )
+
+    exams = (
+        Exam.objects.filter(id__in=list(ranks))
+        .annotate(
+            headline=headline(
+                F("displayname"),
+                query,
+                start_boundary,
+                end_boundary,
+                fragment_delimeter,
+            ),
+            category_displayname=F("category__displayname"),
+            category_slug=F("category__slug"),
+        )
+        .only("filename")
+    )
     return [
         {
             "type": "exam",
@@ -244,13 +291,37 @@ def search_exams(term, has_payed, is_admin, user_admin_categories, amount):
             ),
             "category_displayname": exam.category_displayname,
             "category_slug": exam.category_slug,
-            "rank": examScore[exam.id],
+            "rank": ranks[exam.id],
             "pages": examPages[exam.id],
         }
-        for exam in exams
+        for exam in sorted(exams, key=lambda exam: -ranks[exam.id])
     ]
 
 
+def prepare_search_results(results, ranks, start_boundary, end_boundary, fragment_delimeter):
+    """
+    Sorts the answer or comment `results` of the second search phase by the `ranks`
+    of the first phase and parses their highlighted words.
+    """
+    results = sorted(results, key=lambda result: -ranks[result["id"]])
+    for result in results:
+        result["rank"] = ranks[result.pop("id")]
+        result["highlighted_words"] = list(
+            flatten(
+                map(
+                    flatten_and_filter,
+                    parse_headline(
+                        result["highlighted_words"],
+                        start_boundary,
+                        end_boundary,
+                        fragment_delimeter,
+                    ),
+                )
+            )
+        )
+    return results
+
+
 def search_answers(term, has_payed, is_admin, user_admin_categories, amount):
     query = SearchQuery(term)
 
@@ -268,10 +339,17 @@ def search_answers(term, has_payed, is_admin, user_admin_categories, amount):
     answers = Answer.objects
     if not is_admin:
         answers = answers.filter(answer_section_exam_can_view)
-    answers = (
+    # Phase one: only the GIN index and the search vectors are used for ranking
+    ranks = dict(
         answers.filter(search_vector=term)
+        .annotate(rank=SearchRank(F("search_vector"), query))
+        .order_by("-rank", "id")
+        .values_list("id", "rank")[:amount]
+    )
+    # Phase two: the expensive ts_headline only runs for the returned answers
+    answers = (
+        Answer.objects.filter(id__in=list(ranks))
         .annotate(
-            rank=SearchRank(F("search_vector"), query),
             author_username=F("author__username"),
             author_displayname=Case(
                 When(Q(author__first_name__isnull=True), "author__last_name",),
@@ -288,11 +366,11 @@ def search_answers(term, has_payed, is_admin, user_admin_categories, amount):
             category_slug=F("answer_section__exam__category__slug"),
         )
         .values(
+            "id",
             "author_username",
             "author_displayname",
             "text",
             "highlighted_words",
-            "rank",
             "long_id",
             # Exam
             "exam_displayname",
@@ -300,23 +378,11 @@ def search_answers(term, has_payed, is_admin, user_admin_categories, amount):
             # Category
             "category_displayname",
             "category_slug",
-        )[:amount]
-    )
-    for answer in answers:
-        answer["highlighted_words"] = list(
-            flatten(
-                map(
-                    flatten_and_filter,
-                    parse_headline(
-                        answer["highlighted_words"],
-                        start_boundary,
-                        end_boundary,
-                        fragment_delimeter,
-                    ),
-                )
-            )
         )
-    return answers
+    )
+    return prepare_search_results(
+        answers, ranks, start_boundary, end_boundary, fragment_delimeter
+    )
 
 
 def search_comments(term, has_payed, is_admin, user_admin_categories, amount):
@@ -336,10 +402,17 @@ def search_comments(term, has_payed, is_admin, user_admin_categories, amount):
     comments = Comment.objects
     if not is_admin:
         comments = comments.filter(answer_answer_section_exam_can_view)
-    comments = (
+    # Phase one: only the GIN index and the search vectors are used for ranking
+    ranks = dict(
         comments.filter(search_vector=term)
+        .annotate(rank=SearchRank(F("search_vector"), query))
+        .order_by("-rank", "id")
+        .values_list("id", "rank")[:amount]
+    )
+    # Phase two: the expensive ts_headline only runs for the returned comments
+    comments = (
+        Comment.objects.filter(id__in=list(ranks))
         .annotate(
-            rank=SearchRank(F("search_vector"), query),
             author_username=F("author__username"),
             author_displayname=Case(
                 When(Q(author__first_name__isnull=True), "author__last_name",),
@@ -358,11 +431,11 @@ def search_comments(term, has_payed, is_admin, user_admin_categories, amount):
             category_slug=F("answer__answer_section__exam__category__slug"),
         )
         .values(
+            "id",
             "author_username",
             "author_displayname",
             "text",
             "highlighted_words",
-            "rank",
             "long_id",
             # Exam
             "exam_displayname",
@@ -370,23 +443,105 @@ def search_comments(term, has_payed, is_admin, user_admin_categories, amount):
             # Category
             "category_displayname",
             "category_slug",
-        )[:amount]
+        )
     )
-    for comment in comments:
-        comment["highlighted_words"] = list(
-            flatten(
-                map(
-                    flatten_and_filter,
-                    parse_headline(
-                        comment["highlighted_words"],
-                        start_boundary,
-                        end_boundary,
-                        fragment_delimeter,
-                    ),
-                )
+    return prepare_search_results(
+        comments, ranks, start_boundary, end_boundary, fragment_delimeter
+    )
+
+
+def run_sub_search(name, search_function, args, close_connection, deadline=None):
+    """
+    Runs one of the sub-searches and measures how long it took. When it runs on a
+    worker thread the thread's db connection is closed afterwards, as Django would
+    otherwise keep one connection open per thread.
+
+    If a `deadline` (in `time.monotonic()` seconds) is given, the queries are limited
+    to the remaining time with `statement_timeout`, so that Postgres cancels them
+    instead of letting them run on after the request has given up on the results.
+    A cancelled query raises `OperationalError`.
+
+    Returns:
+        `tuple`: The name of the sub-search, its results and the time spent in seconds
+    """
+    start = time.time()
+    try:
+        if deadline is not None:
+            remaining = int((deadline - time.monotonic()) * 1000)
+            if remaining <= 0:
+                raise OperationalError("search deadline passed before the query started")
+            with connection.cursor() as cursor:
+                cursor.execute("SET statement_timeout = %s", [remaining])
+        return name, list(search_function(*args)), time.time() - start
+    finally:
+        if close_connection:
+            connection.close()
+
+
+search_executor = ThreadPoolExecutor(
+    max_workers=settings.COMSOL_SEARCH_WORKERS, thread_name_prefix="search"
+)
+
+
+def run_sub_searches(sub_searches, args):
+    """
+    Runs all the given `(name, search_function)` pairs with `args`. If
+    `COMSOL_SEARCH_CONCURRENT` is set they run in parallel on the search thread pool
+    and sub-searches that miss the `COMSOL_SEARCH_TIMEOUT` deadline return no
+    results instead of stalling the whole request.
+
+    Returns:
+        `dict, bool`: Maps each name to a tuple of its results and the time spent in
+        seconds, and whether all sub-searches finished successfully
+    """
+    if not settings.COMSOL_SEARCH_CONCURRENT:
+        res = {
+            name: (results, duration)
+            for name, results, duration in (
+                run_sub_search(name, search_function, args, False)
+                for name, search_function in sub_searches
+            )
+        }
+        return res, True
+
+    deadline = time.monotonic() + settings.COMSOL_SEARCH_TIMEOUT
+    futures = {
+        search_executor.submit(
+            run_sub_search, name, search_function, args, True, deadline
+        ): name
+        for name, search_function in sub_searches
+    }
+    done, not_done = wait(futures, timeout=settings.COMSOL_SEARCH_TIMEOUT)
+    res = {}
+    for future in done:
+        try:
+            name, results, duration = future.result()
+            res[name] = (results, duration)
+        except OperationalError:
+            logger.warning(
+                "Search for %s was cancelled after %s s",
+                futures[future],
+                settings.COMSOL_SEARCH_TIMEOUT,
             )
+            res[futures[future]] = ([], settings.COMSOL_SEARCH_TIMEOUT)
+        except Exception:
+            logger.exception("Search for %s failed", futures[future])
+            res[futures[future]] = ([], settings.COMSOL_SEARCH_TIMEOUT)
+    for future in not_done:
+        # Only futures that are still queued can be cancelled here. Running ones are
+        # stopped by their statement_timeout, or finish in the background if they
+        # spend the time outside of the database.
+        future.cancel()
+        logger.warning(
+            "Search for %s did not finish within %s s",
+            futures[future],
+            settings.COMSOL_SEARCH_TIMEOUT,
         )
-    return comments
+        res[futures[future]] = ([], settings.COMSOL_SEARCH_TIMEOUT)
+    complete = len(not_done) == 0 and all(
+        future.exception() is None for future in done
+    )
+    return res, complete
 
 
 @response.request_post("term")
@@ -398,28 +553,35 @@ def search(request):
     include_answers = request.POST.get("include_answers", "true") == "true"
     include_comments = request.POST.get("include_comments", "true") == "true"
 
-    user = request.user
-    user_admin_categories = user.category_admin_set.values_list("id", flat=True)
-    has_payed = user.has_payed()
+    user_admin_categories = sorted(auth_check.get_permissions(request).admin_categories)
+    has_payed = auth_check.has_payed(request)
     is_admin = has_admin_rights(request)
-    exams_start = time.time()
-    exams = (
-        search_exams(term, has_payed, is_admin, user_admin_categories, amount)
-        if include_exams
-        else []
+
+    cache_key = search_cache.get_key(
+        term,
+        (include_exams, include_answers, include_comments, amount),
+        has_payed,
+        is_admin,
+        user_admin_categories,
     )
-    answers_start = time.time()
-    answers = (
-        search_answers(term, has_payed, is_admin, user_admin_categories, amount)
-        if include_answers
-        else []
-    )
-    comments_start = time.time()
-    comments = (
-        search_comments(term, has_payed, is_admin, user_admin_categories, amount)
-        if include_comments
-        else []
+    res = search_cache.get(cache_key)
+    if res is not None:
+        return response.success(value=res)
+
+    sub_searches = []
+    if include_exams:
+        sub_searches.append(("exams", search_exams))
+    if include_answers:
+        sub_searches.append(("answers", search_answers))
+    if include_comments:
+        sub_searches.append(("comments", search_comments))
+    found, complete = run_sub_searches(
+        sub_searches, (term, has_payed, is_admin, user_admin_categories, amount)
     )
+    exams, exams_time = found.get("exams", ([], 0))
+    answers, answers_time = found.get("answers", ([], 0))
+    comments, comments_time = found.get("comments", ([], 0))
+
     start_merge = time.time()
     res = []
     for exam in exams:
@@ -432,6 +594,9 @@ def search(request):
         comment["type"] = "comment"
         res.append(comment)
     res = sorted(res, key=lambda x: -x["rank"])
+    # Partial results are not cached
+    if complete:
+        search_cache.put(cache_key, res)
     end = time.time()
     if settings.DEBUG:
         logger.info(
@@ -443,9 +608,9 @@ def search(request):
         )
         logger.info(
             "Time spent: exams: {a} ms, answers: {b} ms, comments: {c} ms, sorting: {d} ms".format(
-                a=(answers_start - exams_start) * 1000,
-                b=(comments_start - answers_start) * 1000,
-                c=(start_merge - comments_start) * 1000,
+                a=exams_time * 1000,
+                b=answers_time * 1000,
+                c=comments_time * 1000,
                 d=(end - start_merge) * 1000,
             )
         )
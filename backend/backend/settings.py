@@ -73,6 +73,107 @@ COMSOL_DOCUMENT_SLUG_CHARS = (
     "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-"
 )
 
+# The exam, answer and comment searches run concurrently, each on its own db connection.
+# Sub-searches which are not done after COMSOL_SEARCH_TIMEOUT seconds are left out of the
+# result. Tests run inside a transaction which other connections can't see.
+COMSOL_SEARCH_CONCURRENT = (
+    os.environ.get("RUNTIME_SEARCH_CONCURRENT", "TRUE") != "FALSE" and not TESTING
+)
+COMSOL_SEARCH_WORKERS = int(os.environ.get("RUNTIME_SEARCH_WORKERS", "6"))
+COMSOL_SEARCH_TIMEOUT = float(os.environ.get("RUNTIME_SEARCH_TIMEOUT", "5"))
+COMSOL_SEARCH_MAX_PAGES_PER_EXAM = 5
+COMSOL_SEARCH_CACHE_SIZE = int(os.environ.get("RUNTIME_SEARCH_CACHE_SIZE", "1000"))
+COMSOL_SEARCH_CACHE_VALIDITY = int(os.environ.get("RUNTIME_SEARCH_CACHE_VALIDITY", "60"))
+
+# Notifications are returned in pages of COMSOL_NOTIFICATION_PAGE_SIZE, clients can ask
+# for up to COMSOL_NOTIFICATION_MAX_PAGE_SIZE. Unread counts are cached for
+# COMSOL_NOTIFICATION_UNREAD_COUNT_VALIDITY seconds and invalidated on changes.
+COMSOL_NOTIFICATION_PAGE_SIZE = int(os.environ.get("RUNTIME_NOTIFICATION_PAGE_SIZE", "50"))
+COMSOL_NOTIFICATION_MAX_PAGE_SIZE = 200
+COMSOL_NOTIFICATION_UNREAD_COUNT_VALIDITY = int(
+    os.environ.get("RUNTIME_NOTIFICATION_UNREAD_COUNT_VALIDITY", "600")
+)
+
+# Functions cached with util.func_cache keep at most COMSOL_FUNC_CACHE_SIZE entries each.
+# Shared functions use the "shared" cache. If RUNTIME_SHARED_CACHE_DIR is set it is stored
+# in that directory (e.g. in /dev/shm) and used by all workers of the container, otherwise
+# every process uses its own memory. Django's FileBasedCache lists the directory on every
+# set to decide whether to cull, SharedFileCache only does so on one in CULL_INTERVAL sets.
+COMSOL_FUNC_CACHE_SIZE = 1024
+COMSOL_FUNC_CACHE_BACKEND = "shared"
+SHARED_CACHE_DIR = os.environ.get("RUNTIME_SHARED_CACHE_DIR", "")
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "util.func_cache.SharedFileCache",
+        "LOCATION": SHARED_CACHE_DIR,
+        "OPTIONS": {"MAX_ENTRIES": 10000, "CULL_INTERVAL": 100},
+    }
+    if SHARED_CACHE_DIR
+    else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "shared",
+    },
+}
+
+# Uploaded exam PDFs are analyzed by the ingest_pdfs worker. A failed job is retried
+# after COMSOL_INGESTION_RETRY_DELAY * 2^(attempts - 1) seconds, at most
+# COMSOL_INGESTION_MAX_ATTEMPTS times. A job claimed by a worker which did not finish it
+# within COMSOL_INGESTION_LEASE seconds can be claimed again.
+COMSOL_INGESTION_MAX_ATTEMPTS = int(os.environ.get("RUNTIME_INGESTION_MAX_ATTEMPTS", "3"))
+COMSOL_INGESTION_RETRY_DELAY = int(os.environ.get("RUNTIME_INGESTION_RETRY_DELAY", "60"))
+COMSOL_INGESTION_LEASE = int(os.environ.get("RUNTIME_INGESTION_LEASE", "1800"))
+COMSOL_INGESTION_POLL_INTERVAL = float(
+    os.environ.get("RUNTIME_INGESTION_POLL_INTERVAL", "2")
+)
+
+# The S3 client keeps up to COMSOL_S3_MAX_POOL_CONNECTIONS connections open. Requests
+# are retried at most COMSOL_S3_MAX_ATTEMPTS times with COMSOL_S3_RETRY_MODE, timeouts
+# are in seconds.
+COMSOL_S3_MAX_POOL_CONNECTIONS = int(
+    os.environ.get("RUNTIME_S3_MAX_POOL_CONNECTIONS", "50")
+)
+COMSOL_S3_CONNECT_TIMEOUT = float(os.environ.get("RUNTIME_S3_CONNECT_TIMEOUT", "5"))
+COMSOL_S3_READ_TIMEOUT = float(os.environ.get("RUNTIME_S3_READ_TIMEOUT", "30"))
+COMSOL_S3_MAX_ATTEMPTS = int(os.environ.get("RUNTIME_S3_MAX_ATTEMPTS", "4"))
+COMSOL_S3_RETRY_MODE = os.environ.get("RUNTIME_S3_RETRY_MODE", "adaptive")
+
+# Uploads larger than COMSOL_S3_MULTIPART_THRESHOLD bytes are streamed to S3 with a
+# multipart upload in parts of COMSOL_S3_MULTIPART_CHUNKSIZE bytes (at least 5 MiB).
+COMSOL_S3_MULTIPART_THRESHOLD = int(
+    os.environ.get("RUNTIME_S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))
+)
+COMSOL_S3_MULTIPART_CHUNKSIZE = int(
+    os.environ.get("RUNTIME_S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024))
+)
+
+# Presigned URLs are valid for COMSOL_S3_PRESIGNED_URL_VALIDITY seconds and are reused
+# until COMSOL_S3_PRESIGNED_URL_MARGIN seconds before they expire.
+COMSOL_S3_PRESIGNED_URL_VALIDITY = int(
+    os.environ.get("RUNTIME_S3_PRESIGNED_URL_VALIDITY", str(60 * 60 * 24))
+)
+COMSOL_S3_PRESIGNED_URL_MARGIN = int(
+    os.environ.get("RUNTIME_S3_PRESIGNED_URL_MARGIN", str(60 * 60))
+)
+
+# Images, attachments and document files are sent with a delivery mode ("proxy",
+# "redirect" or "accel"), see util.s3_util.send_file. For "accel" the reverse proxy has
+# to forward the internal location COMSOL_S3_ACCEL_REDIRECT_LOCATION to the S3
+# endpoint, e.g. for nginx
+#   location /internal-s3/ { internal; proxy_pass http://<s3 host>:<s3 port>/; }
+# Files which are never replaced may be cached for COMSOL_S3_FILE_MAX_AGE seconds.
+COMSOL_IMAGE_DELIVERY = os.environ.get("RUNTIME_IMAGE_DELIVERY", "redirect")
+COMSOL_FILESTORE_DELIVERY = os.environ.get("RUNTIME_FILESTORE_DELIVERY", "redirect")
+COMSOL_DOCUMENT_DELIVERY = os.environ.get("RUNTIME_DOCUMENT_DELIVERY", "redirect")
+COMSOL_S3_ACCEL_REDIRECT_LOCATION = os.environ.get(
+    "RUNTIME_S3_ACCEL_REDIRECT_LOCATION", "/internal-s3/"
+)
+COMSOL_S3_FILE_MAX_AGE = int(
+    os.environ.get("RUNTIME_S3_FILE_MAX_AGE", str(60 * 60 * 24 * 30))
+)
+
 COMSOL_FRONTEND_GLOB_ID = os.environ.get(
     "FRONTEND_GLOB_ID", "") or "vseth-1116-vis"
 
@@ -125,6 +226,14 @@ OIDC_JWKS_URL = (
     )
 )
 
+# The key set is refreshed in the background every COMSOL_JWKS_REFRESH_INTERVAL seconds.
+# Fetches are at least COMSOL_JWKS_RETRY_DELAY seconds apart, failures double the delay
+# up to COMSOL_JWKS_MAX_RETRY_DELAY seconds.
+COMSOL_JWKS_REFRESH_INTERVAL = int(os.environ.get("RUNTIME_JWKS_REFRESH_INTERVAL", "300"))
+COMSOL_JWKS_TIMEOUT = float(os.environ.get("RUNTIME_JWKS_TIMEOUT", "5"))
+COMSOL_JWKS_RETRY_DELAY = float(os.environ.get("RUNTIME_JWKS_RETRY_DELAY", "10"))
+COMSOL_JWKS_MAX_RETRY_DELAY = float(os.environ.get("RUNTIME_JWKS_MAX_RETRY_DELAY", "300"))
+
 JWT_VERIFY_SIGNATURE = (
     os.environ.get("RUNTIME_JWT_VERIFY_SIGNATURE",
                    "TRUE") != "FALSE" or not DEBUG
@@ -133,6 +242,22 @@ JWT_RESOURCE_GROUP = (
     "group" if TESTING else os.environ.get("SIP_AUTH_OIDC_CLIENT_ID", "")
 )
 
+# Verified tokens are cached by their hash until they expire, but at most for
+# COMSOL_AUTH_TOKEN_CACHE_VALIDITY seconds. The users of subs are cached for
+# COMSOL_AUTH_USER_CACHE_VALIDITY seconds. Changed names are written to the database
+# by a background thread if COMSOL_AUTH_SYNC_IN_BACKGROUND is set.
+COMSOL_AUTH_CACHE = os.environ.get("RUNTIME_AUTH_CACHE", "TRUE") != "FALSE" and not TESTING
+COMSOL_AUTH_CACHE_SIZE = int(os.environ.get("RUNTIME_AUTH_CACHE_SIZE", "10000"))
+COMSOL_AUTH_TOKEN_CACHE_VALIDITY = int(
+    os.environ.get("RUNTIME_AUTH_TOKEN_CACHE_VALIDITY", "300")
+)
+COMSOL_AUTH_USER_CACHE_VALIDITY = int(
+    os.environ.get("RUNTIME_AUTH_USER_CACHE_VALIDITY", "300")
+)
+COMSOL_AUTH_SYNC_IN_BACKGROUND = (
+    os.environ.get("RUNTIME_AUTH_SYNC_IN_BACKGROUND", "TRUE") != "FALSE" and not TESTING
+)
+
 CNAMES = os.environ.get("SIP_INGRESS_HTTP_DEFAULT_CNAMES", "")
 PRIMARY_DEPLOYMENT_DOMAIN = os.environ.get(
     "SIP_INGRESS_HTTP_DEFAULT_DEPLOYMENT_DOMAIN", ""
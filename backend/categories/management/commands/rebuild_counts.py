@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+# (table, view, key column, counted columns)
+COUNT_TABLES = [
+    (
+        "categories_examcounts",
+        "categories_examcounts_view",
+        "exam_id",
+        ["count_cuts", "count_answered", "total_cuts", "answered_cuts"],
+    ),
+    (
+        "categories_categorymetadata",
+        "categories_categorymetadata_view",
+        "category_id",
+        [
+            "documentcount",
+            "examcount_public",
+            "examcount_answered",
+            "total_cuts",
+            "answered_cuts",
+        ],
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the categories_examcounts and categories_categorymetadata tables from "
+        "scratch using their views, or only compares them with --check"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report exams and categories whose counts differ from the views",
+        )
+
+    def check_counts(self, cursor, table, view, key, columns):
+        differs = " OR ".join(
+            "t.{col} IS DISTINCT FROM v.{col}".format(col=col) for col in columns
+        )
+        cursor.execute(
+            """
+            SELECT v.{key}, {table_cols}, {view_cols}
+            FROM {view} v
+            LEFT JOIN {table} t ON (t.{key} = v.{key})
+            WHERE {differs}
+            ORDER BY v.{key}
+            """.format(
+                key=key,
+                table=table,
+                view=view,
+                table_cols=", ".join("t." + col for col in columns),
+                view_cols=", ".join("v." + col for col in columns),
+                differs=differs,
+            )
+        )
+        return cursor.fetchall()
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options["check"]:
+                count = 0
+                for table, view, key, columns in COUNT_TABLES:
+                    mismatches = self.check_counts(cursor, table, view, key, columns)
+                    for row in mismatches:
+                        self.stdout.write(
+                            "{} {}: table {} != view {}".format(
+                                table,
+                                row[0],
+                                dict(zip(columns, row[1 : len(columns) + 1])),
+                                dict(zip(columns, row[len(columns) + 1 :])),
+                            )
+                        )
+                    count += len(mismatches)
+                if count:
+                    raise CommandError("{} rows have wrong counts".format(count))
+                self.stdout.write("Counts are consistent")
+                return
+
+            # Blocks the triggers from applying deltas while we rebuild
+            cursor.execute(
+                "LOCK TABLE categories_examcounts, categories_categorymetadata "
+                "IN EXCLUSIVE MODE"
+            )
+            for table, view, key, columns in COUNT_TABLES:
+                cursor.execute("DELETE FROM {}".format(table))
+                cursor.execute(
+                    """
+                    INSERT INTO {table} (id, {key}, {cols})
+                    SELECT id, {key}, {cols} FROM {view}
+                    """.format(table=table, view=view, key=key, cols=", ".join(columns))
+                )
+                self.stdout.write("Rebuilt {} rows of {}".format(cursor.rowcount, table))
@@ -0,0 +1,392 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Replaces the categories_categorymetadata and categories_examcounts views by tables
+    which are kept up to date by triggers, so reading them no longer depends on the
+    number of answers. The old views stay available with a _view suffix, they are used
+    by the rebuild_counts command to rebuild and check the tables.
+
+    Besides the counts of the old view, categories_examcounts stores the number of
+    sections with answers enabled (total_cuts) and how many of them are answered
+    (answered_cuts). These are the values the exam contributes to its category if it
+    is public.
+    """
+
+    dependencies = [
+        ("categories", "0012_add_document_count_to_meta"),
+        ("answers", "0016_remove_exam_finished_wiki_transfer_and_more"),
+        ("documents", "0014_document_edittime_document_time"),
+    ]
+
+    exam_counts_view = """
+    CREATE VIEW categories_examcounts_view (id, exam_id, count_cuts, count_answered, total_cuts, answered_cuts) AS
+        SELECT ae.id as id,
+            ae.id AS exam_id,
+            (SELECT COUNT(*) FROM answers_answersection aas WHERE (aas.exam_id = ae.id)),
+            (SELECT COUNT(*) FROM answers_answersection aas WHERE (aas.exam_id = ae.id AND EXISTS (
+                SELECT aa.id FROM answers_answer aa WHERE aa.answer_section_id = aas.id
+            ))),
+            (SELECT COUNT(*) FROM answers_answersection aas WHERE (aas.exam_id = ae.id AND aas.has_answers = true)),
+            (SELECT COUNT(*) FROM answers_answersection aas WHERE (aas.exam_id = ae.id AND aas.has_answers = true AND EXISTS (
+                SELECT aa.id FROM answers_answer aa WHERE aa.answer_section_id = aas.id
+            )))
+        FROM answers_exam ae
+    ;
+    """
+
+    metadata_view = """
+    CREATE VIEW categories_categorymetadata_view (id, category_id, documentcount, examcount_public, examcount_answered, total_cuts, answered_cuts) AS
+        SELECT cc.id as id,
+            cc.id AS category_id,
+            (SELECT COUNT(*) FROM documents_document dd WHERE (dd.category_id = cc.id)),
+            (SELECT COUNT(*) FROM answers_exam ae WHERE (ae.category_id = cc.id AND ae.public = true)),
+            (SELECT COUNT(*) FROM answers_exam ae WHERE (ae.category_id = cc.id AND ae.public=true AND EXISTS (
+                SELECT aa.id FROM answers_answer aa INNER JOIN answers_answersection aas ON (aa.answer_section_id = aas.id) WHERE aas.exam_id = ae.id
+            ))),
+            (SELECT COUNT(*) FROM answers_answersection aas INNER JOIN answers_exam ae ON (aas.exam_id = ae.id) WHERE (ae.category_id = cc.id AND ae.public = true AND aas.has_answers = true)),
+            (SELECT COUNT(*) FROM answers_answersection aas INNER JOIN answers_exam ae ON (aas.exam_id = ae.id) WHERE (ae.category_id = cc.id AND ae.public = true AND aas.has_answers = true AND EXISTS (
+                SELECT aa.id FROM answers_answer aa WHERE aa.answer_section_id = aas.id
+            )))
+        FROM categories_category cc
+    ;
+    """
+
+    # The views as they were before this migration, restored when migrating backwards
+    old_views = """
+    CREATE VIEW categories_examcounts (id, exam_id, count_cuts, count_answered) AS
+        SELECT row_number() OVER () as id,
+            ae.id AS exam_id,
+            (SELECT COUNT(*) FROM answers_answersection aas WHERE (aas.exam_id = ae.id)),
+            (SELECT COUNT(*) FROM answers_answersection aas WHERE (aas.exam_id = ae.id AND EXISTS (
+                SELECT aa.id FROM answers_answer aa WHERE aa.answer_section_id = aas.id
+            )))
+        FROM answers_exam ae
+    ;
+    CREATE VIEW categories_categorymetadata (id, category_id, documentcount, examcount_public, examcount_answered, total_cuts, answered_cuts) AS
+        SELECT row_number() OVER () as id,
+            cc.id AS category_id,
+            (SELECT COUNT(*) FROM documents_document dd WHERE (dd.category_id = cc.id)),
+            (SELECT COUNT(*) FROM answers_exam ae WHERE (ae.category_id = cc.id AND ae.public = true)),
+            (SELECT COUNT(*) FROM answers_exam ae WHERE (ae.category_id = cc.id AND ae.public=true AND EXISTS (
+                SELECT aa.id FROM answers_answer aa INNER JOIN answers_answersection aas ON (aa.answer_section_id = aas.id) WHERE aas.exam_id = ae.id
+            ))),
+            (SELECT COUNT(*) FROM answers_answersection aas INNER JOIN answers_exam ae ON (aas.exam_id = ae.id) WHERE (ae.category_id = cc.id AND ae.public = true AND aas.has_answers = true)),
+            (SELECT COUNT(*) FROM answers_answersection aas INNER JOIN answers_exam ae ON (aas.exam_id = ae.id) WHERE (ae.category_id = cc.id AND ae.public = true AND aas.has_answers = true AND EXISTS (
+                SELECT aa.id FROM answers_answer aa WHERE aa.answer_section_id = aas.id
+            )))
+        FROM categories_category cc
+    ;
+    """
+
+    tables = """
+    CREATE TABLE categories_examcounts (
+        id integer PRIMARY KEY,
+        exam_id integer NOT NULL UNIQUE REFERENCES answers_exam (id) ON DELETE CASCADE,
+        count_cuts integer NOT NULL DEFAULT 0,
+        count_answered integer NOT NULL DEFAULT 0,
+        total_cuts integer NOT NULL DEFAULT 0,
+        answered_cuts integer NOT NULL DEFAULT 0
+    );
+    INSERT INTO categories_examcounts
+        (id, exam_id, count_cuts, count_answered, total_cuts, answered_cuts)
+    SELECT id, exam_id, count_cuts, count_answered, total_cuts, answered_cuts
+    FROM categories_examcounts_view;
+
+    CREATE TABLE categories_categorymetadata (
+        id integer PRIMARY KEY,
+        category_id integer NOT NULL UNIQUE REFERENCES categories_category (id) ON DELETE CASCADE,
+        documentcount integer NOT NULL DEFAULT 0,
+        examcount_public integer NOT NULL DEFAULT 0,
+        examcount_answered integer NOT NULL DEFAULT 0,
+        total_cuts integer NOT NULL DEFAULT 0,
+        answered_cuts integer NOT NULL DEFAULT 0
+    );
+    INSERT INTO categories_categorymetadata
+        (id, category_id, documentcount, examcount_public, examcount_answered, total_cuts, answered_cuts)
+    SELECT id, category_id, documentcount, examcount_public, examcount_answered, total_cuts, answered_cuts
+    FROM categories_categorymetadata_view;
+    """
+
+    triggers = """
+    CREATE FUNCTION categories_update_meta(
+        cid integer,
+        d_documentcount integer DEFAULT 0,
+        d_examcount_public integer DEFAULT 0,
+        d_examcount_answered integer DEFAULT 0,
+        d_total_cuts integer DEFAULT 0,
+        d_answered_cuts integer DEFAULT 0
+    ) RETURNS void AS $$
+    BEGIN
+        UPDATE categories_categorymetadata SET
+            documentcount = documentcount + d_documentcount,
+            examcount_public = examcount_public + d_examcount_public,
+            examcount_answered = examcount_answered + d_examcount_answered,
+            total_cuts = total_cuts + d_total_cuts,
+            answered_cuts = answered_cuts + d_answered_cuts
+        WHERE category_id = cid;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION categories_category_trigger() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO categories_categorymetadata (id, category_id) VALUES (NEW.id, NEW.id);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER categories_category_trigger
+    AFTER INSERT ON categories_category
+    FOR EACH ROW EXECUTE PROCEDURE categories_category_trigger();
+
+    CREATE FUNCTION categories_document_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            IF OLD.category_id IS NOT DISTINCT FROM NEW.category_id THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM categories_update_meta(OLD.category_id, d_documentcount => -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            PERFORM categories_update_meta(NEW.category_id, d_documentcount => 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER categories_document_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF category_id ON documents_document
+    FOR EACH ROW EXECUTE PROCEDURE categories_document_trigger();
+
+    -- Applies the counts of an exam with the given sign to its category,
+    -- only public exams are counted
+    CREATE FUNCTION categories_exam_update(
+        eid integer, cid integer, is_public boolean, sign integer
+    ) RETURNS void AS $$
+    BEGIN
+        IF is_public THEN
+            PERFORM categories_update_meta(
+                cid,
+                d_examcount_public => sign,
+                d_examcount_answered => sign * (ec.count_answered > 0)::integer,
+                d_total_cuts => sign * ec.total_cuts,
+                d_answered_cuts => sign * ec.answered_cuts
+            )
+            FROM categories_examcounts ec WHERE ec.exam_id = eid;
+        END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION categories_exam_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO categories_examcounts (id, exam_id) VALUES (NEW.id, NEW.id);
+            PERFORM categories_exam_update(NEW.id, NEW.category_id, NEW.public, 1);
+            RETURN NULL;
+        END IF;
+        IF OLD.public = NEW.public AND OLD.category_id IS NOT DISTINCT FROM NEW.category_id THEN
+            RETURN NULL;
+        END IF;
+        PERFORM categories_exam_update(OLD.id, OLD.category_id, OLD.public, -1);
+        PERFORM categories_exam_update(NEW.id, NEW.category_id, NEW.public, 1);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER categories_exam_trigger
+    AFTER INSERT OR UPDATE OF public, category_id ON answers_exam
+    FOR EACH ROW EXECUTE PROCEDURE categories_exam_trigger();
+
+    -- This has to run before the exam counts are removed by the cascade
+    CREATE FUNCTION categories_exam_delete_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM categories_exam_update(OLD.id, OLD.category_id, OLD.public, -1);
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER categories_exam_delete_trigger
+    BEFORE DELETE ON answers_exam
+    FOR EACH ROW EXECUTE PROCEDURE categories_exam_delete_trigger();
+
+    CREATE FUNCTION categories_update_exam_counts(
+        eid integer,
+        d_count_cuts integer DEFAULT 0,
+        d_count_answered integer DEFAULT 0,
+        d_total_cuts integer DEFAULT 0,
+        d_answered_cuts integer DEFAULT 0
+    ) RETURNS void AS $$
+    DECLARE
+        exam record;
+    BEGIN
+        SELECT ae.category_id, ae.public INTO exam FROM answers_exam ae WHERE ae.id = eid;
+        PERFORM categories_exam_update(eid, exam.category_id, exam.public, -1);
+        UPDATE categories_examcounts SET
+            count_cuts = count_cuts + d_count_cuts,
+            count_answered = count_answered + d_count_answered,
+            total_cuts = total_cuts + d_total_cuts,
+            answered_cuts = answered_cuts + d_answered_cuts
+        WHERE exam_id = eid;
+        PERFORM categories_exam_update(eid, exam.category_id, exam.public, 1);
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Applies the counts of an answer section with the given sign to its exam
+    CREATE FUNCTION categories_answersection_update(
+        sid integer, eid integer, has_answers boolean, sign integer
+    ) RETURNS void AS $$
+    DECLARE
+        answered integer := (
+            EXISTS (SELECT 1 FROM answers_answer aa WHERE aa.answer_section_id = sid)
+        )::integer;
+    BEGIN
+        PERFORM categories_update_exam_counts(
+            eid,
+            d_count_cuts => sign,
+            d_count_answered => sign * answered,
+            d_total_cuts => sign * has_answers::integer,
+            d_answered_cuts => sign * has_answers::integer * answered
+        );
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION categories_answersection_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            IF OLD.exam_id = NEW.exam_id AND OLD.has_answers = NEW.has_answers THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM categories_answersection_update(OLD.id, OLD.exam_id, OLD.has_answers, -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            PERFORM categories_answersection_update(NEW.id, NEW.exam_id, NEW.has_answers, 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER categories_answersection_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF exam_id, has_answers ON answers_answersection
+    FOR EACH ROW EXECUTE PROCEDURE categories_answersection_trigger();
+
+    -- Called after `changed` answers were added to (sign 1) or removed from (sign -1)
+    -- a section by one statement. Only the first added and the last removed answer
+    -- change whether the section is answered. The section row is locked so that
+    -- concurrent transactions see each others answers when counting them.
+    CREATE FUNCTION categories_answers_changed(
+        sid integer, changed bigint, sign integer
+    ) RETURNS void AS $$
+    DECLARE
+        section record;
+        remaining bigint;
+    BEGIN
+        SELECT aas.exam_id, aas.has_answers INTO section
+        FROM answers_answersection aas WHERE aas.id = sid
+        FOR NO KEY UPDATE;
+        IF NOT FOUND THEN
+            RETURN;
+        END IF;
+        SELECT COUNT(*) INTO remaining FROM answers_answer aa WHERE aa.answer_section_id = sid;
+        IF (sign = 1 AND remaining = changed) OR (sign = -1 AND remaining = 0) THEN
+            PERFORM categories_update_exam_counts(
+                section.exam_id,
+                d_count_answered => sign,
+                d_answered_cuts => sign * section.has_answers::integer
+            );
+        END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- The answer triggers are statement level triggers, as row level triggers would
+    -- all see the final number of answers if a statement changes multiple answers
+    -- of the same section.
+    CREATE FUNCTION categories_answer_insert_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM categories_answers_changed(na.answer_section_id, COUNT(*), 1)
+        FROM new_answers na GROUP BY na.answer_section_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION categories_answer_delete_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM categories_answers_changed(oa.answer_section_id, COUNT(*), -1)
+        FROM old_answers oa GROUP BY oa.answer_section_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION categories_answer_update_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM categories_answers_changed(oa.answer_section_id, COUNT(*), -1)
+        FROM old_answers oa INNER JOIN new_answers na ON (na.id = oa.id)
+        WHERE na.answer_section_id <> oa.answer_section_id
+        GROUP BY oa.answer_section_id;
+        PERFORM categories_answers_changed(na.answer_section_id, COUNT(*), 1)
+        FROM old_answers oa INNER JOIN new_answers na ON (na.id = oa.id)
+        WHERE na.answer_section_id <> oa.answer_section_id
+        GROUP BY na.answer_section_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER categories_answer_insert_trigger
+    AFTER INSERT ON answers_answer
+    REFERENCING NEW TABLE AS new_answers
+    FOR EACH STATEMENT EXECUTE PROCEDURE categories_answer_insert_trigger();
+
+    CREATE TRIGGER categories_answer_delete_trigger
+    AFTER DELETE ON answers_answer
+    REFERENCING OLD TABLE AS old_answers
+    FOR EACH STATEMENT EXECUTE PROCEDURE categories_answer_delete_trigger();
+
+    CREATE TRIGGER categories_answer_update_trigger
+    AFTER UPDATE ON answers_answer
+    REFERENCING OLD TABLE AS old_answers NEW TABLE AS new_answers
+    FOR EACH STATEMENT EXECUTE PROCEDURE categories_answer_update_trigger();
+    """
+
+    reverse_triggers = """
+    DROP TRIGGER IF EXISTS categories_answer_update_trigger ON answers_answer;
+    DROP TRIGGER IF EXISTS categories_answer_delete_trigger ON answers_answer;
+    DROP TRIGGER IF EXISTS categories_answer_insert_trigger ON answers_answer;
+    DROP TRIGGER IF EXISTS categories_answersection_trigger ON answers_answersection;
+    DROP TRIGGER IF EXISTS categories_exam_delete_trigger ON answers_exam;
+    DROP TRIGGER IF EXISTS categories_exam_trigger ON answers_exam;
+    DROP TRIGGER IF EXISTS categories_document_trigger ON documents_document;
+    DROP TRIGGER IF EXISTS categories_category_trigger ON categories_category;
+    DROP FUNCTION IF EXISTS categories_answer_update_trigger();
+    DROP FUNCTION IF EXISTS categories_answer_delete_trigger();
+    DROP FUNCTION IF EXISTS categories_answer_insert_trigger();
+    DROP FUNCTION IF EXISTS categories_answers_changed(integer, bigint, integer);
+    DROP FUNCTION IF EXISTS categories_answersection_trigger();
+    DROP FUNCTION IF EXISTS categories_answersection_update(integer, integer, boolean, integer);
+    DROP FUNCTION IF EXISTS categories_update_exam_counts(integer, integer, integer, integer, integer);
+    DROP FUNCTION IF EXISTS categories_exam_delete_trigger();
+    DROP FUNCTION IF EXISTS categories_exam_trigger();
+    DROP FUNCTION IF EXISTS categories_exam_update(integer, integer, boolean, integer);
+    DROP FUNCTION IF EXISTS categories_document_trigger();
+    DROP FUNCTION IF EXISTS categories_category_trigger();
+    DROP FUNCTION IF EXISTS categories_update_meta(integer, integer, integer, integer, integer, integer);
+    """
+
+    operations = [
+        migrations.RunSQL(
+            "DROP VIEW categories_categorymetadata; DROP VIEW categories_examcounts;"
+            + exam_counts_view
+            + metadata_view,
+            reverse_sql="DROP VIEW IF EXISTS categories_categorymetadata_view;"
+            "DROP VIEW IF EXISTS categories_examcounts_view;",
+        ),
+        migrations.RunSQL(
+            tables,
+            reverse_sql="DROP TABLE IF EXISTS categories_categorymetadata;"
+            "DROP TABLE IF EXISTS categories_examcounts;" + old_views,
+        ),
+        migrations.RunSQL(triggers, reverse_sql=reverse_triggers),
+    ]
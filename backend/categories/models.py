@@ -31,6 +31,11 @@ class Category(models.Model):
 
 
 class CategoryMetaData(models.Model):
+    """
+    Counters of a category, kept up to date by database triggers.
+    See categories/migrations/0013_counts_tables.py.
+    """
+
     category = models.OneToOneField(
         "Category", related_name="meta", on_delete=models.DO_NOTHING
     )
@@ -45,6 +50,11 @@ class CategoryMetaData(models.Model):
 
 
 class ExamCounts(models.Model):
+    """
+    Counters of an exam, kept up to date by database triggers.
+    See categories/migrations/0013_counts_tables.py.
+    """
+
     exam = models.OneToOneField(
         "answers.Exam", related_name="counts", on_delete=models.DO_NOTHING
     )
@@ -1,6 +1,10 @@
-from answers.models import Exam
+from io import StringIO
+
+from django.core.management import call_command
+
+from answers.models import Answer, Exam
 from myauth.models import MyUser
-from testing.tests import ComsolTest, ComsolTestExamsData
+from testing.tests import ComsolTest, ComsolTestExamData, ComsolTestExamsData
 from categories.models import Category, MetaCategory
 
 
@@ -147,6 +151,76 @@ class TestListExams(ComsolTestExamsData):
         self.assertTrue(res[2]['public'])
 
 
+class TestCounts(ComsolTestExamData):
+
+    add_comments = False
+
+    def get_meta(self, slug='TestCategory'):
+        res = self.get('/api/category/listwithmeta/')['value']
+        return next(cat for cat in res if cat['slug'] == slug)
+
+    def get_counts(self):
+        res = self.get('/api/category/listexams/TestCategory/')['value']
+        return res[0]['count_cuts'], res[0]['count_answered']
+
+    def check_counts(self):
+        call_command('rebuild_counts', '--check', stdout=StringIO())
+
+    def test_counts(self):
+        meta = self.get_meta()
+        self.assertEqual(meta['examcountpublic'], 1)
+        self.assertEqual(meta['examcountanswered'], 1)
+        self.assertEqual(meta['answerprogress'], 1)
+        self.assertEqual(self.get_counts(), (4, 4))
+        self.check_counts()
+
+        Answer.objects.filter(answer_section=self.sections[0]).delete()
+        self.assertEqual(self.get_counts(), (4, 3))
+        self.assertEqual(self.get_meta()['answerprogress'], 0.75)
+        self.check_counts()
+
+        self.sections[1].has_answers = False
+        self.sections[1].save()
+        self.assertEqual(self.get_counts(), (4, 3))
+        self.assertEqual(self.get_meta()['answerprogress'], 2 / 3)
+        self.check_counts()
+
+        Answer.objects.bulk_create([
+            Answer(answer_section=self.sections[0], author=self.get_my_user(), text='New {}'.format(i))
+            for i in range(2)
+        ])
+        self.assertEqual(self.get_counts(), (4, 4))
+        self.assertEqual(self.get_meta()['answerprogress'], 1)
+        self.check_counts()
+
+        self.sections[2].delete()
+        self.assertEqual(self.get_counts(), (3, 3))
+        self.check_counts()
+
+    def test_exam_changes(self):
+        self.exam.public = False
+        self.exam.save()
+        meta = self.get_meta()
+        self.assertEqual(meta['examcountpublic'], 0)
+        self.assertEqual(meta['answerprogress'], 0)
+        self.check_counts()
+
+        self.exam.public = True
+        self.exam.category = Category.objects.get(slug='default')
+        self.exam.save()
+        self.assertEqual(self.get_meta()['examcountpublic'], 0)
+        meta = self.get_meta('default')
+        self.assertEqual(meta['examcountpublic'], 1)
+        self.assertEqual(meta['examcountanswered'], 1)
+        self.check_counts()
+
+        self.exam.delete()
+        self.assertEqual(self.get_meta('default')['examcountpublic'], 0)
+        self.check_counts()
+        call_command('rebuild_counts', stdout=StringIO())
+        self.check_counts()
+
+
 class TestMetaCategories(ComsolTest):
 
     def mySetUp(self):
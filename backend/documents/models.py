@@ -25,7 +25,7 @@ class Document(ExportModelOperationsMixin("document"), models.Model):
 
     def current_user_can_delete(self, request):
         is_admin = auth_check.has_admin_rights_for_document(request, self)
-        is_owner = self.author.pk == request.user.pk
+        is_owner = self.author_id == request.user.pk
         return is_admin or is_owner
 
     def current_user_can_edit(self, request):
@@ -65,11 +65,11 @@ class Comment(ExportModelOperationsMixin("document_comment"), CommentMixin):
 
     def current_user_can_delete(self, request):
         is_admin = auth_check.has_admin_rights_for_document(request, self.document)
-        is_owner = self.author.pk == request.user.pk
+        is_owner = self.author_id == request.user.pk
         return is_admin or is_owner
 
     def current_user_can_edit(self, request):
-        is_owner = self.author.pk == request.user.pk
+        is_owner = self.author_id == request.user.pk
         return is_owner
 
 
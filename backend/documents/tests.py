@@ -0,0 +1,89 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from categories.models import Category
+from documents.models import Comment, Document, DocumentFile, DocumentType
+from myauth.models import MyUser
+from testing.tests import ComsolTest, get_token
+
+
+class TestDocumentQueries(ComsolTest):
+
+    loginUser = 2
+
+    def mySetUp(self):
+        self.category = Category(displayname="Test Category", slug="TestCategory")
+        self.category.save()
+        self.authors = []
+        for i in range(3):
+            author = MyUser(username="author{}".format(i), first_name="Author")
+            author.save()
+            self.authors.append(author)
+        self.documents = []
+
+    def add_documents(self, count):
+        for i in range(count):
+            author = self.authors[len(self.documents) % len(self.authors)]
+            document = Document(
+                display_name="Document {}".format(len(self.documents)),
+                category=self.category,
+                author=author,
+                document_type=DocumentType.objects.get(display_name="Documents"),
+            )
+            document.save()
+            document.likes.add(*self.authors[:2])
+            for author in self.authors:
+                Comment(document=document, author=author, text="Comment").save()
+            DocumentFile(
+                document=document,
+                display_name="File",
+                filename="{}.pdf".format(document.slug),
+                mime_type="application/pdf",
+            ).save()
+            self.documents.append(document)
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, HTTP_AUTHORIZATION=get_token(self.user))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()["value"]
+
+    def test_list_flat(self):
+        path = "/api/document/?category=TestCategory&include_comments&include_files"
+        self.add_documents(2)
+        few, res = self.count_queries(path)
+        self.assertEqual(len(res), 2)
+        self.add_documents(20)
+        many, res = self.count_queries(path)
+        self.assertEqual(len(res), 22)
+        self.assertEqual(few, many)
+        for document in res:
+            self.assertEqual(document["like_count"], 2)
+            self.assertEqual(len(document["comments"]), 3)
+            self.assertEqual(document["comments"][0]["authorDisplayName"], "Author ")
+            self.assertEqual(len(document["files"]), 1)
+            self.assertFalse(document["can_edit"])
+
+    def test_liked_by(self):
+        self.add_documents(2)
+        user = self.get_my_user()
+        self.documents[0].likes.add(user)
+        _, res = self.count_queries(
+            "/api/document/?liked_by={}".format(user.username)
+        )
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]["like_count"], 3)
+        self.assertTrue(res[0]["liked"])
+
+    def test_element_flat(self):
+        self.add_documents(1)
+        document = self.documents[0]
+        path = "/api/document/{}/{}/?include_comments&include_files".format(
+            document.author.username, document.slug
+        )
+        few, res = self.count_queries(path)
+        for i in range(10):
+            Comment(document=document, author=self.authors[0], text="More").save()
+        many, res = self.count_queries(path)
+        self.assertEqual(len(res["comments"]), 13)
+        self.assertEqual(few, many)
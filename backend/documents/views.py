@@ -4,7 +4,7 @@ from typing import Union
 
 from categories.models import Category
 from django.conf import settings
-from django.db.models import Count, Q
+from django.db.models import Count, Prefetch, Q
 from django.http import HttpRequest
 from django.http.response import HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
@@ -13,7 +13,7 @@ from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from myauth import auth_check
 from myauth.models import MyUser, get_my_user
-from util import s3_util, response
+from util import ids, s3_util, response
 
 from documents.models import Comment, Document, DocumentType, DocumentFile, generate_api_key
 from notifications import notification_util
@@ -54,6 +54,7 @@ def get_document_obj(
     include_comments: bool = False,
     include_files: bool = False,
 ):
+    can_edit = document.current_user_can_edit(request)
     obj = {
         "slug": document.slug,
         "display_name": document.display_name,
@@ -63,7 +64,7 @@ def get_document_obj(
         "category_display_name": document.category.displayname,
         "author": document.author.username,
         "author_displayname": get_my_user(document.author).displayname(),
-        "can_edit": document.current_user_can_edit(request),
+        "can_edit": can_edit,
         "can_delete": document.current_user_can_delete(request),
         "time": document.time,
         "edittime": document.edittime,
@@ -72,7 +73,7 @@ def get_document_obj(
         obj["like_count"] = document.like_count
     if hasattr(document, "liked"):
         obj["liked"] = document.liked
-    if document.current_user_can_edit(request):
+    if can_edit:
         obj["api_key"] = document.api_key
 
     if include_comments:
@@ -86,10 +87,40 @@ def get_document_obj(
     return obj
 
 
+def get_documents_queryset(
+    request: HttpRequest, include_comments: bool, include_files: bool
+):
+    """
+    Returns the documents with everything `get_document_obj` needs, so that any number
+    of them is serialized with a fixed number of queries: one for the documents with
+    their category, type, author and likes, and one each for the comments and the files
+    if they are included. The permissions are resolved once per request by
+    `auth_check.get_permissions`.
+
+    Filters have to be applied to the returned queryset, as filters on the likes would
+    otherwise change the counts.
+    """
+    objects = Document.objects.select_related("category", "document_type", "author").annotate(
+        like_count=like_count,
+        liked=user_liked(request),
+    )
+    if include_comments:
+        objects = objects.prefetch_related(
+            Prefetch("comments", queryset=Comment.objects.select_related("author"))
+        )
+    if include_files:
+        objects = objects.prefetch_related("files")
+    return objects
+
+
 def is_allowed(ext: str, mime_type: str):
     return (ext, mime_type) in settings.COMSOL_DOCUMENT_ALLOWED_EXTENSIONS
 
 
+def generate_document_filename(ext: str):
+    return s3_util.generate_filename(16, ext)
+
+
 def prepare_document_file(request: HttpRequest, override_allowed=False):
     file = request.FILES.get("file")
     if not file:
@@ -112,10 +143,9 @@ class DocumentRootView(View):
 
     @auth_check.require_login
     def get(self, request: HttpRequest):
-        objects = Document.objects.annotate(
-            like_count=like_count,
-            liked=user_liked(request),
-        ).prefetch_related("category", "author")
+        include_comments = "include_comments" in request.GET
+        include_files = "include_files" in request.GET
+        objects = get_documents_queryset(request, include_comments, include_files)
 
         liked_by = request.GET.get("liked_by")
         username = request.GET.get("username")
@@ -138,18 +168,9 @@ class DocumentRootView(View):
         else:  # if nothing is given, we return an empty result instead of giving back everything
             return response.success(value=[])
 
-        include_comments = "include_comments" in request.GET
-        if include_comments:
-            objects = objects.prefetch_related("comments", "comments__author")
-
-        include_files = "include_files" in request.GET
-        if include_files:
-            objects = objects.prefetch_related("files")
-
         res = [
-            get_document_obj(document, request,
-                             include_comments, include_files)
-            for document in objects.all()
+            get_document_obj(document, request, include_comments, include_files)
+            for document in objects
         ]
         return response.success(value=res)
 
@@ -179,18 +200,9 @@ class DocumentElementView(View):
 
     @auth_check.require_login
     def get(self, request: HttpRequest, username: str, slug: str):
-        objects = Document.objects.prefetch_related("category", "author").annotate(
-            like_count=like_count,
-            liked=user_liked(request),
-        )
         include_comments = "include_comments" in request.GET
-        if include_comments:
-            objects = objects.prefetch_related("comments", "comments__author")
-
         include_files = "include_files" in request.GET
-        if include_files:
-            objects = objects.prefetch_related("files")
-
+        objects = get_documents_queryset(request, include_comments, include_files)
         document = get_object_or_404(
             objects, author__username=username, slug=slug)
 
@@ -270,7 +282,7 @@ class DocumentCommentRootView(View):
         document = get_object_or_404(
             Document, author__username=username, slug=document_slug
         )
-        objects = Comment.objects.filter(document=document).all()
+        objects = Comment.objects.filter(document=document).select_related("author")
         return response.success(
             value=[get_comment_obj(comment, request) for comment in objects]
         )
@@ -364,18 +376,21 @@ class DocumentFileRootView(View):
         if err is not None:
             return err
 
-        filename = s3_util.generate_filename(
-            16, settings.COMSOL_DOCUMENT_DIR, ext)
         document_file = DocumentFile(
             display_name=request.POST["display_name"],
             document=document,
-            filename=filename,
+            filename=generate_document_filename(ext),
             mime_type=file.content_type,
         )
-        document_file.save()
+        ids.save_with_unique_id(
+            document_file, "filename", lambda: generate_document_filename(ext)
+        )
 
         s3_util.save_uploaded_file_to_s3(
-            settings.COMSOL_DOCUMENT_DIR, filename, file, file.content_type
+            settings.COMSOL_DOCUMENT_DIR,
+            document_file.filename,
+            file,
+            file.content_type,
         )
 
         document.edittime = timezone.now()
@@ -425,18 +440,13 @@ class DocumentFileElementView(View):
                 s3_util.delete_file(
                     settings.COMSOL_DOCUMENT_DIR, document_file.filename
                 )
-                filename = s3_util.generate_filename(
-                    16, settings.COMSOL_DOCUMENT_DIR, ext
-                )
-                document_file.filename = filename
+                document_file.filename = generate_document_filename(ext)
                 document_file.mime_type = file.content_type
+                ids.save_with_unique_id(
+                    document_file, "filename", lambda: generate_document_filename(ext)
+                )
 
-            s3_util.save_uploaded_file_to_s3(
-                settings.COMSOL_DOCUMENT_DIR,
-                document_file.filename,
-                file,
-                document_file.mime_type,
-            )
+            upload_document_file(document_file, file)
 
         document_file.save()
         document.edittime = timezone.now()
@@ -483,16 +493,56 @@ def regenerate_api_key(request: HttpRequest, username: str, document_slug: str):
     return response.success(value=get_document_obj(document, request))
 
 
+def get_attachment_filename(document_file: DocumentFile):
+    _, ext = os.path.splitext(document_file.filename)
+    return document_file.display_name + ext
+
+
+def reset_file_url(document_file: DocumentFile):
+    """
+    Drops the cached presigned URL of a file which is replaced, as browsers may have
+    cached the previous file under it.
+    """
+    s3_util.reset_presigned_get_object(
+        settings.COMSOL_DOCUMENT_DIR,
+        document_file.filename,
+        inline=False,
+        display_name=get_attachment_filename(document_file),
+    )
+
+
+def upload_document_file(document_file: DocumentFile, file):
+    """
+    Replaces the file in S3. The cached URL is dropped before the upload, so a failure
+    of the cache aborts the request before anything changed. It is dropped again
+    afterwards, as a URL may have been cached during the upload, but as the upload
+    already succeeded a failure is only logged then.
+    """
+    reset_file_url(document_file)
+    s3_util.save_uploaded_file_to_s3(
+        settings.COMSOL_DOCUMENT_DIR,
+        document_file.filename,
+        file,
+        document_file.mime_type,
+    )
+    try:
+        reset_file_url(document_file)
+    except Exception:
+        logger.exception("Could not reset the URL of %s", document_file.filename)
+
+
 @response.request_get()
 def get_document_file(request, filename):
     document_file = get_object_or_404(DocumentFile, filename=filename)
-    _, ext = os.path.splitext(document_file.filename)
-    attachment_filename = document_file.display_name + ext
+    attachment_filename = get_attachment_filename(document_file)
+    # Document files can be replaced, so they are not immutable
     return s3_util.send_file(
+        request,
         settings.COMSOL_DOCUMENT_DIR,
         filename,
         as_attachment=True,
         attachment_filename=attachment_filename,
+        mode=settings.COMSOL_DOCUMENT_DELIVERY,
     )
 
 
@@ -525,20 +575,14 @@ def update_file(request: HttpRequest, username: str, document_slug: str, id: int
     if not document_file.filename.endswith(ext):
         s3_util.delete_file(settings.COMSOL_DOCUMENT_DIR,
                             document_file.filename)
-        filename = s3_util.generate_filename(
-            16, settings.COMSOL_DOCUMENT_DIR, ext)
-        document_file.filename = filename
-        changed = True
-
-    if changed:
+        document_file.filename = generate_document_filename(ext)
+        ids.save_with_unique_id(
+            document_file, "filename", lambda: generate_document_filename(ext)
+        )
+    elif changed:
         document_file.save()
 
-    s3_util.save_uploaded_file_to_s3(
-        settings.COMSOL_DOCUMENT_DIR,
-        document_file.filename,
-        file,
-        document_file.mime_type,
-    )
+    upload_document_file(document_file, file)
 
     document.edittime = timezone.now()
     document.save()
@@ -1,4 +1,4 @@
-from util import response, s3_util
+from util import ids, response, s3_util
 from filestore.models import Attachment
 from categories.models import Category
 from answers.models import Exam
@@ -19,17 +19,21 @@ def upload(request):
     )
     if not ext:
         return response.not_possible("Invalid File Extension")
-    filename = s3_util.generate_filename(16, settings.COMSOL_FILESTORE_DIR, "." + ext)
-    att = Attachment(filename=filename, displayname=request.POST["displayname"])
+    att = Attachment(
+        filename=s3_util.generate_filename(16, "." + ext),
+        displayname=request.POST["displayname"],
+    )
     if "category" in request.POST:
         att.category = get_object_or_404(Category, slug=request.POST["category"])
     elif "exam" in request.POST:
         att.exam = get_object_or_404(Exam, filename=request.POST["exam"])
     else:
         return response.missing_argument()
-    att.save()
-    s3_util.save_uploaded_file_to_s3(settings.COMSOL_FILESTORE_DIR, filename, file)
-    return response.success(filename=filename)
+    ids.save_with_unique_id(
+        att, "filename", lambda: s3_util.generate_filename(16, "." + ext)
+    )
+    s3_util.save_uploaded_file_to_s3(settings.COMSOL_FILESTORE_DIR, att.filename, file)
+    return response.success(filename=att.filename)
 
 
 @response.request_post()
@@ -45,5 +49,10 @@ def remove(request, filename):
 def get(request, filename):
     get_object_or_404(Attachment, filename=filename)
     return s3_util.send_file(
-        settings.COMSOL_FILESTORE_DIR, filename, attachment_filename=filename
+        request,
+        settings.COMSOL_FILESTORE_DIR,
+        filename,
+        attachment_filename=filename,
+        mode=settings.COMSOL_FILESTORE_DELIVERY,
+        immutable=True,
     )
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0002_image_displayname'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='filename',
+            field=models.CharField(max_length=256, unique=True),
+        ),
+    ]
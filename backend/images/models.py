@@ -2,6 +2,6 @@ from django.db import models
 
 
 class Image(models.Model):
-    filename = models.CharField(max_length=256)
+    filename = models.CharField(max_length=256, unique=True)
     owner = models.ForeignKey('auth.User', on_delete=models.CASCADE)
     displayname = models.CharField(max_length=256)
@@ -22,3 +22,6 @@ class TestUploadRemove(ComsolTest):
             res = self.post('/api/image/upload/', {
                 'file': f,
             }, status_code=400)
+
+    def test_get_unknown_image(self):
+        self.get('/api/image/get/doesnotexist.svg/', status_code=404, as_json=False)
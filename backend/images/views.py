@@ -1,4 +1,4 @@
-from util import response, s3_util
+from util import ids, response, s3_util
 from myauth import auth_check
 from images.models import Image
 from django.conf import settings
@@ -22,11 +22,16 @@ def upload_image(request):
     ext = s3_util.check_filename(file.name, settings.COMSOL_IMAGE_ALLOWED_EXTENSIONS)
     if not ext:
         return response.not_possible("Invalid File Extensions")
-    filename = s3_util.generate_filename(16, settings.COMSOL_IMAGE_DIR, "." + ext)
-    image = Image(filename=filename, owner=request.user, displayname=file.name)
-    image.save()
-    s3_util.save_uploaded_file_to_s3(settings.COMSOL_IMAGE_DIR, filename, file)
-    return response.success(filename=filename)
+    image = Image(
+        filename=s3_util.generate_filename(16, "." + ext),
+        owner=request.user,
+        displayname=file.name,
+    )
+    ids.save_with_unique_id(
+        image, "filename", lambda: s3_util.generate_filename(16, "." + ext)
+    )
+    s3_util.save_uploaded_file_to_s3(settings.COMSOL_IMAGE_DIR, image.filename, file)
+    return response.success(filename=image.filename)
 
 
 @response.request_post()
@@ -40,4 +45,12 @@ def remove_image(request, filename):
 
 @response.request_get()
 def get_image(request, filename):
-    return s3_util.send_file(settings.COMSOL_IMAGE_DIR, filename)
+    get_object_or_404(Image, filename=filename)
+    # Images are never replaced, a new upload gets a new filename
+    return s3_util.send_file(
+        request,
+        settings.COMSOL_IMAGE_DIR,
+        filename,
+        mode=settings.COMSOL_IMAGE_DELIVERY,
+        immutable=True,
+    )
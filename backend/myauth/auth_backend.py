@@ -1,36 +1,43 @@
+import hashlib
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
-import urllib.request
 import json
 
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.http.request import HttpRequest
-from jwcrypto.jwk import JWKSet
 from jwcrypto.jwt import JWT, JWTMissingKey
 from notifications.models import NotificationSetting, NotificationType
-from util.func_cache import cache
+from util.func_cache import LRUCache
 
+from myauth.jwks import KeySetManager, KeySetUnavailable
 from myauth.models import MyUser, Profile
 from jwcrypto.jws import InvalidJWSObject, InvalidJWSOperation, InvalidJWSSignature
 from datetime import datetime, timezone
-from django.db import transaction
+from django.db import connection, transaction
 
 logger = logging.getLogger(__name__)
 
+# Claims of verified tokens by the SHA-256 hash of the encoded token
+verified_tokens = LRUCache(
+    settings.COMSOL_AUTH_CACHE_SIZE, settings.COMSOL_AUTH_TOKEN_CACHE_VALIDITY
+)
+# Field values of users by their sub
+users = LRUCache(settings.COMSOL_AUTH_CACHE_SIZE, settings.COMSOL_AUTH_USER_CACHE_VALIDITY)
+USER_FIELDS = [field.attname for field in MyUser._meta.concrete_fields]
 
-@cache(60)
-def get_key_set():
-    """Returns a `JWKSet` object that is populated using the keys at the `settings.OIDC_JWKS_URL`
-    url. The returned object will be cached to prevent loading the jwks on every request.
+profile_sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-sync")
 
-    Returns:
-        JWKSet: Cached JWK set
-    """
-    json_data = urllib.request.urlopen(settings.OIDC_JWKS_URL).read()
-    key_set = JWKSet.from_json(json_data)
 
-    return key_set
+key_sets = KeySetManager(
+    settings.OIDC_JWKS_URL,
+    settings.COMSOL_JWKS_REFRESH_INTERVAL,
+    settings.COMSOL_JWKS_TIMEOUT,
+    settings.COMSOL_JWKS_RETRY_DELAY,
+    settings.COMSOL_JWKS_MAX_RETRY_DELAY,
+)
 
 
 class NoUsernameException(Exception):
@@ -57,6 +64,91 @@ def generate_unique_username(preferred_username):
     return preferred_username + str(suffix)
 
 
+def verify_token(encoded):
+    """Verifies the signature of the encoded token and returns its claims. The claims of
+    verified tokens are cached until the tokens expire, so that the signature is only
+    checked once per token. The claims themselves are not validated.
+
+    Returns:
+        dict: Claims of the token
+    """
+    key = hashlib.sha256(encoded.encode("utf-8")).digest()
+    if settings.COMSOL_AUTH_CACHE:
+        claims = verified_tokens.get(key)
+        if claims is not None:
+            return claims
+
+    token = JWT()
+    key_set = key_sets.get()
+    # deserialize will raise an error if the encoded token is not valid / isn't signed correctly
+    # it does however not validate any claims
+    try:
+        token.deserialize(encoded, key_set)
+    except JWTMissingKey:
+        # The keys might have been rotated
+        new_key_set = key_sets.refetch()
+        if new_key_set is key_set:
+            raise
+        token.validate(new_key_set)
+    claims = token.claims
+    # claims can be a string - we ensure that it is a parsed json object here
+    if type(claims) is str:
+        claims = json.loads(claims)
+
+    if settings.COMSOL_AUTH_CACHE:
+        validity = settings.COMSOL_AUTH_TOKEN_CACHE_VALIDITY
+        if "exp" in claims:
+            validity = min(validity, claims["exp"] - time.time())
+        if validity > 0:
+            verified_tokens.set(key, claims, validity)
+    return claims
+
+
+def find_user(sub):
+    """Returns the user with the profile `sub` or None. Users are cached by their sub,
+    so most requests don't need a query to find the user.
+    """
+    if settings.COMSOL_AUTH_CACHE:
+        values = users.get(sub)
+        if values is not None:
+            return MyUser.from_db("default", USER_FIELDS, values)
+    user = MyUser.objects.filter(profile__sub=sub).first()
+    if user is not None and settings.COMSOL_AUTH_CACHE:
+        users.set(sub, [getattr(user, field) for field in USER_FIELDS])
+    return user
+
+
+def save_names(user_id, first_name, last_name, close_connection):
+    try:
+        MyUser.objects.filter(pk=user_id).update(
+            first_name=first_name, last_name=last_name
+        )
+    except Exception:
+        logger.exception("Could not update the names of user %s", user_id)
+    finally:
+        if close_connection:
+            connection.close()
+
+
+def sync_profile(sub, user, claims):
+    """Updates the names of `user` if they differ from the ones in the claims. With
+    `COMSOL_AUTH_SYNC_IN_BACKGROUND` they are written by a background thread, so that
+    the request doesn't wait for the update.
+    """
+    first_name = claims["given_name"]
+    last_name = claims["family_name"]
+    if user.first_name == first_name and user.last_name == last_name:
+        return
+    user.first_name = first_name
+    user.last_name = last_name
+    if settings.COMSOL_AUTH_CACHE:
+        users.set(sub, [getattr(user, field) for field in USER_FIELDS])
+    if settings.COMSOL_AUTH_SYNC_IN_BACKGROUND:
+        profile_sync_executor.submit(save_names, user.pk, first_name, last_name, True)
+    else:
+        save_names(user.pk, first_name, last_name, False)
+
+
 def add_auth(request: HttpRequest):
     request.user = None
     headers = request.headers
@@ -78,16 +170,7 @@ def add_auth(request: HttpRequest):
 
     if encoded is not None:
 
-        token = JWT()
-        key_set = get_key_set()
-        # deserialize will raise an error if the encoded token is not valid / isn't signed correctly
-        # it does however not validate any claims
-        token.deserialize(encoded, key_set)
-        claims = token.claims
-        # claims can be a string - we ensure that it is a parsed json object here
-        if type(claims) is str:
-            claims = json.loads(claims)
-
+        claims = verify_token(encoded)
         request.claims = claims
 
         now = datetime.now().replace(tzinfo=timezone.utc).timestamp()
@@ -119,48 +202,38 @@ def add_auth(request: HttpRequest):
             roles = ["admin"]
         request.roles = roles
 
+        existing_user = find_user(sub)
+        if existing_user != None:
+            request.user = existing_user
+            sync_profile(sub, existing_user, claims)
+            return None
+
         with transaction.atomic():
-            existing_user = MyUser.objects.filter(profile__sub=sub).first()
-            if existing_user != None:
-                request.user = existing_user
-                changed = False
+            old_existing_user = MyUser.objects.filter(
+                username=preferred_username
+            ).first()
+            if old_existing_user != None:
+                Profile.objects.create(user=old_existing_user, sub=sub)
+                request.user = old_existing_user
 
-                if claims["given_name"] != existing_user.first_name:
-                    changed = True
-                    existing_user.first_name = claims["given_name"]
+            else:
 
-                if claims["family_name"] != existing_user.last_name:
-                    changed = True
-                    existing_user.last_name = claims["family_name"]
+                user = MyUser()
+                user.first_name = claims["given_name"]
+                user.last_name = claims["family_name"]
+                user.username = generate_unique_username(preferred_username)
+                user.save()
 
-                if changed:
-                    existing_user.save()
-            else:
-                old_existing_user = MyUser.objects.filter(
-                    username=preferred_username
-                ).first()
-                if old_existing_user != None:
-                    Profile.objects.create(user=old_existing_user, sub=sub)
-                    request.user = old_existing_user
-
-                else:
-
-                    user = MyUser()
-                    user.first_name = claims["given_name"]
-                    user.last_name = claims["family_name"]
-                    user.username = generate_unique_username(preferred_username)
-                    user.save()
-
-                    Profile.objects.create(user=user, sub=sub)
-
-                    request.user = user
-
-                    for type_ in [
-                        NotificationType.NEW_COMMENT_TO_ANSWER,
-                        NotificationType.NEW_ANSWER_TO_ANSWER,
-                    ]:
-                        setting = NotificationSetting(user=user, type=type_.value)
-                        setting.save()
+                Profile.objects.create(user=user, sub=sub)
+
+                request.user = user
+
+                for type_ in [
+                    NotificationType.NEW_COMMENT_TO_ANSWER,
+                    NotificationType.NEW_ANSWER_TO_ANSWER,
+                ]:
+                    setting = NotificationSetting(user=user, type=type_.value)
+                    setting.save()
     return None
 
 
@@ -180,6 +253,9 @@ def AuthenticationMiddleware(get_response):
         except JWTMissingKey:
             logger.warning("jwt missing key detected")
 
+        except KeySetUnavailable:
+            logger.warning("no key set available to verify the jwt")
+
         except InvalidHomeOrganizationException:
             logger.warning("invalid home organization detected")
 
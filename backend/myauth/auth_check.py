@@ -1,8 +1,11 @@
 from functools import wraps
+from django.db import connection
 from django.shortcuts import get_object_or_404
 from django.conf import settings
+from django.utils.functional import cached_property
 
-from util import response, func_cache
+from payments.models import current_period_start
+from util import response
 
 
 def check_api_key(request):
@@ -26,42 +29,96 @@ def has_admin_rights(request):
     return "admin" in request.roles
 
 
-@func_cache.cache(60)
-def _has_admin_rights_for_any_category(user):
-    return user.category_admin_set.exists()
+class Permissions:
+    """
+    The category rights and the payment status of a user. They are loaded with a single
+    query when first needed.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    @cached_property
+    def _rights(self):
+        if self.user_id is None:
+            return frozenset(), frozenset(), False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT
+                    ARRAY(SELECT category_id FROM categories_category_admins
+                          WHERE user_id = %(user_id)s),
+                    ARRAY(SELECT category_id FROM categories_category_experts
+                          WHERE user_id = %(user_id)s),
+                    EXISTS(SELECT 1 FROM payments_payment
+                           WHERE user_id = %(user_id)s AND payment_time >= %(start)s)
+                """,
+                {"user_id": self.user_id, "start": current_period_start()},
+            )
+            admin_categories, expert_categories, has_payed = cursor.fetchone()
+        return frozenset(admin_categories), frozenset(expert_categories), has_payed
+
+    @property
+    def admin_categories(self):
+        """Ids of the categories the user is an admin of"""
+        return self._rights[0]
+
+    @property
+    def expert_categories(self):
+        """Ids of the categories the user is an expert of"""
+        return self._rights[1]
+
+    @property
+    def has_payed(self):
+        return self._rights[2]
+
+
+def get_permissions(request):
+    """
+    Returns the `Permissions` of the user of the request. They are kept on the request,
+    so all checks of a request share them.
+    """
+    permissions = getattr(request, "permissions", None)
+    if permissions is None:
+        user = request.user
+        permissions = request.permissions = Permissions(user.pk if user else None)
+    return permissions
 
 
 def has_admin_rights_for_any_category(request):
     if has_admin_rights(request):
         return True
-    return _has_admin_rights_for_any_category(request.user)
-
-
-@func_cache.cache(60)
-def _has_admin_rights_for_category(user, category):
-    return user.category_admin_set.filter(pk=category.pk).exists()
+    return len(get_permissions(request).admin_categories) > 0
 
 
 def has_admin_rights_for_category(request, category):
     if has_admin_rights(request):
         return True
-    return _has_admin_rights_for_category(request.user, category)
+    return category.pk in get_permissions(request).admin_categories
 
 
 def has_admin_rights_for_exam(request, exam):
-    return has_admin_rights_for_category(request, exam.category)
+    if has_admin_rights(request):
+        return True
+    return exam.category_id in get_permissions(request).admin_categories
 
 
 def has_admin_rights_for_document(request, document):
-    return has_admin_rights_for_category(request, document.category)
+    if has_admin_rights(request):
+        return True
+    return document.category_id in get_permissions(request).admin_categories
 
 
 def is_expert_for_category(request, category):
-    return request.user.category_expert_set.filter(pk=category.pk).exists()
+    return category.pk in get_permissions(request).expert_categories
 
 
 def is_expert_for_exam(request, exam):
-    return is_expert_for_category(request, exam.category)
+    return exam.category_id in get_permissions(request).expert_categories
+
+
+def has_payed(request):
+    return get_permissions(request).has_payed
 
 
 def _is_class_method(f):
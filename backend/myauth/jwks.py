@@ -0,0 +1,129 @@
+"""
+Keeps the JWK set of the identity provider, which is used to verify the signatures of
+tokens.
+
+Requests never wait for the identity provider, except for the very first one of a
+process. Once the key set is older than the refresh interval, it is fetched again by
+a background thread while requests keep using the last good key set. Tokens signed
+with an unknown key (`kid`) make us fetch the key set right away, as the keys might
+have been rotated. Fetches time out, and failed fetches delay the next attempt with an
+exponential backoff, so a slow or unavailable identity provider doesn't stall the
+workers.
+"""
+import logging
+import threading
+import time
+import urllib.request
+
+from jwcrypto.jwk import JWKSet
+
+logger = logging.getLogger(__name__)
+
+
+class KeySetUnavailable(Exception):
+    pass
+
+
+class KeySetManager:
+    """
+    Provides the key set at `url`. It is refreshed after `refresh_interval` seconds.
+    Fetches time out after `timeout` seconds. After a fetch, the next one is attempted
+    at the earliest after `retry_delay` seconds, which is doubled after every failure up
+    to `max_retry_delay` seconds.
+    """
+
+    def __init__(self, url, refresh_interval, timeout, retry_delay, max_retry_delay):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.key_set = None
+        self.fetched = 0.0
+        self.next_attempt = 0.0
+        self.failures = 0
+        self.refreshing = False
+        # Held while fetching, so there is at most one fetch at a time
+        self.fetch_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def fetch(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as res:
+            return JWKSet.from_json(res.read())
+
+    def _refresh(self):
+        """
+        Fetches the key set if the backoff allows it. Must be called with `fetch_lock`
+        held.
+        """
+        if time.monotonic() < self.next_attempt:
+            return
+        try:
+            key_set = self.fetch()
+        except Exception as e:
+            self.failures += 1
+            delay = min(
+                self.retry_delay * 2 ** (self.failures - 1), self.max_retry_delay
+            )
+            self.next_attempt = time.monotonic() + delay
+            logger.warning(
+                "Could not fetch the key set, retrying in %s s: %s", delay, e
+            )
+            return
+        now = time.monotonic()
+        self.key_set = key_set
+        self.fetched = now
+        self.failures = 0
+        self.next_attempt = now + self.retry_delay
+
+    def _refresh_in_background(self):
+        try:
+            with self.fetch_lock:
+                if time.monotonic() - self.fetched >= self.refresh_interval:
+                    self._refresh()
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def get(self):
+        """
+        Returns the current key set. If it is due for a refresh, the refresh is started
+        in the background. Only blocks if no key set was fetched yet.
+        """
+        key_set = self.key_set
+        if key_set is None:
+            with self.fetch_lock:
+                if self.key_set is None:
+                    self._refresh()
+                key_set = self.key_set
+            if key_set is None:
+                raise KeySetUnavailable("No key set could be fetched from " + self.url)
+            return key_set
+
+        if (
+            time.monotonic() - self.fetched >= self.refresh_interval
+            and time.monotonic() >= self.next_attempt
+        ):
+            with self.lock:
+                start = not self.refreshing
+                self.refreshing = True
+            if start:
+                threading.Thread(
+                    target=self._refresh_in_background,
+                    name="jwks-refresh",
+                    daemon=True,
+                ).start()
+        return key_set
+
+    def refetch(self):
+        """
+        Fetches the key set right away, e.g. because a token was signed with an unknown
+        key. To prevent tokens with made up keys from causing a fetch each, this is
+        limited by the backoff. Returns the current key set.
+        """
+        with self.fetch_lock:
+            self._refresh()
+            key_set = self.key_set
+        if key_set is None:
+            raise KeySetUnavailable("No key set could be fetched from " + self.url)
+        return key_set
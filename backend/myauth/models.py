@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
+from payments.models import current_period_start
 
 
 def get_my_user(user):
@@ -18,7 +19,7 @@ class MyUser(User):
         return self.first_name + " " + self.last_name
 
     def has_payed(self):
-        return len([x for x in self.payment_set.all() if x.valid()]) > 0
+        return self.payment_set.filter(payment_time__gte=current_period_start()).exists()
 
 
 class Profile(models.Model):
@@ -1,7 +1,20 @@
 import logging
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.exceptions import PermissionDenied
+from django.test import RequestFactory, SimpleTestCase, override_settings
 from testing.tests import ComsolTest, get_token
 from jwcrypto.jwt import JWT
-from jwcrypto.jwk import JWK
+from jwcrypto.jwk import JWK, JWKSet
+from django.utils import timezone
+from answers.models import Exam, ExamType
+from categories.models import Category
+from myauth import auth_backend, auth_check
+from myauth.jwks import KeySetManager, KeySetUnavailable
+from myauth.models import MyUser
+from payments.models import Payment, current_period_start
 
 private_key_data = open("testing/jwtRS256.key", "rb").read()
 key = JWK()
@@ -202,3 +215,243 @@ class TestAuth(ComsolTest):
         )
         logging.disable(logging.NOTSET)
         self.assertEqual(response.status_code, 403)
+
+
+@override_settings(COMSOL_AUTH_CACHE=True)
+class TestAuthCache(ComsolTest):
+    def mySetUp(self):
+        auth_backend.verified_tokens.clear()
+        auth_backend.users.clear()
+
+    def myTearDown(self):
+        auth_backend.verified_tokens.clear()
+        auth_backend.users.clear()
+
+    def authenticate(self, token):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=token)
+        auth_backend.add_auth(request)
+        return request
+
+    def make_token(self, **claims):
+        token = JWT(
+            header={"alg": "RS256", "typ": "JWT", "kid": key.key_id},
+            claims=dict(
+                {
+                    "sub": self.user["sub"],
+                    "preferred_username": self.user["username"],
+                    "given_name": self.user["given_name"],
+                    "family_name": self.user["family_name"],
+                    "home_organization": "unisg.ch",
+                },
+                **claims
+            ),
+        )
+        token.make_signed_token(key)
+        return "Bearer " + token.serialize()
+
+    def test_cached_request_without_queries(self):
+        token = get_token(self.user)
+        self.authenticate(token)
+        with self.assertNumQueries(0):
+            request = self.authenticate(token)
+        self.assertEqual(request.user, self.get_my_user())
+        self.assertEqual(request.user.username, self.user["username"])
+        self.assertEqual(request.roles, ["admin"])
+
+    def test_cache_bounded_by_expiry(self):
+        exp = int(time.time()) + 10
+        token = self.make_token(exp=exp)
+        self.authenticate(token)
+        _, expires = auth_backend.verified_tokens.entries[
+            auth_backend.hashlib.sha256(token[7:].encode("utf-8")).digest()
+        ]
+        self.assertAlmostEqual(expires, exp, delta=1)
+
+    def test_expired_token_not_cached(self):
+        token = self.make_token(exp=int(time.time()) - 10)
+        with self.assertRaises(PermissionDenied):
+            self.authenticate(token)
+        self.assertEqual(len(auth_backend.verified_tokens), 0)
+
+    def test_changed_names(self):
+        self.authenticate(get_token(self.user))
+        # Only the update of the names, the user is taken from the cache
+        with self.assertNumQueries(1):
+            request = self.authenticate(self.make_token(given_name="Jonathan"))
+        self.assertEqual(request.user.first_name, "Jonathan")
+        self.assertEqual(self.get_my_user().first_name, "Jonathan")
+        with self.assertNumQueries(0):
+            request = self.authenticate(self.make_token(given_name="Jonathan"))
+        self.assertEqual(request.user.first_name, "Jonathan")
+
+
+class TestPermissions(ComsolTest):
+
+    loginUser = 2
+
+    def mySetUp(self):
+        self.categories = []
+        for i in range(3):
+            category = Category(displayname="Category {}".format(i), slug="cat{}".format(i))
+            category.save()
+            self.categories.append(category)
+        user = self.get_my_user()
+        self.categories[0].admins.add(user)
+        self.categories[1].experts.add(user)
+        self.exam = Exam(
+            filename="abc.pdf",
+            displayname="Exam",
+            category=self.categories[1],
+            exam_type=ExamType.objects.get(displayname="Exams"),
+            public=True,
+            needs_payment=True,
+        )
+        self.exam.save()
+
+    def authenticate(self):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=get_token(self.user))
+        auth_backend.add_auth(request)
+        return request
+
+    def test_single_query(self):
+        request = self.authenticate()
+        exam = Exam.objects.get(pk=self.exam.pk)
+        with self.assertNumQueries(1):
+            for _ in range(2):
+                self.assertTrue(auth_check.has_admin_rights_for_any_category(request))
+                self.assertEqual(
+                    [
+                        auth_check.has_admin_rights_for_category(request, category)
+                        for category in self.categories
+                    ],
+                    [True, False, False],
+                )
+                self.assertEqual(
+                    [
+                        auth_check.is_expert_for_category(request, category)
+                        for category in self.categories
+                    ],
+                    [False, True, False],
+                )
+                self.assertFalse(auth_check.has_admin_rights_for_exam(request, exam))
+                self.assertTrue(auth_check.is_expert_for_exam(request, exam))
+                self.assertFalse(auth_check.has_payed(request))
+                self.assertFalse(exam.current_user_can_view(request))
+
+    def test_payments(self):
+        user = self.get_my_user()
+        Payment(
+            user=user, payment_time=current_period_start() - timedelta(days=1)
+        ).save()
+        self.assertFalse(auth_check.has_payed(self.authenticate()))
+        self.assertFalse(user.has_payed())
+        Payment(user=user, payment_time=timezone.now()).save()
+        self.assertTrue(auth_check.has_payed(self.authenticate()))
+        self.assertTrue(user.has_payed())
+
+
+class KeySetHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        time.sleep(server.delay)
+        if server.key_set is None:
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = server.key_set.export(private_keys=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestKeySetManager(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeySetHandler)
+        self.server.requests = 0
+        self.server.delay = 0
+        self.server.key_set = self.make_key_set("a")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/certs".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_key_set(self, *kids):
+        key_set = JWKSet()
+        for kid in kids:
+            key_set.add(JWK.generate(kty="EC", crv="P-256", kid=kid))
+        return key_set
+
+    def make_manager(self, refresh_interval=60, timeout=1, retry_delay=0):
+        return KeySetManager(self.url, refresh_interval, timeout, retry_delay, 10)
+
+    def wait_for_refresh(self, manager):
+        for _ in range(100):
+            if not manager.refreshing:
+                return
+            time.sleep(0.01)
+        self.fail("Refresh did not finish")
+
+    def test_cached(self):
+        manager = self.make_manager()
+        key_set = manager.get()
+        self.assertIsNotNone(key_set.get_key("a"))
+        self.assertIs(manager.get(), key_set)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_background_refresh(self):
+        manager = self.make_manager(refresh_interval=0)
+        old = manager.get()
+        self.server.key_set = self.make_key_set("b")
+        self.server.delay = 0.2
+        # The old key set is served while the new one is fetched
+        self.assertIs(manager.get(), old)
+        self.wait_for_refresh(manager)
+        self.assertEqual(self.server.requests, 2)
+        self.assertIsNotNone(manager.key_set.get_key("b"))
+
+    def test_failed_refresh(self):
+        manager = self.make_manager(refresh_interval=0, retry_delay=5)
+        old = manager.get()
+        self.server.key_set = None
+        manager.next_attempt = 0
+        with self.assertLogs("myauth.jwks", "WARNING"):
+            manager.get()
+            self.wait_for_refresh(manager)
+        self.assertEqual(self.server.requests, 2)
+        self.assertIs(manager.get(), old)
+        self.assertEqual(manager.failures, 1)
+        # Backoff, no further attempts for now
+        self.assertIs(manager.refetch(), old)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_timeout(self):
+        self.server.delay = 1
+        manager = self.make_manager(timeout=0.1, retry_delay=5)
+        start = time.monotonic()
+        with self.assertRaises(KeySetUnavailable), self.assertLogs("myauth.jwks"):
+            manager.get()
+        self.assertLess(time.monotonic() - start, 1)
+        with self.assertRaises(KeySetUnavailable):
+            manager.get()
+        self.assertEqual(self.server.requests, 1)
+
+    def test_refetch(self):
+        manager = self.make_manager(retry_delay=5)
+        old = manager.get()
+        # Limited by the delay between fetches
+        self.assertIs(manager.refetch(), old)
+        self.assertEqual(self.server.requests, 1)
+
+        manager.next_attempt = 0
+        self.server.key_set = self.make_key_set("a", "b")
+        new = manager.refetch()
+        self.assertIsNotNone(new.get_key("b"))
+        self.assertEqual(self.server.requests, 2)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class NotificationsConfig(AppConfig):
     name = 'notifications'
+
+    def ready(self):
+        # Registers the signal receivers invalidating the unread counts
+        from notifications import unread_count  # noqa: F401
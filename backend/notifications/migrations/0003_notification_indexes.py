@@ -0,0 +1,30 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0002_notification_document'),
+    ]
+
+    # The index on receiver is only dropped once the new indexes cover it
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['receiver', 'time', 'id'], name='notification_receiver_time'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['receiver'], name='notification_unread'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='receiver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notification_receiver_set', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
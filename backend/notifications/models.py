@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 import enum
 
@@ -12,7 +13,8 @@ class NotificationType(enum.Enum):
 
 class Notification(models.Model):
     sender = models.ForeignKey('auth.User', related_name='notification_sender_set', null=True, on_delete=models.SET_NULL)
-    receiver = models.ForeignKey('auth.User', related_name='notification_receiver_set', on_delete=models.CASCADE)
+    # Indexed by notification_receiver_time
+    receiver = models.ForeignKey('auth.User', related_name='notification_receiver_set', on_delete=models.CASCADE, db_index=False)
     type = models.IntegerField()
     time = models.DateTimeField(default=timezone.now)
     title = models.CharField(max_length=256)
@@ -21,6 +23,17 @@ class Notification(models.Model):
     document = models.ForeignKey('documents.Document', null=True, on_delete=models.SET_NULL)
     read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Pages of the notifications of a user, ordered by (time, id)
+            models.Index(
+                fields=['receiver', 'time', 'id'], name='notification_receiver_time'
+            ),
+            models.Index(
+                fields=['receiver'], condition=Q(read=False), name='notification_unread'
+            ),
+        ]
+
 
 class NotificationSetting(models.Model):
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
@@ -1,3 +1,10 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+
+from myauth.models import MyUser
+from notifications import unread_count
 from notifications.models import Notification
 from testing.tests import ComsolTest
 
@@ -64,3 +71,88 @@ class TestNotifications(ComsolTest):
         self.assertEqual(res[0]['message'], notification.text)
         res = self.get('/api/notification/unreadcount/')['value']
         self.assertEqual(res, 0)
+
+
+class TestNotificationPages(ComsolTest):
+
+    def mySetUp(self):
+        self.notifications = []
+        now = timezone.now()
+        for i in range(7):
+            notification = Notification(
+                sender=self.get_my_user(),
+                receiver=self.get_my_user(),
+                type=1,
+                title='Notification {}'.format(i),
+                text='Test Text',
+                # Pairs of notifications with the same time
+                time=now - timedelta(minutes=i // 2),
+            )
+            notification.save()
+            self.notifications.append(notification)
+
+    def test_pages(self):
+        expected = sorted(
+            self.notifications, key=lambda n: (n.time, n.id), reverse=True
+        )
+        res = []
+        path = '/api/notification/all/?limit=3'
+        while True:
+            page = self.get(path)
+            self.assertLessEqual(len(page['value']), 3)
+            res += page['value']
+            if page['next'] is None:
+                break
+            path = '/api/notification/all/?limit=3&before=' + page['next']
+        self.assertEqual([n['oid'] for n in res], [n.id for n in expected])
+
+    def test_unread_pages(self):
+        self.notifications[0].read = True
+        self.notifications[0].save()
+        page = self.get('/api/notification/unread/?limit=10')
+        self.assertEqual(len(page['value']), 6)
+        self.assertIsNone(page['next'])
+
+    def test_invalid_arguments(self):
+        self.get('/api/notification/all/?limit=0', status_code=400)
+        self.get('/api/notification/all/?before=abc', status_code=400)
+        self.get('/api/notification/all/?before=1_2_3', status_code=400)
+        self.get('/api/notification/all/?before=-1_2', status_code=400)
+        self.get('/api/notification/all/?before=999999999999999999_1', status_code=400)
+
+    def test_setallread(self):
+        self.assertEqual(self.get('/api/notification/unreadcount/')['value'], 7)
+        res = self.post('/api/notification/setallread/', {})
+        self.assertEqual(res['value'], 7)
+        self.assertEqual(self.get('/api/notification/unreadcount/')['value'], 0)
+
+    def test_setread_of_other_user(self):
+        other = MyUser(username='other')
+        other.save()
+        notification = Notification(
+            sender=self.get_my_user(), receiver=other, type=1, title='T', text='T'
+        )
+        notification.save()
+        self.post(
+            '/api/notification/setread/{}/'.format(notification.id),
+            {'read': 'true'},
+            status_code=404,
+        )
+
+    @override_settings(TESTING=False)
+    def test_cached_unread_count(self):
+        user = self.get_my_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            unread_count.reset(user.pk)
+        self.assertEqual(unread_count.get_unread_count(user.pk), 7)
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count.get_unread_count(user.pk), 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notifications[0].read = True
+            self.notifications[0].save()
+            # Not invalidated before the transaction commits
+            self.assertEqual(unread_count.get_unread_count(user.pk), 7)
+        self.assertEqual(unread_count.get_unread_count(user.pk), 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notifications[1].delete()
+        self.assertEqual(unread_count.get_unread_count(user.pk), 5)
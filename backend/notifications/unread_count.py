@@ -0,0 +1,44 @@
+"""
+Caches the number of unread notifications of each user. The count is polled by every
+open tab, so it is kept in the shared func_cache. The cache key includes a version per
+user, which is bumped once a transaction that changes a notification commits. A count
+computed concurrently from the old state is therefore stored under the old version
+and never returned again. Saving or deleting a notification bumps the version of its
+receiver, bulk updates don't send signals and have to call `reset` themselves.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from notifications.models import Notification
+from util import func_cache
+
+
+def get_version_key(user_id):
+    return "notifications_unread_count_version:{}".format(user_id)
+
+
+@func_cache.cache(settings.COMSOL_NOTIFICATION_UNREAD_COUNT_VALIDITY, shared=True)
+def count_unread(user_id, version):
+    return Notification.objects.filter(receiver_id=user_id, read=False).count()
+
+
+def get_unread_count(user_id):
+    return count_unread(user_id, func_cache.get_generation(get_version_key(user_id)))
+
+
+def reset(user_id):
+    """
+    Invalidates the count of the user once the current transaction commits, or
+    immediately if there is none.
+    """
+    transaction.on_commit(
+        lambda: func_cache.bump_generation(get_version_key(user_id))
+    )
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def invalidate(instance, **kwargs):
+    reset(instance.receiver_id)
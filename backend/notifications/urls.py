@@ -9,4 +9,5 @@ urlpatterns = [
     path('unreadcount/', views.unreadcount, name='unreadcount'),
     path('all/', views.all, name='all'),
     path('setread/<int:oid>/', views.setread, name='setread'),
+    path('setallread/', views.setallread, name='setallread'),
 ]
@@ -1,11 +1,20 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from myauth import auth_check
 from myauth.models import get_my_user
 from util import response
 
+from notifications import unread_count
 from notifications.models import (Notification, NotificationSetting,
                                   NotificationType)
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+CURSOR_RE = re.compile(r'([0-9]{1,18})_([0-9]{1,18})')
+
 
 @response.request_get()
 @auth_check.require_login
@@ -29,13 +38,61 @@ def setenabled(request):
     return response.success()
 
 
+def make_cursor(notification):
+    """
+    Returns the position after `notification` in the notifications ordered by
+    (time, id), as `<microseconds since the epoch>_<id>`.
+    """
+    micros = (notification.time - EPOCH) // timedelta(microseconds=1)
+    return '{}_{}'.format(micros, notification.id)
+
+
+def parse_cursor(cursor):
+    """
+    Inverse of `make_cursor`. Raises ValueError for anything it can't have returned.
+    """
+    match = CURSOR_RE.fullmatch(cursor)
+    if not match:
+        raise ValueError('Invalid cursor')
+    try:
+        time = EPOCH + timedelta(microseconds=int(match.group(1)))
+    except OverflowError:
+        raise ValueError('Invalid cursor')
+    return time, int(match.group(2))
+
+
 @response.request_get()
 @auth_check.require_login
 def get_notifications(request, unread):
+    """
+    Returns a page of the notifications of the user, newest first. At most `limit`
+    notifications are returned, which are older than the cursor `before` if it is
+    given. `next` is the cursor of the next page, or None if this was the last one.
+    """
+    try:
+        limit = int(request.GET.get('limit', settings.COMSOL_NOTIFICATION_PAGE_SIZE))
+        before = request.GET.get('before')
+        if before:
+            before = parse_cursor(before)
+    except ValueError:
+        return response.not_possible('Invalid limit or cursor')
+    if limit < 1:
+        return response.not_possible('Invalid limit or cursor')
+    limit = min(limit, settings.COMSOL_NOTIFICATION_MAX_PAGE_SIZE)
+
     notifications = Notification.objects.filter(receiver=request.user).select_related('receiver', 'sender', 'answer', 'document','answer__answer_section', 'answer__answer_section__exam')
     if unread:
         notifications = notifications.filter(read=False)
-    notifications = notifications.order_by('-time')
+    if before:
+        time, id_ = before
+        # time__lte is implied by the second filter, it lets the index on
+        # (receiver, time, id) start the scan at the cursor
+        notifications = notifications.filter(time__lte=time).filter(
+            Q(time__lt=time) | Q(time=time, id__lt=id_)
+        )
+    notifications = list(notifications.order_by('-time', '-id')[:limit + 1])
+    next_cursor = make_cursor(notifications[limit - 1]) if len(notifications) > limit else None
+    notifications = notifications[:limit]
     res = [
         {
             'oid': notification.id,
@@ -50,7 +107,7 @@ def get_notifications(request, unread):
             'read': notification.read,
         } for notification in notifications
     ]
-    return response.success(value=res)
+    return response.success(value=res, next=next_cursor)
 
 def _get_notification_link(notification):
     if notification.answer:
@@ -69,7 +126,7 @@ def unread(request):
 @response.request_get()
 @auth_check.require_login
 def unreadcount(request):
-    return response.success(value=Notification.objects.filter(receiver=request.user, read=False).count())
+    return response.success(value=unread_count.get_unread_count(request.user.pk))
 
 
 @response.request_get()
@@ -81,7 +138,16 @@ def all(request):
 @response.request_post('read')
 @auth_check.require_login
 def setread(request, oid):
-    notification = get_object_or_404(Notification, pk=oid)
+    notification = get_object_or_404(Notification, pk=oid, receiver=request.user)
     notification.read = request.POST['read'] != 'false'
     notification.save()
     return response.success()
+
+
+@response.request_post()
+@auth_check.require_login
+def setallread(request):
+    count = Notification.objects.filter(receiver=request.user, read=False).update(read=True)
+    # Updates don't send signals
+    unread_count.reset(request.user.pk)
+    return response.success(value=count)
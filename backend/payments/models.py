@@ -3,6 +3,16 @@ from django.utils import timezone
 from datetime import datetime
 
 
+def current_period_start(now=None):
+    """
+    Returns the start of the current payment period. Payments made before it are no
+    longer valid. Periods start on the first of March and October.
+    """
+    now = now or timezone.now()
+    resetdates = [datetime(year, month, 1, tzinfo=now.tzinfo) for year in [now.year-1, now.year] for month in [3, 10]]
+    return max(reset for reset in resetdates if reset < now)
+
+
 class Payment(models.Model):
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
     payment_time = models.DateTimeField(default=timezone.now)
@@ -11,13 +21,7 @@ class Payment(models.Model):
     uploaded_transcript = models.ForeignKey('answers.Exam', null=True, on_delete=models.SET_NULL)
 
     def valid(self):
-        now = timezone.now()
-        then = self.payment_time
-        resetdates = [datetime(year, month, 1, tzinfo=now.tzinfo) for year in [now.year-1, now.year] for month in [3, 10]]
-        for reset in resetdates:
-            if now > reset > then:
-                return False
-        return True
+        return self.payment_time >= current_period_start()
 
     def valid_until(self):
         then = self.payment_time
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+SCORE_COLUMNS = [
+    "upvotes",
+    "downvotes",
+    "document_likes",
+    "answers",
+    "legacy",
+    "cuts",
+    "documents",
+    "comments",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the scoreboard_userscore table from scratch using the "
+        "scoreboard_userscore_view, or only compares them with --check"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report users whose scores differ from the view",
+        )
+
+    def check_scores(self, cursor):
+        differs = " OR ".join(
+            "s.{col} IS DISTINCT FROM v.{col}".format(col=col) for col in SCORE_COLUMNS
+        )
+        cursor.execute(
+            """
+            SELECT v.user_id, {table_cols}, {view_cols}
+            FROM scoreboard_userscore_view v
+            LEFT JOIN scoreboard_userscore s ON (s.user_id = v.user_id)
+            WHERE {differs}
+                OR s.score IS DISTINCT FROM v.document_likes + v.upvotes - v.downvotes
+            ORDER BY v.user_id
+            """.format(
+                table_cols=", ".join("s." + col for col in SCORE_COLUMNS),
+                view_cols=", ".join("v." + col for col in SCORE_COLUMNS),
+                differs=differs,
+            )
+        )
+        return cursor.fetchall()
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options["check"]:
+                mismatches = self.check_scores(cursor)
+                for row in mismatches:
+                    self.stdout.write(
+                        "User {}: table {} != view {}".format(
+                            row[0],
+                            dict(zip(SCORE_COLUMNS, row[1 : len(SCORE_COLUMNS) + 1])),
+                            dict(zip(SCORE_COLUMNS, row[len(SCORE_COLUMNS) + 1 :])),
+                        )
+                    )
+                if mismatches:
+                    raise CommandError(
+                        "{} users have wrong scores".format(len(mismatches))
+                    )
+                self.stdout.write("Scoreboard is consistent")
+                return
+
+            # Blocks the triggers from applying deltas while we rebuild
+            cursor.execute("LOCK TABLE scoreboard_userscore IN EXCLUSIVE MODE")
+            cursor.execute("DELETE FROM scoreboard_userscore")
+            cursor.execute(
+                """
+                INSERT INTO scoreboard_userscore (id, user_id, {cols}, score)
+                SELECT id, user_id, {cols}, document_likes + upvotes - downvotes
+                FROM scoreboard_userscore_view
+                """.format(cols=", ".join(SCORE_COLUMNS))
+            )
+            self.stdout.write("Rebuilt the scores of {} users".format(cursor.rowcount))
@@ -0,0 +1,346 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Replaces the scoreboard_userscore view by a table which is kept up to date by
+    triggers. Each trigger only applies the delta of the changed row to the scores of
+    the affected user. The old view stays available as scoreboard_userscore_view, it is
+    used by the rebuild_scoreboard command to rebuild and check the table.
+    """
+
+    dependencies = [
+        ("scoreboard", "0004_add_answer_scores"),
+        ("answers", "0016_remove_exam_finished_wiki_transfer_and_more"),
+        ("documents", "0014_document_edittime_document_time"),
+    ]
+
+    view = """
+    CREATE VIEW scoreboard_userscore_view (id, user_id, upvotes, downvotes, document_likes, answers, legacy, cuts, documents, comments) AS
+    SELECT au.id as id,
+    au.id AS user_id,
+    COALESCE(auv.count, 0) AS auv_count,
+    COALESCE(adv.count, 0) AS adv_count,
+    COALESCE(dv.count, 0) AS dv_count,
+    COALESCE(aa.count, 0) AS aa_count,
+    COALESCE(al.count, 0) AS al_count,
+    COALESCE(aas.count, 0) AS aas_count,
+    COALESCE(dd.count, 0) AS dd_count,
+    COALESCE(ac.count, 0) AS ac_count
+    FROM auth_user au
+    LEFT JOIN (SELECT aa.author_id as id, COUNT(*) as count
+        FROM answers_answer_upvotes aav
+        INNER JOIN answers_answer aa ON (aa.id = aav.answer_id)
+        WHERE aa.is_legacy_answer = false
+        GROUP by aa.author_id
+    ) auv ON (auv.id = au.id)
+    LEFT JOIN (SELECT aa.author_id as id, COUNT(*) as count
+        FROM answers_answer_downvotes aav
+        INNER JOIN answers_answer aa ON (aa.id = aav.answer_id)
+        WHERE aa.is_legacy_answer = false
+        GROUP by aa.author_id
+    ) adv ON (adv.id = au.id)
+    LEFT JOIN (SELECT dd.author_id as id, COUNT(*) as count
+        FROM documents_document_likes ddl
+        INNER JOIN documents_document dd ON(ddl.document_id = dd.id)
+        GROUP BY dd.author_id
+    ) dv ON (dv.id = au.id)
+    LEFT JOIN (SELECT aa.author_id as id, COUNT(*) as count
+        FROM answers_answer aa
+        WHERE aa.is_legacy_answer = false
+        GROUP BY aa.author_id
+    ) aa ON (aa.id = au.id)
+    LEFT JOIN (SELECT aa.author_id as id, COUNT(*) as count
+        FROM answers_answer aa
+        WHERE aa.is_legacy_answer = true
+        GROUP BY aa.author_id
+    ) al ON (al.id = au.id)
+    LEFT JOIN (SELECT aas.author_id as id, COUNT(*) as count
+        FROM answers_answersection aas
+        GROUP BY aas.author_id
+    ) aas ON (aas.id = au.id)
+    LEFT JOIN (SELECT dd.author_id as id, COUNT(*) as count
+        FROM documents_document dd
+        GROUP BY dd.author_id
+    ) dd ON (dd.id = au.id)
+    LEFT JOIN (SELECT ac.author_id as id, COUNT(*) as count
+        FROM answers_comment ac
+        GROUP BY ac.author_id
+    ) ac ON (ac.id = au.id);
+    """
+
+    table = """
+    CREATE TABLE scoreboard_userscore (
+        id integer PRIMARY KEY,
+        user_id integer NOT NULL UNIQUE REFERENCES auth_user (id) ON DELETE CASCADE,
+        upvotes integer NOT NULL DEFAULT 0,
+        downvotes integer NOT NULL DEFAULT 0,
+        document_likes integer NOT NULL DEFAULT 0,
+        answers integer NOT NULL DEFAULT 0,
+        legacy integer NOT NULL DEFAULT 0,
+        cuts integer NOT NULL DEFAULT 0,
+        documents integer NOT NULL DEFAULT 0,
+        comments integer NOT NULL DEFAULT 0,
+        score integer NOT NULL DEFAULT 0
+    );
+    CREATE INDEX scoreboard_userscore_score ON scoreboard_userscore (score);
+    CREATE INDEX scoreboard_userscore_answers ON scoreboard_userscore (answers);
+    CREATE INDEX scoreboard_userscore_legacy ON scoreboard_userscore (legacy);
+    CREATE INDEX scoreboard_userscore_cuts ON scoreboard_userscore (cuts);
+    CREATE INDEX scoreboard_userscore_documents ON scoreboard_userscore (documents);
+    CREATE INDEX scoreboard_userscore_comments ON scoreboard_userscore (comments);
+
+    INSERT INTO scoreboard_userscore
+        (id, user_id, upvotes, downvotes, document_likes, answers, legacy, cuts, documents, comments, score)
+    SELECT id, user_id, upvotes, downvotes, document_likes, answers, legacy, cuts, documents, comments,
+        document_likes + upvotes - downvotes
+    FROM scoreboard_userscore_view;
+    """
+
+    triggers = """
+    CREATE FUNCTION scoreboard_update(
+        uid integer,
+        d_upvotes integer DEFAULT 0,
+        d_downvotes integer DEFAULT 0,
+        d_document_likes integer DEFAULT 0,
+        d_answers integer DEFAULT 0,
+        d_legacy integer DEFAULT 0,
+        d_cuts integer DEFAULT 0,
+        d_documents integer DEFAULT 0,
+        d_comments integer DEFAULT 0
+    ) RETURNS void AS $$
+    BEGIN
+        UPDATE scoreboard_userscore SET
+            upvotes = upvotes + d_upvotes,
+            downvotes = downvotes + d_downvotes,
+            document_likes = document_likes + d_document_likes,
+            answers = answers + d_answers,
+            legacy = legacy + d_legacy,
+            cuts = cuts + d_cuts,
+            documents = documents + d_documents,
+            comments = comments + d_comments,
+            score = score + d_document_likes + d_upvotes - d_downvotes
+        WHERE user_id = uid;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION scoreboard_user_trigger() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO scoreboard_userscore (id, user_id) VALUES (NEW.id, NEW.id);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER scoreboard_user_trigger
+    AFTER INSERT ON auth_user
+    FOR EACH ROW EXECUTE PROCEDURE scoreboard_user_trigger();
+
+    -- Applies the scores of an answer, including the votes it already has,
+    -- with the given sign to its author
+    CREATE FUNCTION scoreboard_answer_update(
+        answer_id integer, author_id integer, is_legacy boolean, sign integer
+    ) RETURNS void AS $$
+    BEGIN
+        IF is_legacy THEN
+            PERFORM scoreboard_update(author_id, d_legacy => sign);
+        ELSE
+            PERFORM scoreboard_update(
+                author_id,
+                d_answers => sign,
+                d_upvotes => sign * (
+                    SELECT COUNT(*) FROM answers_answer_upvotes aav WHERE aav.answer_id = $1
+                )::integer,
+                d_downvotes => sign * (
+                    SELECT COUNT(*) FROM answers_answer_downvotes aav WHERE aav.answer_id = $1
+                )::integer
+            );
+        END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION scoreboard_answer_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            IF OLD.author_id = NEW.author_id AND OLD.is_legacy_answer = NEW.is_legacy_answer THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM scoreboard_answer_update(OLD.id, OLD.author_id, OLD.is_legacy_answer, -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            PERFORM scoreboard_answer_update(NEW.id, NEW.author_id, NEW.is_legacy_answer, 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER scoreboard_answer_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF author_id, is_legacy_answer ON answers_answer
+    FOR EACH ROW EXECUTE PROCEDURE scoreboard_answer_trigger();
+
+    CREATE FUNCTION scoreboard_answer_upvote_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM scoreboard_update(aa.author_id, d_upvotes => 1)
+            FROM answers_answer aa WHERE aa.id = NEW.answer_id AND NOT aa.is_legacy_answer;
+        ELSE
+            PERFORM scoreboard_update(aa.author_id, d_upvotes => -1)
+            FROM answers_answer aa WHERE aa.id = OLD.answer_id AND NOT aa.is_legacy_answer;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION scoreboard_answer_downvote_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM scoreboard_update(aa.author_id, d_downvotes => 1)
+            FROM answers_answer aa WHERE aa.id = NEW.answer_id AND NOT aa.is_legacy_answer;
+        ELSE
+            PERFORM scoreboard_update(aa.author_id, d_downvotes => -1)
+            FROM answers_answer aa WHERE aa.id = OLD.answer_id AND NOT aa.is_legacy_answer;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER scoreboard_answer_upvote_trigger
+    AFTER INSERT OR DELETE ON answers_answer_upvotes
+    FOR EACH ROW EXECUTE PROCEDURE scoreboard_answer_upvote_trigger();
+
+    CREATE TRIGGER scoreboard_answer_downvote_trigger
+    AFTER INSERT OR DELETE ON answers_answer_downvotes
+    FOR EACH ROW EXECUTE PROCEDURE scoreboard_answer_downvote_trigger();
+
+    CREATE FUNCTION scoreboard_comment_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            IF OLD.author_id IS NOT DISTINCT FROM NEW.author_id THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM scoreboard_update(OLD.author_id, d_comments => -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            PERFORM scoreboard_update(NEW.author_id, d_comments => 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER scoreboard_comment_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF author_id ON answers_comment
+    FOR EACH ROW EXECUTE PROCEDURE scoreboard_comment_trigger();
+
+    CREATE FUNCTION scoreboard_answersection_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            IF OLD.author_id IS NOT DISTINCT FROM NEW.author_id THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM scoreboard_update(OLD.author_id, d_cuts => -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            PERFORM scoreboard_update(NEW.author_id, d_cuts => 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER scoreboard_answersection_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF author_id ON answers_answersection
+    FOR EACH ROW EXECUTE PROCEDURE scoreboard_answersection_trigger();
+
+    -- Applies the scores of a document, including the likes it already has,
+    -- with the given sign to its author
+    CREATE FUNCTION scoreboard_document_update(
+        document_id integer, author_id integer, sign integer
+    ) RETURNS void AS $$
+    BEGIN
+        PERFORM scoreboard_update(
+            author_id,
+            d_documents => sign,
+            d_document_likes => sign * (
+                SELECT COUNT(*) FROM documents_document_likes ddl WHERE ddl.document_id = $1
+            )::integer
+        );
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION scoreboard_document_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            IF OLD.author_id IS NOT DISTINCT FROM NEW.author_id THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM scoreboard_document_update(OLD.id, OLD.author_id, -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            PERFORM scoreboard_document_update(NEW.id, NEW.author_id, 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER scoreboard_document_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF author_id ON documents_document
+    FOR EACH ROW EXECUTE PROCEDURE scoreboard_document_trigger();
+
+    CREATE FUNCTION scoreboard_document_like_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM scoreboard_update(dd.author_id, d_document_likes => 1)
+            FROM documents_document dd WHERE dd.id = NEW.document_id;
+        ELSE
+            PERFORM scoreboard_update(dd.author_id, d_document_likes => -1)
+            FROM documents_document dd WHERE dd.id = OLD.document_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER scoreboard_document_like_trigger
+    AFTER INSERT OR DELETE ON documents_document_likes
+    FOR EACH ROW EXECUTE PROCEDURE scoreboard_document_like_trigger();
+    """
+
+    reverse_triggers = """
+    DROP TRIGGER IF EXISTS scoreboard_document_like_trigger ON documents_document_likes;
+    DROP TRIGGER IF EXISTS scoreboard_document_trigger ON documents_document;
+    DROP TRIGGER IF EXISTS scoreboard_answersection_trigger ON answers_answersection;
+    DROP TRIGGER IF EXISTS scoreboard_comment_trigger ON answers_comment;
+    DROP TRIGGER IF EXISTS scoreboard_answer_downvote_trigger ON answers_answer_downvotes;
+    DROP TRIGGER IF EXISTS scoreboard_answer_upvote_trigger ON answers_answer_upvotes;
+    DROP TRIGGER IF EXISTS scoreboard_answer_trigger ON answers_answer;
+    DROP TRIGGER IF EXISTS scoreboard_user_trigger ON auth_user;
+    DROP FUNCTION IF EXISTS scoreboard_document_like_trigger();
+    DROP FUNCTION IF EXISTS scoreboard_document_trigger();
+    DROP FUNCTION IF EXISTS scoreboard_document_update(integer, integer, integer);
+    DROP FUNCTION IF EXISTS scoreboard_answersection_trigger();
+    DROP FUNCTION IF EXISTS scoreboard_comment_trigger();
+    DROP FUNCTION IF EXISTS scoreboard_answer_downvote_trigger();
+    DROP FUNCTION IF EXISTS scoreboard_answer_upvote_trigger();
+    DROP FUNCTION IF EXISTS scoreboard_answer_trigger();
+    DROP FUNCTION IF EXISTS scoreboard_answer_update(integer, integer, boolean, integer);
+    DROP FUNCTION IF EXISTS scoreboard_user_trigger();
+    DROP FUNCTION IF EXISTS scoreboard_update(integer, integer, integer, integer, integer, integer, integer, integer, integer);
+    """
+
+    operations = [
+        migrations.RunSQL(
+            "DROP VIEW scoreboard_userscore;" + view,
+            reverse_sql="DROP VIEW IF EXISTS scoreboard_userscore_view;",
+        ),
+        migrations.RunSQL(
+            table,
+            reverse_sql="DROP TABLE IF EXISTS scoreboard_userscore;"
+            + view.replace("scoreboard_userscore_view", "scoreboard_userscore"),
+        ),
+        migrations.RunSQL(triggers, reverse_sql=reverse_triggers),
+    ]
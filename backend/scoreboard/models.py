@@ -2,6 +2,11 @@ from django.db import models
 
 
 class UserScore(models.Model):
+    """
+    The scores are maintained by database triggers (see migration 0005) and must not
+    be written from Django. Use the rebuild_scoreboard command to rebuild them.
+    """
+
     user = models.OneToOneField(
         "auth.User", related_name="scores", on_delete=models.DO_NOTHING
     )
@@ -13,6 +18,8 @@ class UserScore(models.Model):
     documents = models.IntegerField()
     cuts = models.IntegerField()
     legacy = models.IntegerField()
+    # document_likes + upvotes - downvotes
+    score = models.IntegerField()
 
     class Meta:
         managed = False
@@ -1,4 +1,7 @@
+from io import StringIO
+from django.core.management import call_command
 from testing.tests import ComsolTestExamData
+from answers.models import Answer
 
 class TestScoreboard(ComsolTestExamData):
 
@@ -12,4 +15,37 @@ class TestScoreboard(ComsolTestExamData):
             res = self.get('/api/scoreboard/top/{}/'.format(ty))['value']
             self.assertEqual(len(res), min(10, len(self.loginUsers)))
 
+    def test_top_invalid(self):
+        self.get('/api/scoreboard/top/unknown/', status_code=404)
+        self.get('/api/scoreboard/top/score/?limit=0', status_code=400)
+        self.get('/api/scoreboard/top/score/?limit=abc', status_code=400)
+
+    def test_scores(self):
+        res = self.get('/api/scoreboard/userinfo/{}/'.format(self.loginUsers[0]['username']))['value']
+        self.assertEqual(res['score_answers'], 4)
+        self.assertEqual(res['score_legacy'], 4)
+        self.assertEqual(res['score_cuts'], 4)
+        self.assertEqual(res['score_comments'], 16)
+        self.assertEqual(res['score'], 0)
+
+        answer = self.answers[0]
+        self.post('/api/exam/setlike/{}/'.format(answer.id), {'like': 1})
+        res = self.get('/api/scoreboard/userinfo/{}/'.format(answer.author.username))['value']
+        self.assertEqual(res['score'], 1)
+        self.post('/api/exam/setlike/{}/'.format(answer.id), {'like': -1})
+        res = self.get('/api/scoreboard/userinfo/{}/'.format(answer.author.username))['value']
+        self.assertEqual(res['score'], -1)
+        call_command('rebuild_scoreboard', '--check', stdout=StringIO())
+
+        Answer.objects.filter(pk=answer.pk).update(is_legacy_answer=True)
+        res = self.get('/api/scoreboard/userinfo/{}/'.format(answer.author.username))['value']
+        self.assertEqual(res['score'], 0)
+        self.assertEqual(res['score_legacy'], 5)
+        call_command('rebuild_scoreboard', '--check', stdout=StringIO())
+
+        self.post('/api/exam/removeanswer/{}/'.format(self.answers[1].id), {})
+        call_command('rebuild_scoreboard', '--check', stdout=StringIO())
+        call_command('rebuild_scoreboard', stdout=StringIO())
+        call_command('rebuild_scoreboard', '--check', stdout=StringIO())
+
 # TODO check whether the returned values make sense (i.e. the scores are calculated correctly
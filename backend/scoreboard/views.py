@@ -2,62 +2,61 @@ from django.db.models.expressions import Case, When
 from util import response, func_cache
 from myauth import auth_check
 from myauth.models import MyUser
+from scoreboard.models import UserScore
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, F, Q, Value as V
+from django.db.models import F, Q, Value as V
 from django.db.models.functions import Concat
 
 
 def get_user_scores(user, res):
     res.update(
         {
-            "score": user.scores.document_likes + user.scores.upvotes - user.scores.downvotes,
-            "score_answers": user.answer_set.filter(is_legacy_answer=False).count(),
-            "score_comments": user.answers_comments.count(),
-            "score_cuts": user.answersection_set.count(),
-            "score_legacy": user.answer_set.filter(is_legacy_answer=True).count(),
-            "score_documents": user.document_set.count(),
+            "score": user.scores.score,
+            "score_answers": user.scores.answers,
+            "score_comments": user.scores.comments,
+            "score_cuts": user.scores.cuts,
+            "score_legacy": user.scores.legacy,
+            "score_documents": user.scores.documents,
         }
     )
     return res
 
 
-@func_cache.cache(600)
+# The ordering of each score type
+SCORE_ORDERINGS = {
+    "score": "-score",
+    "score_answers": "-answers",
+    "score_comments": "-comments",
+    "score_documents": "-documents",
+    "score_cuts": "-cuts",
+    "score_legacy": "-legacy",
+}
+
+
+@func_cache.cache(600, shared=True)
 def get_scoreboard_top(scoretype, limit):
-    users = MyUser.objects.annotate(
+    """
+    `scoretype` has to be a key of SCORE_ORDERINGS. It is validated by the view, so that
+    only valid types end up in the shared cache.
+    """
+    scores = UserScore.objects.annotate(
+        username=F("user__username"),
         displayName=Case(
             When(
-                Q(first_name__isnull=True),
-                "last_name",
+                Q(user__first_name__isnull=True),
+                "user__last_name",
             ),
-            default=Concat("first_name", V(" "), "last_name"),
+            default=Concat("user__first_name", V(" "), "user__last_name"),
         ),
-        score=F("scores__document_likes")
-        + F("scores__upvotes")
-        - F("scores__downvotes"),
-        score_answers=F("scores__answers"),
-        score_comments=F("scores__comments"),
-        score_documents=F("scores__documents"),
-        score_cuts=F("scores__cuts"),
-        score_legacy=F("scores__legacy"),
-    )
-
-    if scoretype == "score":
-        users = users.order_by("-score")
-    elif scoretype == "score_answers":
-        users = users.order_by("-score_answers")
-    elif scoretype == "score_comments":
-        users = users.order_by("-score_comments")
-    elif scoretype == "score_documents":
-        users = users.order_by("-score_documents")
-    elif scoretype == "score_cuts":
-        users = users.order_by("-score_cuts")
-    elif scoretype == "score_legacy":
-        users = users.order_by("-score_legacy")
-    else:
-        return response.not_found()
+        score_answers=F("answers"),
+        score_comments=F("comments"),
+        score_documents=F("documents"),
+        score_cuts=F("cuts"),
+        score_legacy=F("legacy"),
+    ).order_by(SCORE_ORDERINGS[scoretype])
 
     return list(
-        users[:limit].values(
+        scores[:limit].values(
             "username",
             "displayName",
             "score",
@@ -73,7 +72,7 @@ def get_scoreboard_top(scoretype, limit):
 @response.request_get()
 @auth_check.require_login
 def userinfo(request, username):
-    user = get_object_or_404(MyUser, username=username)
+    user = get_object_or_404(MyUser.objects.select_related("scores"), username=username)
     res = {
         "username": username,
         "displayName": user.displayname(),
@@ -85,7 +84,14 @@ def userinfo(request, username):
 @response.request_get()
 @auth_check.require_login
 def scoreboard_top(request, scoretype):
-    limit = int(request.GET.get("limit", "10"))
+    if scoretype not in SCORE_ORDERINGS:
+        return response.not_found()
+    try:
+        limit = int(request.GET.get("limit", "10"))
+    except ValueError:
+        return response.not_possible("Invalid limit")
+    if limit < 1:
+        return response.not_possible("Invalid limit")
     if limit > 10 and not auth_check.has_admin_rights(request):
         return response.not_allowed()
     return response.success(value=get_scoreboard_top(scoretype, limit))
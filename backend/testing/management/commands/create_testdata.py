@@ -1,12 +1,19 @@
 from django.core.management.base import BaseCommand
 from django.core.management import call_command
 from django.conf import settings
-from util import s3_util
+from util import ids, s3_util
 from django.utils import timezone
 from datetime import timedelta
 
 from myauth.models import MyUser
-from answers.models import Answer, AnswerSection, Comment, Exam, ExamType
+from answers.models import (
+    Answer,
+    AnswerSection,
+    Comment,
+    Exam,
+    ExamType,
+    generate_long_id,
+)
 from categories.models import Category, MetaCategory
 from feedback.models import Feedback
 from filestore.models import Attachment
@@ -46,10 +53,13 @@ class Command(BaseCommand):
     def create_images(self):
         self.stdout.write("Create images")
         for user in MyUser.objects.all():
-            for i in range(user.id % 10 + 5):
-                filename = s3_util.generate_filename(
-                    16, settings.COMSOL_IMAGE_DIR, ".svg"
-                )
+            filenames = ids.reserve_ids(
+                Image,
+                "filename",
+                lambda: s3_util.generate_filename(16, ".svg"),
+                user.id % 10 + 5,
+            )
+            for filename in filenames:
                 s3_util.save_file_to_s3(
                     settings.COMSOL_IMAGE_DIR, filename, "static/test_image.svg"
                 )
@@ -106,10 +116,10 @@ class Command(BaseCommand):
     def create_exams(self):
         self.stdout.write("Create exams")
         for category in Category.objects.all():
-            for i in range(6):
-                filename = s3_util.generate_filename(
-                    8, settings.COMSOL_EXAM_DIR, ".pdf"
-                )
+            filenames = ids.reserve_ids(
+                Exam, "filename", lambda: s3_util.generate_filename(8, ".pdf"), 6
+            )
+            for i, filename in enumerate(filenames):
                 s3_util.save_file_to_s3(
                     settings.COMSOL_EXAM_DIR, filename, "exam10.pdf"
                 )
@@ -188,6 +198,10 @@ class Command(BaseCommand):
                 if i == 6:
                     answer.is_legacy_answer = True
                 objs.append(answer)
+        # bulk_create doesn't retry on conflicts like Answer.save
+        long_ids = ids.reserve_ids(Answer, "long_id", generate_long_id, len(objs))
+        for answer, long_id in zip(objs, long_ids):
+            answer.long_id = long_id
         Answer.objects.bulk_create(objs)
         
         for answer in Answer.objects.all():
@@ -220,6 +234,9 @@ class Command(BaseCommand):
                     ][(answer.id + i) % 2],
                 )
                 objs.append(comment)
+        long_ids = ids.reserve_ids(Comment, "long_id", generate_long_id, len(objs))
+        for comment, long_id in zip(objs, long_ids):
+            comment.long_id = long_id
         Comment.objects.bulk_create(objs)
 
     def create_feedback(self):
@@ -238,9 +255,7 @@ class Command(BaseCommand):
         self.stdout.write("Create attachments")
         for exam in Exam.objects.all():
             if exam.id % 7 == 0:
-                filename = s3_util.generate_filename(
-                    16, settings.COMSOL_FILESTORE_DIR, ".pdf"
-                )
+                filename = s3_util.generate_filename(16, ".pdf")
                 s3_util.save_file_to_s3(
                     settings.COMSOL_FILESTORE_DIR, filename, "exam10.pdf"
                 )
@@ -251,9 +266,7 @@ class Command(BaseCommand):
                 ).save()
         for category in Category.objects.all():
             if category.id % 7 == 0:
-                filename = s3_util.generate_filename(
-                    16, settings.COMSOL_FILESTORE_DIR, ".pdf"
-                )
+                filename = s3_util.generate_filename(16, ".pdf")
                 s3_util.save_file_to_s3(
                     settings.COMSOL_FILESTORE_DIR, filename, "exam10.pdf"
                 )
@@ -289,9 +302,7 @@ class Command(BaseCommand):
             if user.id % 7 == 0:
                 Payment(user=user).save()
                 if user.id % 9 == 0:
-                    filename = s3_util.generate_filename(
-                        8, settings.COMSOL_EXAM_DIR, ".pdf"
-                    )
+                    filename = s3_util.generate_filename(8, ".pdf")
                     s3_util.save_file_to_s3(
                         settings.COMSOL_EXAM_DIR, filename, "exam10.pdf"
                     )
@@ -33,6 +33,7 @@ def get_token(user):
             "preferred_username": username,
             "given_name": given_name,
             "family_name": family_name,
+            "home_organization": "unisg.ch",
         },
     )
     token.make_signed_token(key)
@@ -63,11 +63,15 @@ def _check_smb_connection(username, password):
 def _print_pdf(username, password, exam, pdf_path):
     """
     Sends a PDF to the student print queue using the samba printer interface.
+    The PDF is deleted once it is converted.
     Raises an exception if the job is killed after a maximum execution time.
     """
 
     # Generate the PostScript file
-    ps_path = _generate_ps(exam, pdf_path)
+    try:
+        ps_path = _generate_ps(exam, pdf_path)
+    finally:
+        os.remove(pdf_path)
     if not ps_path:
         return 1
 
@@ -1,29 +1,242 @@
+"""
+Caches the results of functions for a fixed amount of time.
+
+Every cached function keeps its results in a size bounded LRU cache of the current
+process. Functions cached with `shared=True` store their results in the Django cache
+`COMSOL_FUNC_CACHE_BACKEND` instead, which is shared by all workers if it is configured
+accordingly. Resetting a key of such a function therefore invalidates it in all
+processes.
+
+Only one caller recomputes a missing or expired entry at a time, all other callers
+asking for the same key wait for its result instead of recomputing it themselves.
+Model instances in the arguments are replaced by their primary key when building the
+cache key, so the cache does not hold on to them.
+
+While `settings.TESTING` is set every cached function is called directly, so only tests
+running with `override_settings(TESTING=False)` exercise the caching.
+"""
+import hashlib
+import random
+import threading
 import time
+from collections import OrderedDict
 
 from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db.models import Model
+from prometheus_client import Counter, Gauge
+
+func_cache_hits = Counter(
+    "comsol_func_cache_hits", "Number of cache hits of cached functions", ["function"]
+)
+func_cache_misses = Counter(
+    "comsol_func_cache_misses", "Number of cache misses of cached functions", ["function"]
+)
+func_cache_size = Gauge(
+    "comsol_func_cache_size",
+    "Number of entries in the local cache of cached functions",
+    ["function"],
+    multiprocess_mode="livesum",
+)
+
+_missing = object()
+
+# How long a worker may hold the lock for computing a shared entry
+LOCK_TIMEOUT = 10
+
+
+class SharedFileCache(FileBasedCache):
+    """
+    A FileBasedCache which only checks whether it has to cull on one in
+    `CULL_INTERVAL` sets. FileBasedCache lists the whole cache directory on every set,
+    which takes about 17 ms with 10000 entries in /dev/shm, compared to 15 us for a
+    get. Checking on every 100th set brings that down to about 0.2 ms per set, while
+    the cache can grow by a few hundred entries beyond MAX_ENTRIES between checks.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = int(params.get("OPTIONS", {}).get("CULL_INTERVAL", 100))
+
+    def _cull(self):
+        if random.randrange(self._cull_interval) == 0:
+            super()._cull()
+
+
+class LRUCache:
+    """
+    A thread safe cache holding at most `max_size` entries which are valid for
+    `validity` seconds, unless a different validity is given when setting them. Once
+    full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size, validity):
+        self.max_size = max_size
+        self.validity = validity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value, expires = self.entries[key]
+            if expires < time.time():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, validity=None):
+        if validity is None:
+            validity = self.validity
+        with self.lock:
+            self.entries[key] = (value, time.time() + validity)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def make_key(args):
+    return tuple(
+        (arg._meta.label, arg.pk) if isinstance(arg, Model) else arg for arg in args
+    )
+
+
+class FuncCache:
+    def __init__(self, fun, validity, shared):
+        self.fun = fun
+        self.validity = validity
+        self.shared = shared
+        self.name = fun.__module__ + "." + fun.__qualname__
+        self.local = LRUCache(settings.COMSOL_FUNC_CACHE_SIZE, validity)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def backend(self):
+        return caches[settings.COMSOL_FUNC_CACHE_BACKEND]
+
+    def shared_key(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return "func_cache:" + self.name + ":" + digest
+
+    def lookup(self, key):
+        if self.shared:
+            return self.backend().get(self.shared_key(key), _missing)
+        return self.local.get(key, _missing)
+
+    def store(self, key, value):
+        if self.shared:
+            self.backend().set(self.shared_key(key), value, self.validity)
+        else:
+            self.local.set(key, value)
+            func_cache_size.labels(self.name).set(len(self.local))
+
+    def compute(self, key, args):
+        """
+        Computes the value for `key`. If another worker is already computing it, we
+        wait for its result as long as it holds the lock, and only compute it ourselves
+        if it released the lock without storing a value or the lock expired.
+        """
+        if not self.shared:
+            return self.fun(*args)
+        lock_key = self.shared_key(key) + ":lock"
+        if not self.backend().add(lock_key, 1, LOCK_TIMEOUT):
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.lookup(key)
+                if value is not _missing:
+                    return value
+                if self.backend().get(lock_key) is None:
+                    break
+            return self.fun(*args)
+        try:
+            return self.fun(*args)
+        finally:
+            self.backend().delete(lock_key)
+
+    def __call__(self, *args):
+        if settings.TESTING:
+            return self.fun(*args)
+        key = make_key(args)
+        value = self.lookup(key)
+        if value is not _missing:
+            func_cache_hits.labels(self.name).inc()
+            return value
+        func_cache_misses.labels(self.name).inc()
+
+        with self.lock:
+            event = self.in_flight.get(key)
+            is_leader = event is None
+            if is_leader:
+                event = self.in_flight[key] = threading.Event()
+        if not is_leader:
+            event.wait()
+            value = self.lookup(key)
+            if value is not _missing:
+                return value
+            # The leader failed, we try it ourselves
+            return self.fun(*args)
+
+        try:
+            value = self.compute(key, args)
+            self.store(key, value)
+            return value
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            event.set()
+
+    def reset_cache(self, key):
+        """
+        Removes the entry for the arguments `key`. For shared functions the entry is
+        removed for all processes.
+        """
+        key = make_key(key)
+        if self.shared:
+            self.backend().delete(self.shared_key(key))
+        else:
+            self.local.delete(key)
+
 
+def get_generation(key):
+    """
+    Returns the generation counter stored under `key` in the shared cache. Including
+    it in cache keys and bumping it invalidates all entries built with an older
+    generation. If it is missing, e.g. because the shared cache evicted it, it starts
+    again from the current time, so no earlier generation is reused.
+    """
+    backend = caches[settings.COMSOL_FUNC_CACHE_BACKEND]
+    generation = backend.get(key)
+    if generation is None:
+        backend.add(key, time.time_ns(), timeout=None)
+        generation = backend.get(key)
+    return generation
 
-def cache(validity):
-    class FuncCache:
-        def __init__(self, fun):
-            self.fun = fun
-            self.cache = {}
-            self.cache_time = {}
 
-        def __call__(self, *item):
-            if (
-                settings.TESTING
-                or item not in self.cache
-                or time.time() - self.cache_time[item] > validity
-            ):
-                self.cache[item] = self.fun(*item)
-                self.cache_time[item] = time.time()
-            return self.cache[item]
+def bump_generation(key):
+    backend = caches[settings.COMSOL_FUNC_CACHE_BACKEND]
+    try:
+        backend.incr(key)
+    except ValueError:
+        backend.add(key, time.time_ns(), timeout=None)
 
-        def reset_cache(self, key):
-            if key in self.cache:
-                del self.cache[key]
-                del self.cache_time[key]
 
-    return FuncCache
+def cache(validity, shared=False):
+    def wrap_func(fun):
+        return FuncCache(fun, validity, shared)
 
+    return wrap_func
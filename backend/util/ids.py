@@ -0,0 +1,60 @@
+"""
+Random ids, e.g. for the filenames of uploaded files and the long ids of answers.
+
+Ids are drawn with `secrets`, so they can't be guessed. With 16 characters they have 82
+bits of entropy, which makes conflicts practically impossible. Instead of checking
+whether an id is free before using it, objects are inserted right away and the unique
+constraint of the field catches conflicts: `save_with_unique_id` then retries the
+insert with a new id. Outside of an atomic block this costs no additional queries,
+inside of one the insert needs a savepoint to be retried.
+"""
+import secrets
+
+from django.db import IntegrityError, transaction
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+MAX_ATTEMPTS = 5
+
+
+def random_id(length):
+    return "".join(secrets.choice(ALPHABET) for _ in range(length))
+
+
+def save_with_unique_id(obj, field, generate, save=None):
+    """
+    Inserts `obj`. If the value of `field` is already taken, it is replaced with
+    `generate()` and the insert is retried. `save` inserts the object, `obj.save` by
+    default.
+    """
+    save = save or obj.save
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            if transaction.get_connection().in_atomic_block:
+                with transaction.atomic():
+                    return save()
+            return save()
+        except IntegrityError:
+            # Only reached on conflicts, so checking the cause is not on the hot path
+            taken = (
+                type(obj)
+                ._default_manager.filter(**{field: getattr(obj, field)})
+                .exists()
+            )
+            if not taken or attempt == MAX_ATTEMPTS:
+                raise
+            setattr(obj, field, generate())
+
+
+def reserve_ids(model, field, generate, count):
+    """
+    Returns `count` distinct ids from `generate()` which are not taken in `field` of
+    `model`, for bulk inserts. All ids are checked with a single query.
+    """
+    ids = set()
+    while len(ids) < count:
+        candidates = {generate() for _ in range(count - len(ids))} - ids
+        taken = model._default_manager.filter(
+            **{field + "__in": candidates}
+        ).values_list(field, flat=True)
+        ids |= candidates.difference(taken)
+    return list(ids)
@@ -1,15 +1,66 @@
 import os
-import random
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from typing import Optional
+from urllib.parse import urlsplit
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.core.files.uploadedfile import UploadedFile
-from django.http import FileResponse
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+)
+from django.utils.http import http_date, parse_http_date_safe
+from prometheus_client import Counter, Histogram
+
+from util import func_cache, ids, response
+
+s3_request_duration = Histogram(
+    "comsol_s3_request_duration_seconds",
+    "Duration of S3 requests, including retries",
+    ["operation"],
+)
+s3_request_errors = Counter(
+    "comsol_s3_request_errors",
+    "Number of S3 requests which raised an error, including missing objects",
+    ["operation"],
+)
+
+
+@contextmanager
+def observe(operation):
+    try:
+        with s3_request_duration.labels(operation).time():
+            yield
+    except Exception:
+        s3_request_errors.labels(operation).inc()
+        raise
+
+
+def get_client_config():
+    """
+    Idle connections are kept in the pool and reused. Failed requests are retried with
+    COMSOL_S3_RETRY_MODE, the default adaptive mode also slows down the client if S3
+    throttles us.
+    """
+    return Config(
+        signature_version="s3v4",
+        max_pool_connections=settings.COMSOL_S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.COMSOL_S3_CONNECT_TIMEOUT,
+        read_timeout=settings.COMSOL_S3_READ_TIMEOUT,
+        retries={
+            "max_attempts": settings.COMSOL_S3_MAX_ATTEMPTS,
+            "mode": settings.COMSOL_S3_RETRY_MODE,
+        },
+    )
 
-from util import response
 
 if "SIP_S3_FILES_HOST" in os.environ:
     endpoint = (
@@ -22,19 +73,23 @@ if "SIP_S3_FILES_HOST" in os.environ:
         "endpoint_url": endpoint,
         "aws_access_key_id": os.environ["SIP_S3_FILES_ACCESS_KEY"],
         "aws_secret_access_key": os.environ["SIP_S3_FILES_SECRET_KEY"],
-        "config": Config(signature_version="s3v4"),
+        "config": get_client_config(),
         "region_name": "vis-is-great-1",
     }
     s3 = boto3.resource("s3", **options)
-    s3_client = boto3.client("s3", **options)
+    # The resource and the client share the connection pool
+    s3_client = s3.meta.client
     s3_bucket_name = os.environ["SIP_S3_FILES_BUCKET"]
     s3_bucket = s3.Bucket(s3_bucket_name)
 
 
-def save_uploaded_file_to_disk(dest: str, uploaded_file: UploadedFile):
-    with open(dest, "wb+") as destination:
-        for chunk in uploaded_file.chunks():
-            destination.write(chunk)
+def get_transfer_config():
+    # Parts are sent one after the other, the gevent workers should not start threads
+    return TransferConfig(
+        multipart_threshold=settings.COMSOL_S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=settings.COMSOL_S3_MULTIPART_CHUNKSIZE,
+        use_threads=False,
+    )
 
 
 def save_uploaded_file_to_s3(
@@ -43,13 +98,19 @@ def save_uploaded_file_to_s3(
     uploaded_file: UploadedFile,
     content_type: Optional[str] = None,
 ):
-    temp_file_path = os.path.join(settings.COMSOL_UPLOAD_FOLDER, filename)
-    save_uploaded_file_to_disk(temp_file_path, uploaded_file)
+    """
+    Streams the uploaded file to S3 without writing it to disk first. Large files are
+    sent with a multipart upload, so only one part is held in memory at a time.
+    """
     if content_type is None:
         content_type = uploaded_file.content_type
-    with open(temp_file_path, "rb") as temp_file:
-        s3_bucket.put_object(
-            Body=temp_file, Key=directory + filename, ContentType=content_type
+    uploaded_file.seek(0)
+    with observe("upload"):
+        s3_bucket.upload_fileobj(
+            uploaded_file,
+            directory + filename,
+            ExtraArgs={"ContentType": content_type},
+            Config=get_transfer_config(),
         )
 
 
@@ -59,15 +120,19 @@ def save_file_to_s3(
     path: str,
     content_type: str = "application/octet-stream",
 ):
-    with open(path, "rb") as file:
-        s3_bucket.put_object(
-            Body=file, Key=directory + filename, ContentType=content_type
+    with observe("upload"):
+        s3_bucket.upload_file(
+            path,
+            directory + filename,
+            ExtraArgs={"ContentType": content_type},
+            Config=get_transfer_config(),
         )
 
 
 def delete_file(directory, filename):
     try:
-        s3_client.delete_object(Bucket=s3_bucket_name, Key=directory + filename)
+        with observe("delete_object"):
+            s3_client.delete_object(Bucket=s3_bucket_name, Key=directory + filename)
     except ClientError:
         return False
     return True
@@ -76,9 +141,10 @@ def delete_file(directory, filename):
 def delete_files(directory: str, filenames):
     try:
         objects_to_delete = [{"Key": directory + filename} for filename in filenames]
-        s3_client.delete_objects(
-            Bucket=s3_bucket_name, Delete={"Objects": objects_to_delete}
-        )
+        with observe("delete_objects"):
+            s3_client.delete_objects(
+                Bucket=s3_bucket_name, Delete={"Objects": objects_to_delete}
+            )
     except ClientError:
         return False
     return True
@@ -86,18 +152,50 @@ def delete_files(directory: str, filenames):
 
 def save_file(directory: str, filename: str, destination: str):
     try:
-        s3_bucket.download_file(directory + filename, destination)
+        with observe("download"):
+            s3_bucket.download_file(directory + filename, destination)
         return True
     except ClientError:
         return False
 
 
-def presigned_get_object(
+@func_cache.cache(
+    settings.COMSOL_S3_PRESIGNED_URL_VALIDITY - settings.COMSOL_S3_PRESIGNED_URL_MARGIN,
+    shared=True,
+)
+def cached_presigned_get_object(
     directory: str,
     filename: str,
-    inline: bool = True,
-    content_type: Optional[str] = None,
-    display_name: Optional[str] = None,
+    content_disposition: str,
+    content_type: Optional[str],
+):
+    """
+    Signs a URL for the object. The URL is reused until COMSOL_S3_PRESIGNED_URL_MARGIN
+    seconds before it expires, so browsers can cache the object under it.
+    """
+    params = {
+        "Bucket": s3_bucket_name,
+        "Key": directory + filename,
+        "ResponseContentDisposition": content_disposition,
+    }
+    # botocore rejects None, without it S3 returns the stored content type
+    if content_type is not None:
+        params["ResponseContentType"] = content_type
+    with observe("presign"):
+        return s3_client.generate_presigned_url(
+            ClientMethod="get_object",
+            Params=params,
+            ExpiresIn=settings.COMSOL_S3_PRESIGNED_URL_VALIDITY,
+            HttpMethod="GET",
+        )
+
+
+def get_presigned_args(
+    directory: str,
+    filename: str,
+    inline: bool,
+    content_type: Optional[str],
+    display_name: Optional[str],
 ):
     if display_name is None:
         display_name = filename
@@ -106,60 +204,160 @@ def presigned_get_object(
         content_disposition = "inline; filename=" + display_name
     else:
         content_disposition = "attachment; filename=" + display_name
-    return s3_client.generate_presigned_url(
-        ClientMethod="get_object",
-        Params={
-            "Bucket": s3_bucket_name,
-            "Key": directory + filename,
-            "ResponseContentDisposition": content_disposition,
-            "ResponseContentType": content_type,
-        },
-        ExpiresIn=60 * 60 * 24,
-        HttpMethod="GET",
+    return (directory, filename, content_disposition, content_type)
+
+
+def presigned_get_object(
+    directory: str,
+    filename: str,
+    inline: bool = True,
+    content_type: Optional[str] = None,
+    display_name: Optional[str] = None,
+    renew: bool = False,
+):
+    """
+    Returns a presigned URL for the object. Set `renew` if the object was replaced, so
+    that no URL under which browsers may have cached the old object is returned.
+    """
+    args = get_presigned_args(directory, filename, inline, content_type, display_name)
+    if renew:
+        cached_presigned_get_object.reset_cache(args)
+    return cached_presigned_get_object(*args)
+
+
+def reset_presigned_get_object(
+    directory: str,
+    filename: str,
+    inline: bool = True,
+    content_type: Optional[str] = None,
+    display_name: Optional[str] = None,
+):
+    """
+    Drops the cached URL for the object without signing a new one, the next call of
+    `presigned_get_object` with the same arguments signs a new URL.
+    """
+    cached_presigned_get_object.reset_cache(
+        get_presigned_args(directory, filename, inline, content_type, display_name)
+    )
+
+
+def get_cache_control(immutable: bool, max_age: int):
+    if immutable:
+        return "public, max-age={}".format(max_age)
+    return "no-cache"
+
+
+def proxy_file(
+    request: HttpRequest,
+    directory: str,
+    filename: str,
+    as_attachment: bool,
+    attachment_filename: str,
+    immutable: bool,
+):
+    """
+    Streams the object through this worker. Range and conditional requests are
+    forwarded to S3.
+    """
+    params = {"Bucket": s3_bucket_name, "Key": directory + filename}
+    if "Range" in request.headers:
+        params["Range"] = request.headers["Range"]
+    if "If-None-Match" in request.headers:
+        params["IfNoneMatch"] = request.headers["If-None-Match"]
+    if "If-Modified-Since" in request.headers:
+        since = parse_http_date_safe(request.headers["If-Modified-Since"])
+        if since is not None:
+            params["IfModifiedSince"] = datetime.fromtimestamp(since, timezone.utc)
+    cache_control = get_cache_control(immutable, settings.COMSOL_S3_FILE_MAX_AGE)
+    try:
+        with observe("get_object"):
+            data = s3_client.get_object(**params)
+    except ClientError as e:
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status == 304:
+            res = HttpResponseNotModified()
+            res["ETag"] = e.response.get("ResponseMetadata", {}).get(
+                "HTTPHeaders", {}
+            ).get("etag", "")
+            res["Cache-Control"] = cache_control
+            return res
+        if status == 416:
+            return HttpResponse(status=416)
+        return response.not_found()
+
+    res = FileResponse(
+        data["Body"],
+        as_attachment=as_attachment,
+        filename=attachment_filename,
+        status=206 if "ContentRange" in data else 200,
     )
+    res["Content-Length"] = data["ContentLength"]
+    res["Accept-Ranges"] = "bytes"
+    if "ContentRange" in data:
+        res["Content-Range"] = data["ContentRange"]
+    res["ETag"] = data["ETag"]
+    res["Last-Modified"] = http_date(data["LastModified"].timestamp())
+    res["Cache-Control"] = cache_control
+    return res
 
 
 def send_file(
+    request: HttpRequest,
     directory: str,
     filename: str,
     as_attachment: bool = False,
     attachment_filename: Optional[str] = None,
+    mode: str = "proxy",
+    immutable: bool = False,
 ):
-    try:
-        attachment_filename = attachment_filename or filename
-        data = s3_client.get_object(
-            Bucket=s3_bucket_name,
-            Key=directory + filename,
-        )
-        return FileResponse(
-            data["Body"], as_attachment=as_attachment, filename=attachment_filename
+    """
+    Sends an object of the bucket with the delivery `mode`:
+    - "proxy" streams it through this worker.
+    - "redirect" redirects to a presigned URL.
+    - "accel" lets the reverse proxy fetch the presigned URL under
+      COMSOL_S3_ACCEL_REDIRECT_LOCATION with an X-Accel-Redirect header.
+    With redirects S3 handles range and conditional requests itself. Set `immutable`
+    if the object is never replaced, so that clients may cache it.
+    """
+    attachment_filename = attachment_filename or filename
+    if mode == "proxy":
+        return proxy_file(
+            request, directory, filename, as_attachment, attachment_filename, immutable
         )
-    except ClientError:
-        return response.not_found()
-
 
-def is_file_in_s3(directory, filename):
-    try:
-        s3_client.head_object(Bucket=s3_bucket_name, Key=directory + filename)
-        return True
-    except ClientError:
-        return False
+    url = presigned_get_object(
+        directory,
+        filename,
+        inline=not as_attachment,
+        display_name=attachment_filename,
+    )
+    if mode == "redirect":
+        res = HttpResponseRedirect(url)
+        # The cached URL is valid for at least this long
+        max_age = settings.COMSOL_S3_PRESIGNED_URL_MARGIN
+    elif mode == "accel":
+        url = urlsplit(url)
+        res = HttpResponse()
+        res["X-Accel-Redirect"] = "{}{}?{}".format(
+            settings.COMSOL_S3_ACCEL_REDIRECT_LOCATION.rstrip("/"), url.path, url.query
+        )
+        # The proxy takes the content type from the S3 response
+        del res["Content-Type"]
+        max_age = settings.COMSOL_S3_FILE_MAX_AGE
+    else:
+        raise ValueError("Unknown delivery mode " + mode)
+    res["Cache-Control"] = get_cache_control(immutable, max_age)
+    return res
 
 
-def generate_filename(length, directory, extension):
+def generate_filename(length, extension):
     """
-    Generates a random filename
+    Generates a random filename. Its uniqueness is enforced by the database, see
+    util.ids.save_with_unique_id.
     :param length: length of the generated filename
-    :param directory: directory to check for file existence
     :param extension: extension of the filename
     """
-    chars = "abcdefghijklmnopqrstuvwxyz0123456789"
-    res = ""
-    while len(res) < length:
-        res += random.choice(chars)
-    if is_file_in_s3(directory, res + extension):
-        return generate_filename(length, directory, extension)
-    return res + extension
+    return ids.random_id(length) + extension
 
 
 def check_filename(filename, exts):
@@ -0,0 +1,302 @@
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+import boto3
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from answers.models import Answer, Comment
+from images.models import Image
+from testing.tests import ComsolTestExamData
+from util import ids, s3_util
+from util.func_cache import (
+    FuncCache,
+    LRUCache,
+    SharedFileCache,
+    _missing,
+    cache,
+    make_key,
+)
+
+
+@override_settings(TESTING=False)
+class TestFuncCache(SimpleTestCase):
+    def test_lru_eviction(self):
+        lru = LRUCache(2, 60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        self.assertEqual(lru.get("a"), 1)
+        lru.set("c", 3)
+        self.assertEqual(lru.get("b"), None)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertEqual(lru.get("c"), 3)
+        self.assertEqual(len(lru), 2)
+
+    def test_lru_expiry(self):
+        lru = LRUCache(2, 0)
+        lru.set("a", 1)
+        time.sleep(0.01)
+        self.assertEqual(lru.get("a", "missing"), "missing")
+
+    def test_cached(self):
+        calls = []
+
+        @cache(60)
+        def square(x):
+            calls.append(x)
+            return x * x
+
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(calls, [3])
+        square.reset_cache((3,))
+        self.assertEqual(square(3), 9)
+        self.assertEqual(calls, [3, 3])
+
+    def test_single_flight(self):
+        calls = []
+
+        @cache(60)
+        def slow(x):
+            calls.append(x)
+            time.sleep(0.2)
+            return x
+
+        threads = [threading.Thread(target=slow, args=(1,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [1])
+
+    def test_shared_reset(self):
+        calls = []
+
+        def value(x):
+            calls.append(x)
+            return len(calls)
+
+        # Two instances of the same function behave like two worker processes
+        first = FuncCache(value, 60, True)
+        second = FuncCache(value, 60, True)
+        self.assertEqual(first(1), 1)
+        self.assertEqual(second(1), 1)
+        second.reset_cache((1,))
+        self.assertEqual(first(1), 2)
+        first.reset_cache((1,))
+
+    def test_shared_waits_for_lock_holder(self):
+        calls = []
+
+        def value(x):
+            calls.append(x)
+            return "computed"
+
+        leader = FuncCache(value, 60, True)
+        waiter = FuncCache(value, 60, True)
+        key = leader.shared_key((1,))
+        # The leader holds the lock for longer than the old one second poll
+        leader.backend().add(key + ":lock", 1, 10)
+        timer = threading.Timer(1.2, lambda: leader.store((1,), "stored"))
+        timer.start()
+        try:
+            self.assertEqual(waiter(1), "stored")
+        finally:
+            timer.join()
+            leader.backend().delete(key + ":lock")
+            leader.reset_cache((1,))
+        self.assertEqual(calls, [])
+
+    def test_shared_file_cache_culls(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = SharedFileCache(
+                directory, {"OPTIONS": {"MAX_ENTRIES": 4, "CULL_INTERVAL": 1}}
+            )
+            for i in range(10):
+                file_cache.set(i, i)
+            self.assertLessEqual(len(file_cache._list_cache_files()), 4)
+
+
+class TestSendFile(SimpleTestCase):
+    """
+    Presigning happens locally, so a client with made up credentials suffices. Only
+    get_object of the proxy mode is stubbed.
+    """
+
+    def setUp(self):
+        self.client = boto3.client(
+            "s3",
+            endpoint_url="http://s3.invalid:9000",
+            aws_access_key_id="key",
+            aws_secret_access_key="secret",
+            region_name="vis-is-great-1",
+            config=s3_util.get_client_config(),
+        )
+        self.saved = {
+            name: getattr(s3_util, name, None) for name in ("s3_client", "s3_bucket_name")
+        }
+        s3_util.s3_client = self.client
+        s3_util.s3_bucket_name = "bucket"
+        self.request = RequestFactory().get("/")
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            if value is None:
+                delattr(s3_util, name)
+            else:
+                setattr(s3_util, name, value)
+
+    def test_redirect(self):
+        res = s3_util.send_file(
+            self.request, "images/", "a.svg", mode="redirect", immutable=True
+        )
+        self.assertEqual(res.status_code, 302)
+        url = urlsplit(res["Location"])
+        self.assertEqual(url.path, "/bucket/images/a.svg")
+        query = parse_qs(url.query)
+        self.assertEqual(query["response-content-disposition"], ["inline; filename=a.svg"])
+        self.assertNotIn("response-content-type", query)
+        self.assertEqual(
+            res["Cache-Control"],
+            "public, max-age={}".format(settings.COMSOL_S3_PRESIGNED_URL_MARGIN),
+        )
+
+    def test_accel(self):
+        res = s3_util.send_file(
+            self.request,
+            "files/",
+            "a.pdf",
+            as_attachment=True,
+            attachment_filename="b.pdf",
+            mode="accel",
+        )
+        self.assertEqual(res.status_code, 200)
+        location = urlsplit(res["X-Accel-Redirect"])
+        self.assertEqual(
+            location.path,
+            settings.COMSOL_S3_ACCEL_REDIRECT_LOCATION.rstrip("/") + "/bucket/files/a.pdf",
+        )
+        self.assertEqual(
+            parse_qs(location.query)["response-content-disposition"],
+            ["attachment; filename=b.pdf"],
+        )
+        self.assertNotIn("Content-Type", res)
+        self.assertEqual(res["Cache-Control"], "no-cache")
+
+    def test_proxy(self):
+        with Stubber(self.client) as stubber:
+            stubber.add_response(
+                "get_object",
+                {
+                    "Body": StreamingBody(BytesIO(b"content"), 7),
+                    "ContentLength": 7,
+                    "ETag": '"etag"',
+                    "LastModified": datetime(2020, 1, 1, tzinfo=timezone.utc),
+                },
+                {"Bucket": "bucket", "Key": "files/a.pdf"},
+            )
+            res = s3_util.send_file(
+                self.request, "files/", "a.pdf", mode="proxy", immutable=True
+            )
+            stubber.assert_no_pending_responses()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b"".join(res.streaming_content), b"content")
+        self.assertEqual(res["ETag"], '"etag"')
+        self.assertEqual(
+            res["Cache-Control"],
+            "public, max-age={}".format(settings.COMSOL_S3_FILE_MAX_AGE),
+        )
+
+    @override_settings(TESTING=False)
+    def test_reset(self):
+        cached = s3_util.cached_presigned_get_object
+        key = make_key(
+            s3_util.get_presigned_args("files/", "a.pdf", False, None, "b.pdf")
+        )
+        s3_util.presigned_get_object("files/", "a.pdf", inline=False, display_name="b.pdf")
+        self.assertIsNot(cached.lookup(key), _missing)
+        s3_util.reset_presigned_get_object(
+            "files/", "a.pdf", inline=False, display_name="b.pdf"
+        )
+        self.assertIs(cached.lookup(key), _missing)
+
+    def test_content_type(self):
+        url = s3_util.presigned_get_object(
+            "files/", "a.pdf", content_type="application/pdf"
+        )
+        self.assertEqual(
+            parse_qs(urlsplit(url).query)["response-content-type"], ["application/pdf"]
+        )
+
+
+class TestIds(ComsolTestExamData):
+    def test_random_id(self):
+        res = ids.random_id(16)
+        self.assertEqual(len(res), 16)
+        self.assertTrue(set(res) <= set(ids.ALPHABET))
+        self.assertNotEqual(res, ids.random_id(16))
+
+    def test_retry_on_conflict(self):
+        taken = self.answers[0].long_id
+        answer = Answer(
+            answer_section=self.sections[0],
+            author=self.get_my_user(),
+            text="Conflicting Answer",
+            long_id=taken,
+        )
+        answer.save()
+        self.assertNotEqual(answer.long_id, taken)
+        self.assertEqual(Answer.objects.get(pk=answer.pk).long_id, answer.long_id)
+
+    def test_comment_ids_are_independent_of_answers(self):
+        long_id = self.answers[0].long_id
+        comment = Comment(
+            answer=self.answers[0],
+            author=self.get_my_user(),
+            text="Comment",
+            long_id=long_id,
+        )
+        comment.save()
+        self.assertEqual(comment.long_id, long_id)
+
+        comment = Comment(
+            answer=self.answers[0],
+            author=self.get_my_user(),
+            text="Conflicting Comment",
+            long_id=long_id,
+        )
+        comment.save()
+        self.assertNotEqual(comment.long_id, long_id)
+
+    def test_no_query_without_conflict(self):
+        image = Image(filename="abc.svg", owner=self.get_my_user(), displayname="a")
+        # Savepoint, insert and release of the savepoint
+        with self.assertNumQueries(3):
+            ids.save_with_unique_id(image, "filename", lambda: "def.svg")
+        self.assertEqual(image.filename, "abc.svg")
+
+    def test_other_errors_are_raised(self):
+        image = Image(filename="abc.svg", owner_id=None, displayname="a")
+        with self.assertRaises(IntegrityError):
+            ids.save_with_unique_id(image, "filename", lambda: "def.svg")
+
+    def test_gives_up(self):
+        Image(filename="abc.svg", owner=self.get_my_user(), displayname="a").save()
+        image = Image(filename="abc.svg", owner=self.get_my_user(), displayname="b")
+        with self.assertRaises(IntegrityError):
+            ids.save_with_unique_id(image, "filename", lambda: "abc.svg")
+
+    def test_reserve_ids(self):
+        Image(filename="taken.svg", owner=self.get_my_user(), displayname="a").save()
+        candidates = iter(["taken.svg", "a.svg", "a.svg", "b.svg", "c.svg", "d.svg"])
+        with self.assertNumQueries(2):
+            res = ids.reserve_ids(Image, "filename", lambda: next(candidates), 3)
+        self.assertEqual(sorted(res), ["a.svg", "b.svg", "c.svg"])
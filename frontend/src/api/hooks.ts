@@ -1,4 +1,5 @@
 import { useRequest } from "@umijs/hooks";
+import { useState } from "react";
 import { PDFDocumentProxy } from "pdfjs-dist/types/src/display/api";
 import {
   Answer,
@@ -121,24 +122,35 @@ export const useRefundPayment = (cb: () => void) => {
   });
   return [error, loading, run] as const;
 };
-const loadNotifications = async (mode: "all" | "unread") => {
-  if (mode === "all") {
-    return (await fetchGet("/api/notification/all/"))
-      .value as NotificationInfo[];
-  } else {
-    return (await fetchGet("/api/notification/unread/"))
-      .value as NotificationInfo[];
-  }
+interface NotificationPage {
+  notifications: NotificationInfo[];
+  next: string | null;
+}
+const loadNotifications = async (
+  mode: "all" | "unread",
+  before?: string,
+): Promise<NotificationPage> => {
+  const query =
+    before === undefined ? "" : `?before=${encodeURIComponent(before)}`;
+  const res = await fetchGet(`/api/notification/${mode}/${query}`);
+  return { notifications: res.value as NotificationInfo[], next: res.next };
 };
 export const useNotifications = (mode: "all" | "unread") => {
-  const { error, loading, data, run } = useRequest(
-    () => loadNotifications(mode),
+  const [pages, setPages] = useState<NotificationPage[]>([]);
+  const { error, loading, run } = useRequest(
+    (before?: string) => loadNotifications(mode, before),
     {
       refreshDeps: [mode],
-      cacheKey: `notifications-${mode}`,
+      onSuccess: (page, [before]) =>
+        setPages(prev => (before === undefined ? [page] : [...prev, page])),
     },
   );
-  return [error, loading, data, run] as const;
+  const next = pages.length > 0 ? pages[pages.length - 1].next : null;
+  const notifications =
+    pages.length > 0 ? pages.flatMap(page => page.notifications) : undefined;
+  // Loads the next, older page of notifications, undefined if there is none
+  const loadMore = next === null ? undefined : () => run(next);
+  return [error, loading, notifications, loadMore] as const;
 };
 const markAllRead = async (...ids: string[]) => {
   return Promise.all(
@@ -8,7 +8,7 @@ interface UserNotificationsProps {
 }
 const UserNotifications: React.FC<UserNotificationsProps> = ({ username }) => {
   const [showRead, setShowRead] = useState(false);
-  const [notificationsError, notificationsLoading, notifications] =
+  const [notificationsError, notificationsLoading, notifications, loadMore] =
     useNotifications(showRead ? "all" : "unread");
   const error = notificationsError;
   return (
@@ -31,6 +31,11 @@ const UserNotifications: React.FC<UserNotificationsProps> = ({ username }) => {
             key={notification.oid}
           />
         ))}
+      {loadMore && !notificationsLoading && (
+        <Button mt="sm" variant="default" onClick={loadMore}>
+          Load more
+        </Button>
+      )}
     </div>
   );
 };
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Measures how the S3 client of the backend scales with the number of concurrent
+requests, compared to a client with the default botocore configuration.
+
+Run it against the MinIO of docker-compose.yml with the same SIP_S3_FILES_* environment
+variables as the backend. Like the gunicorn workers, it uses gevent, so the concurrent
+requests share one process and one connection pool.
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import statistics  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+import uuid  # noqa: E402
+
+import boto3  # noqa: E402
+import gevent  # noqa: E402
+from botocore.client import Config  # noqa: E402
+
+# The settings use paths relative to the backend directory
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from util import s3_util  # noqa: E402
+
+
+def make_client(config):
+    endpoint = (
+        ("https://" if os.environ["SIP_S3_FILES_USE_SSL"] == "true" else "http://")
+        + os.environ["SIP_S3_FILES_HOST"]
+        + ":"
+        + os.environ["SIP_S3_FILES_PORT"]
+    )
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=os.environ["SIP_S3_FILES_ACCESS_KEY"],
+        aws_secret_access_key=os.environ["SIP_S3_FILES_SECRET_KEY"],
+        config=config,
+        region_name="vis-is-great-1",
+    )
+
+
+def run(client, bucket, key, operation, concurrency, requests):
+    durations = []
+
+    def worker(count):
+        for _ in range(count):
+            start = time.perf_counter()
+            if operation == "get":
+                client.get_object(Bucket=bucket, Key=key)["Body"].read()
+            else:
+                client.head_object(Bucket=bucket, Key=key)
+            durations.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    gevent.joinall(
+        [gevent.spawn(worker, requests // concurrency) for _ in range(concurrency)],
+        raise_error=True,
+    )
+    elapsed = time.perf_counter() - start
+    durations.sort()
+    return (
+        len(durations) / elapsed,
+        statistics.median(durations),
+        durations[int(len(durations) * 0.99) - 1],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the S3 client configuration")
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 10, 50, 100, 200]
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=256 * 1024, help="Object size")
+    parser.add_argument("--operation", choices=["get", "head"], default="get")
+    args = parser.parse_args()
+
+    bucket = os.environ["SIP_S3_FILES_BUCKET"]
+    key = "benchmark/" + uuid.uuid4().hex
+    clients = [
+        ("default", make_client(Config(signature_version="s3v4"))),
+        ("tuned", make_client(s3_util.get_client_config())),
+    ]
+    clients[0][1].put_object(Bucket=bucket, Key=key, Body=os.urandom(args.size))
+    try:
+        print("{:>8} {:>12} {:>10} {:>10} {:>10}".format(
+            "client", "concurrency", "req/s", "p50 ms", "p99 ms"))
+        for concurrency in args.concurrency:
+            for name, client in clients:
+                throughput, p50, p99 = run(
+                    client, bucket, key, args.operation, concurrency, args.requests
+                )
+                print("{:>8} {:>12} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                    name, concurrency, throughput, p50 * 1000, p99 * 1000))
+    finally:
+        clients[0][1].delete_object(Bucket=bucket, Key=key)
+
+
+if __name__ == "__main__":
+    main()
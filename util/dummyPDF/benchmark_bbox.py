@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Compares the streaming bbox parser of the backend (answers/bbox_parser.py) with the
+BeautifulSoup based parser it replaced.
+
+The corpus is built from exam structure files (like example.txt), which are turned into
+PDFs with dummyPDF.py, or from existing PDFs. The pages of all documents are repeated
+until the benchmark document has the requested number of pages.
+
+Requires pdflatex (for structure files), pdftotext and beautifulsoup4.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIR, "..", "..", "backend"))
+
+from answers import bbox_parser  # noqa: E402
+
+
+def build_pdf(source, build_dir):
+    if source.endswith(".pdf"):
+        return source
+    output = os.path.join(build_dir, os.path.basename(source) + ".pdf")
+    subprocess.run(
+        [
+            sys.executable,
+            os.path.join(DIR, "dummyPDF.py"),
+            os.path.abspath(source),
+            "--output-file",
+            output,
+            "--build-dir",
+            os.path.join(build_dir, "__build__"),
+        ],
+        cwd=DIR,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return output
+
+
+def bbox_layout(pdf, build_dir):
+    output = os.path.join(build_dir, os.path.basename(pdf) + ".html")
+    subprocess.run(["pdftotext", "-htmlmeta", "-bbox-layout", pdf, output], check=True)
+    with open(output) as f:
+        return f.read()
+
+
+def build_corpus(documents, pages):
+    """
+    Returns a bbox document with `pages` pages taken round robin from `documents`.
+    """
+    page_re = re.compile(r"<page .*?</page>", re.DOTALL)
+    all_pages = [page for document in documents for page in page_re.findall(document)]
+    if not all_pages:
+        raise ValueError("The corpus does not contain any pages")
+    head, tail = documents[0].split("<doc>", 1)[0], "</doc>\n</body>\n</html>\n"
+    body = "\n".join(all_pages[i % len(all_pages)] for i in range(pages))
+    return head + "<doc>\n" + body + "\n" + tail
+
+
+def parse_beautifulsoup(path):
+    from bs4 import BeautifulSoup
+
+    words = 0
+    with open(path) as f:
+        textdoc = BeautifulSoup(f, "html.parser")
+    for page in textdoc.find_all("page"):
+        w = float(page["width"])
+        h = float(page["height"])
+        for flow in page.find_all("flow"):
+            for block in flow.find_all("block"):
+                for line in block.find_all("line"):
+                    for word in line.find_all("word"):
+                        (word.string, float(word["xmin"]) / w, float(word["ymin"]) / h)
+                        words += 1
+    return words
+
+
+def parse_streaming(path):
+    words = 0
+    with open(path, "rb") as f:
+        for page in bbox_parser.iter_pages(f):
+            for content, x_min, y_min, x_max, y_max in page.words():
+                (content, x_min / page.width, y_min / page.height)
+                words += 1
+    return words
+
+
+def measure(parser, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    words = parser(path)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return words, duration, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pdftotext bbox parsers")
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        default=[os.path.join(DIR, "example.txt")],
+        help="Exam structure files or PDFs used as corpus",
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000],
+        help="Sizes of the benchmark documents in pages",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as build_dir:
+        documents = [
+            bbox_layout(build_pdf(source, build_dir), build_dir) for source in args.sources
+        ]
+        print("{:>6} {:>8} {:>14} {:>14} {:>14} {:>14}".format(
+            "pages", "words", "bs4 time", "bs4 peak", "stream time", "stream peak"))
+        for pages in args.pages:
+            path = os.path.join(build_dir, "corpus.html")
+            with open(path, "w") as f:
+                f.write(build_corpus(documents, pages))
+            words, bs4_time, bs4_peak = measure(parse_beautifulsoup, path)
+            stream_words, stream_time, stream_peak = measure(parse_streaming, path)
+            if words != stream_words:
+                print("Parsers disagree: {} != {} words".format(words, stream_words))
+            print("{:>6} {:>8} {:>13.3f}s {:>12.1f}MB {:>13.3f}s {:>12.1f}MB".format(
+                pages, words, bs4_time, bs4_peak / 2**20, stream_time, stream_peak / 2**20))
+
+
+if __name__ == "__main__":
+    main()
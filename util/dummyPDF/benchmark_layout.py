@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Compares the packed page layouts of the backend (answers/page_layout.py) with the
+ExamPageFlow / ExamWord tables they replaced, in storage size and load time.
+
+The corpus is built like in benchmark_bbox.py. Without --dsn only the encoded sizes and
+the encode / decode times are reported. With --dsn (a libpq connection string, requires
+psycopg2) both representations are written to temporary tables, and their sizes
+including indexes and the time to load all words of a page are measured on the server.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zlib
+from io import BytesIO
+
+from benchmark_bbox import DIR, bbox_layout, build_corpus, build_pdf
+
+from answers import bbox_parser, page_layout
+
+
+def relative_flows(page):
+    w = page.width
+    h = page.height
+    return [
+        [
+            (content, x_min / w, y_min / h, x_max / w, y_max / h)
+            for block in flow
+            for line in block
+            for content, x_min, y_min, x_max, y_max in line
+        ]
+        for flow in page.flows
+    ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    res = func(*args)
+    return res, time.perf_counter() - start
+
+
+def create_tables(cursor, pages, layouts):
+    cursor.execute(
+        """
+        CREATE TEMPORARY TABLE bench_page (id serial PRIMARY KEY, layout bytea NOT NULL);
+        CREATE TEMPORARY TABLE bench_flow (
+            id serial PRIMARY KEY, page_id integer NOT NULL, "order" integer NOT NULL
+        );
+        CREATE INDEX ON bench_flow (page_id);
+        CREATE TEMPORARY TABLE bench_word (
+            id serial PRIMARY KEY,
+            flow_id integer NOT NULL,
+            "order" integer NOT NULL,
+            content text NOT NULL,
+            x_min double precision NOT NULL,
+            y_min double precision NOT NULL,
+            x_max double precision NOT NULL,
+            y_max double precision NOT NULL
+        );
+        CREATE INDEX ON bench_word (flow_id);
+        """
+    )
+    for page_id, (flows, layout) in enumerate(zip(pages, layouts), start=1):
+        cursor.execute(
+            "INSERT INTO bench_page (id, layout) VALUES (%s, %s)", [page_id, layout]
+        )
+        for flow_order, flow in enumerate(flows):
+            cursor.execute(
+                'INSERT INTO bench_flow (page_id, "order") VALUES (%s, %s) RETURNING id',
+                [page_id, flow_order],
+            )
+            flow_id = cursor.fetchone()[0]
+            cursor.executemany(
+                'INSERT INTO bench_word (flow_id, "order", content, x_min, y_min, '
+                "x_max, y_max) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                [(flow_id, order) + tuple(word) for order, word in enumerate(flow)],
+            )
+    cursor.execute("ANALYZE bench_page, bench_flow, bench_word")
+
+
+def load_rows(cursor, page_count):
+    for page_id in range(1, page_count + 1):
+        cursor.execute(
+            """
+            SELECT f.id, w.content, w.x_min, w.y_min, w.x_max, w.y_max
+            FROM bench_flow f JOIN bench_word w ON (w.flow_id = f.id)
+            WHERE f.page_id = %s
+            ORDER BY f."order", w."order"
+            """,
+            [page_id],
+        )
+        cursor.fetchall()
+
+
+def load_layouts(cursor, page_count):
+    for page_id in range(1, page_count + 1):
+        cursor.execute("SELECT layout FROM bench_page WHERE id = %s", [page_id])
+        page_layout.decode(cursor.fetchone()[0])
+
+
+def benchmark_database(dsn, pages, layouts):
+    import psycopg2
+
+    connection = psycopg2.connect(dsn)
+    try:
+        with connection.cursor() as cursor:
+            create_tables(cursor, pages, layouts)
+            cursor.execute(
+                "SELECT pg_total_relation_size('bench_flow') "
+                "+ pg_total_relation_size('bench_word'), "
+                "pg_total_relation_size('bench_page')"
+            )
+            rows_size, layouts_size = cursor.fetchone()
+            _, rows_time = timed(load_rows, cursor, len(pages))
+            _, layouts_time = timed(load_layouts, cursor, len(pages))
+    finally:
+        connection.rollback()
+        connection.close()
+    print("Size of the tables (with indexes and TOAST):")
+    print("  flows and words: {:>10.1f} KB".format(rows_size / 1024))
+    print("  layouts:         {:>10.1f} KB".format(layouts_size / 1024))
+    print("Time to load the words of all pages, one query per page:")
+    print("  flows and words: {:>10.3f} s".format(rows_time))
+    print("  layouts:         {:>10.3f} s".format(layouts_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the packed page layouts")
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        default=[os.path.join(DIR, "example.txt")],
+        help="Exam structure files or PDFs used as corpus",
+    )
+    parser.add_argument(
+        "--pages", type=int, default=500, help="Size of the corpus in pages"
+    )
+    parser.add_argument("--dsn", help="Database to measure the table sizes in")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as build_dir:
+        documents = [
+            bbox_layout(build_pdf(source, build_dir), build_dir)
+            for source in args.sources
+        ]
+        corpus = build_corpus(documents, args.pages).encode("utf-8")
+    pages = [
+        relative_flows(page) for page in bbox_parser.iter_pages(BytesIO(corpus))
+    ]
+    words = sum(len(flow) for flows in pages for flow in flows)
+
+    layouts, encode_time = timed(lambda: [page_layout.encode(p) for p in pages])
+    decoded, decode_time = timed(lambda: [page_layout.decode(l) for l in layouts])
+    if len(decoded) != len(pages):
+        sys.exit("Decoded layouts differ from the corpus")
+    size = sum(map(len, layouts))
+    compressed = sum(len(zlib.compress(layout)) for layout in layouts)
+
+    print("{} pages, {} words".format(len(pages), words))
+    print("Encoded layouts: {:.1f} KB ({:.1f} KB compressed), {:.1f} bytes per word".format(
+        size / 1024, compressed / 1024, size / max(words, 1)))
+    print("Encode: {:.3f} s, decode: {:.3f} s".format(encode_time, decode_time))
+    if args.dsn:
+        benchmark_database(args.dsn, pages, layouts)
+
+
+if __name__ == "__main__":
+    main()